@@ -0,0 +1,130 @@
+"""
+Performance benchmarks for the NutriParse backend.
+
+Benchmarks run against a throwaway test database created from the configured
+DATABASES settings, so they never touch real data. Run them from the backend
+directory, e.g.:
+
+    python -m benchmarks.recipe_search --recipes 100000
+    python -m benchmarks.hot_paths --output baseline.json
+    python -m benchmarks.line_classifier --lines 2000
+    python -m benchmarks.parse_pool --workers 4
+    python -m benchmarks.async_load --concurrency 1 8 32
+    python -m benchmarks.db_connections --requests 500
+    python -m benchmarks.food_catalog --foods 100000
+    python -m benchmarks.nutrition_calculate --batches 1 100 1000 5000
+    python -m benchmarks.recipe_transfer --recipes 100000
+"""
+import os
+import statistics
+import time
+from contextlib import contextmanager
+
+
+def setup_django():
+    """Configure Django for a standalone benchmark script"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nutriparse_project.settings')
+    import django
+    django.setup()
+
+
+@contextmanager
+def benchmark_database(keepdb=False):
+    """Create a test database for the duration of a benchmark"""
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=keepdb)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+        teardown_test_environment()
+
+
+def percentile(samples, percent):
+    """Nearest-rank percentile of a sorted list of samples"""
+    if not samples:
+        return None
+    index = max(0, min(len(samples) - 1, round(percent / 100 * len(samples)) - 1))
+    return samples[index]
+
+
+def measure(func, repeat=20, warmup=2, setup=None):
+    """
+    Call func repeatedly and return its latency distribution in milliseconds.
+    setup, if given, runs untimed before every call.
+    """
+    for _ in range(warmup):
+        if setup:
+            setup()
+        func()
+
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+
+    samples.sort()
+    return {
+        'runs': repeat,
+        'min_ms': samples[0],
+        'p50_ms': percentile(samples, 50),
+        'p95_ms': percentile(samples, 95),
+        'max_ms': samples[-1],
+        'mean_ms': statistics.fmean(samples),
+    }
+
+
+def format_stats(name, stats):
+    """Format a measure() result as a single report line"""
+    return (
+        f"{name:<40} p50 {stats['p50_ms']:9.2f} ms   p95 {stats['p95_ms']:9.2f} ms   "
+        f"mean {stats['mean_ms']:9.2f} ms"
+    )
+
+
+def flatten_results(results, prefix=''):
+    """Yield (name, stats) for every measure() result in a nested results dict"""
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            if 'p50_ms' in value:
+                yield name, value
+            else:
+                yield from flatten_results(value, f"{name}/")
+
+
+def compare_results(baseline, current, threshold=10.0, metric='p50_ms'):
+    """
+    Compare two benchmark result dicts. Returns one row per benchmark present in
+    both, flagged as a regression when `metric` grew by more than threshold percent.
+    """
+    baseline = dict(flatten_results(baseline))
+    rows = []
+    for name, stats in flatten_results(current):
+        if name not in baseline:
+            continue
+        before, after = baseline[name][metric], stats[metric]
+        change = (after - before) / before * 100 if before else 0.0
+        rows.append({
+            'name': name,
+            'baseline_ms': before,
+            'current_ms': after,
+            'change_pct': change,
+            'regression': change > threshold,
+        })
+    return rows
+
+
+def format_comparison(row):
+    flag = 'REGRESSION' if row['regression'] else ''
+    return (
+        f"{row['name']:<50} {row['baseline_ms']:9.2f} ms -> {row['current_ms']:9.2f} ms "
+        f"{row['change_pct']:+7.1f}%  {flag}"
+    )
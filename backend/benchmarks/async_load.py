@@ -0,0 +1,100 @@
+"""
+Throughput and latency of the parse and nutrition search endpoints under
+concurrent requests: the sync DRF views behind a threaded WSGI server against
+their async variants (/api/async/...) behind uvicorn.
+
+    python -m benchmarks.async_load --concurrency 1 8 32 --requests 200
+
+Needs uvicorn (pip install uvicorn). The WSGI server handles requests with a
+fixed number of threads (--wsgi-threads), like a gthread worker; both servers
+and the load generator run in this process, against the benchmark database.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+
+from benchmarks import benchmark_database, setup_django
+from benchmarks.corpus import FOODS, create_nutrition_fixture, generate_recipe_texts
+from benchmarks.servers import load, start_asgi, start_wsgi
+
+ENDPOINTS = {
+    'search': {'wsgi': '/api/nutrition-data/search/', 'asgi': '/api/async/nutrition-data/search/'},
+    'parse': {'wsgi': '/api/recipes/parse/', 'asgi': '/api/async/recipes/parse/'},
+}
+
+
+def run(concurrency_levels, request_count, food_count, wsgi_threads, seed):
+    from django.contrib.auth.models import User
+    from rest_framework.authtoken.models import Token
+    from nutrition.cache import response_cache
+
+    create_nutrition_fixture(food_count, seed)
+    token = Token.objects.create(user=User.objects.create_user(username='benchmark', password='benchmark'))
+    headers = {'Authorization': f"Token {token.key}"}
+
+    rng = random.Random(seed)
+    bodies = {
+        'search': [{'query': f"{rng.choice(FOODS)} {rng.choice(FOODS)}"} for _ in range(request_count)],
+        'parse': [{'recipe_text': text} for text in generate_recipe_texts(request_count, seed)],
+    }
+
+    # The per-request parse timings would be logged for every request
+    logging.disable(logging.INFO)
+    servers = {'wsgi': start_wsgi(wsgi_threads), 'asgi': start_asgi()}
+    results = {}
+    try:
+        for endpoint, paths in ENDPOINTS.items():
+            for mode, (base_url, _) in servers.items():
+                for concurrency in concurrency_levels:
+                    # Every run starts from the same cold response cache
+                    response_cache.clear()
+                    results.setdefault(endpoint, {}).setdefault(mode, {})[concurrency] = load(
+                        base_url + paths[mode], bodies[endpoint], concurrency, headers
+                    )
+    finally:
+        for _, stop in servers.values():
+            stop()
+        logging.disable(logging.NOTSET)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32], help='Concurrent callers')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint and concurrency level')
+    parser.add_argument('--foods', type=int, default=2000, help='Foods in the nutrition table')
+    parser.add_argument('--wsgi-threads', type=int, default=4, help='Request threads of the WSGI server')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of the synthetic data')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    try:
+        import uvicorn  # noqa: F401
+    except ImportError:
+        parser.error("the ASGI server needs uvicorn: pip install uvicorn")
+
+    # As in nutriparse_project/asgi.py, which is imported after the settings here
+    os.environ.setdefault('DATABASE_CONN_MAX_AGE', '0')
+    setup_django()
+    with benchmark_database():
+        results = run(args.concurrency, args.requests, args.foods, args.wsgi_threads, args.seed)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{args.requests} requests per run, WSGI server with {args.wsgi_threads} threads")
+    print(f"{'endpoint':<10}{'server':<8}{'callers':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'errors':>8}")
+    for endpoint, modes in results.items():
+        for mode, levels in modes.items():
+            for concurrency, stats in levels.items():
+                print(
+                    f"{endpoint:<10}{mode:<8}{concurrency:>8}{stats['requests_per_second']:>10.1f}"
+                    f"{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['errors']:>8}"
+                )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,262 @@
+"""
+Seeded synthetic data for the benchmarks: recipe texts, ingredient lines and
+a USDA-sized nutrition dataset (SR Legacy has 7,793 foods in 25 groups).
+"""
+import csv
+import json
+import random
+
+USDA_FOOD_COUNT = 7793
+
+FOOD_GROUPS = [
+    'Dairy and Egg Products', 'Spices and Herbs', 'Baby Foods', 'Fats and Oils',
+    'Poultry Products', 'Soups, Sauces, and Gravies', 'Sausages and Luncheon Meats',
+    'Breakfast Cereals', 'Fruits and Fruit Juices', 'Pork Products',
+    'Vegetables and Vegetable Products', 'Nut and Seed Products', 'Beef Products',
+    'Beverages', 'Finfish and Shellfish Products', 'Legumes and Legume Products',
+    'Lamb, Veal, and Game Products', 'Baked Products', 'Sweets',
+    'Cereal Grains and Pasta', 'Fast Foods', 'Meals, Entrees, and Side Dishes',
+    'Snacks', 'American Indian/Alaska Native Foods', 'Restaurant Foods',
+]
+
+FOODS = [
+    'flour', 'sugar', 'butter', 'milk', 'egg', 'salt', 'olive oil', 'garlic',
+    'onion', 'tomato', 'chicken breast', 'ground beef', 'rice', 'pasta', 'potato',
+    'carrot', 'celery', 'spinach', 'broccoli', 'mushroom', 'bell pepper', 'lemon',
+    'lime', 'ginger', 'cinnamon', 'cumin', 'paprika', 'black pepper', 'basil',
+    'parsley', 'cilantro', 'oregano', 'thyme', 'honey', 'maple syrup', 'yogurt',
+    'cheddar cheese', 'parmesan', 'cream', 'vanilla extract', 'baking soda',
+    'baking powder', 'oats', 'almonds', 'walnuts', 'peanut butter', 'chickpeas',
+    'black beans', 'lentils', 'tofu', 'salmon', 'shrimp', 'bacon', 'apple',
+    'banana', 'coconut milk', 'soy sauce', 'vinegar', 'cornstarch', 'brown sugar',
+]
+
+QUALIFIERS = [
+    'raw', 'cooked', 'boiled', 'roasted', 'frozen', 'canned', 'dried', 'fresh',
+    'organic', 'unsalted', 'low fat', 'whole', 'enriched', 'unenriched', 'sweetened',
+]
+STATES = [
+    'without salt', 'with salt', 'drained solids', 'prepared', 'unprepared',
+    'commercial', 'home-prepared', 'fortified', 'regular', 'reduced sodium',
+]
+
+# Spellings of the parser's units as they show up in real recipes
+UNIT_SPELLINGS = {
+    'teaspoon': ['tsp', 'tsp.', 'teaspoon', 'teaspoons', 't', 'Tsp'],
+    'tablespoon': ['tbsp', 'Tbsp', 'tablespoon', 'tablespoons', 'tbs', 'T'],
+    'fluid ounce': ['fl oz', 'fluid ounce', 'fluid ounces'],
+    'cup': ['c', 'cup', 'cups', 'Cup', 'CUPS'],
+    'pint': ['pt', 'pint', 'pints'],
+    'quart': ['qt', 'quart', 'quarts'],
+    'milliliter': ['ml', 'mL', 'milliliter', 'milliliters'],
+    'liter': ['l', 'liter', 'liters'],
+    'pound': ['lb', 'lbs', 'pound', 'pounds'],
+    'ounce': ['oz', 'ounce', 'ounces'],
+    'gram': ['g', 'gram', 'grams'],
+    'kilogram': ['kg', 'kilogram', 'kilograms'],
+    'piece': ['piece', 'pieces'],
+    'slice': ['slice', 'slices'],
+    'pinch': ['pinch', 'pinches'],
+    'clove': ['clove', 'cloves'],
+}
+
+# Grams per unit for the nutrition fixture's conversions
+UNIT_GRAMS = {
+    'teaspoon': 5, 'tablespoon': 15, 'fluid ounce': 30, 'cup': 240, 'pint': 475,
+    'quart': 950, 'milliliter': 1, 'liter': 1000, 'pound': 453.6, 'ounce': 28.35,
+    'gram': 1, 'kilogram': 1000, 'piece': 50, 'slice': 25, 'pinch': 0.3, 'clove': 5,
+}
+UNIT_TYPES = {
+    'pound': 'weight', 'ounce': 'weight', 'gram': 'weight', 'kilogram': 'weight',
+    'piece': 'count', 'slice': 'count', 'pinch': 'count', 'clove': 'count',
+}
+
+QUANTITIES = ['1', '2', '3', '1/2', '1/4', '3/4', '1 1/2', '2 1/4', '0.5', '.25', '250', '']
+PREPARATIONS = ['chopped', 'diced', 'minced', 'sliced', 'grated', 'peeled', 'melted', 'softened']
+INGREDIENT_HEADERS = ['Ingredients:', 'INGREDIENTS', "You'll need:", 'What you need']
+INSTRUCTION_HEADERS = ['Instructions:', 'Directions:', 'METHOD', 'Steps:']
+STEPS = [
+    'Preheat the oven to 180C.', 'Mix the dry ingredients in a large bowl.',
+    'Whisk in the wet ingredients until smooth.', 'Simmer for 20 minutes, stirring occasionally.',
+    'Season to taste and serve warm.', 'Bake until golden, about 25 minutes.',
+    'Let rest for 10 minutes before slicing.',
+]
+
+
+def ingredient_line(rng):
+    """A single ingredient line with a varied quantity, unit spelling and preparation"""
+    parts = []
+    quantity = rng.choice(QUANTITIES)
+    if quantity:
+        parts.append(quantity)
+        if rng.random() < 0.85:
+            parts.append(rng.choice(rng.choice(list(UNIT_SPELLINGS.values()))))
+    parts.append(rng.choice(FOODS))
+    line = ' '.join(parts)
+    if rng.random() < 0.3:
+        line += f", {rng.choice(PREPARATIONS)}"
+    return line
+
+
+def generate_ingredient_lines(count, seed=42):
+    rng = random.Random(seed)
+    return [ingredient_line(rng) for _ in range(count)]
+
+
+def recipe_text(rng, with_headers=True, ingredient_count=None):
+    """A recipe text, with section headers or free-form (which takes the spaCy path)"""
+    ingredients = [ingredient_line(rng) for _ in range(ingredient_count or rng.randint(4, 14))]
+    steps = [f"{i}. {step}" for i, step in enumerate(rng.sample(STEPS, rng.randint(2, 5)), 1)]
+    if not with_headers:
+        return '\n'.join(ingredients + [''] + steps)
+    return '\n'.join(
+        [rng.choice(INGREDIENT_HEADERS)] + ingredients + ['', rng.choice(INSTRUCTION_HEADERS)] + steps
+    )
+
+
+# Non-ingredient lines with numbers, as found in header-less recipes
+META_LINES = [
+    'Serves {n}', 'Makes {n} muffins', 'Prep time: {n} minutes', 'Cook time: {n} minutes',
+    'Yield: {n} servings', 'Total time: 1 hour {n} minutes',
+]
+TITLES = ["Grandma's apple pie", 'Quick weeknight pasta', 'Spicy lentil soup', 'Lemon drizzle cake']
+UNQUANTIFIED_INGREDIENTS = ['Salt and pepper to taste', 'Fresh parsley, to garnish', 'Oil for frying']
+# Foods missing from the nutrition fixture, so only the model can recognise them
+UNKNOWN_FOODS = ['shallots', 'fennel bulbs', 'star anise', 'kaffir lime leaves', 'saffron threads', 'quinces']
+
+
+def labelled_line(rng):
+    """A (line, is_ingredient) pair as seen in a header-less recipe"""
+    kind = rng.random()
+    if kind < 0.5:
+        return ingredient_line(rng), True
+    if kind < 0.55:
+        return f"{rng.choice(QUANTITIES[:9])} {rng.choice(UNKNOWN_FOODS)}", True
+    if kind < 0.7:
+        return f"{rng.randint(1, 9)}. {rng.choice(STEPS)}", False
+    if kind < 0.8:
+        return rng.choice(STEPS), False
+    if kind < 0.9:
+        return rng.choice(META_LINES).format(n=rng.randint(2, 45)), False
+    if kind < 0.95:
+        return rng.choice(TITLES), False
+    return rng.choice(UNQUANTIFIED_INGREDIENTS), True
+
+
+def generate_labelled_lines(count, seed=42):
+    rng = random.Random(seed)
+    return [labelled_line(rng) for _ in range(count)]
+
+
+def generate_recipe_texts(count, seed=42, header_ratio=0.7):
+    """Recipe texts of which header_ratio have section headers"""
+    rng = random.Random(seed)
+    return [recipe_text(rng, with_headers=rng.random() < header_ratio) for _ in range(count)]
+
+
+def food_names(count, seed=42):
+    """
+    Unique USDA-style food names ("Onion, raw, without salt"); every base
+    food also appears on its own so exact matches are possible
+    """
+    rng = random.Random(seed)
+    names = list(FOODS[:count])
+    seen = set(names)
+    combinations = [
+        f"{food.capitalize()}, {qualifier}, {state}"
+        for food in FOODS for qualifier in QUALIFIERS for state in STATES
+    ]
+    rng.shuffle(combinations)
+    for name in combinations:
+        if len(names) >= count:
+            break
+        if name not in seen:
+            seen.add(name)
+            names.append(name)
+    # Beyond the combinations, number the names to reach the requested size
+    while len(names) < count:
+        names.append(f"{rng.choice(FOODS).capitalize()}, variety {len(names)}")
+    return names
+
+
+def food_row(rng, name):
+    """Per-100 g nutrient values for a synthetic food"""
+    protein, carbohydrates, fat = rng.uniform(0, 35), rng.uniform(0, 85), rng.uniform(0, 60)
+    return {
+        'name': name,
+        'food_group': rng.choice(FOOD_GROUPS),
+        'calories': round(protein * 4 + carbohydrates * 4 + fat * 9, 1),
+        'protein': round(protein, 2),
+        'carbohydrates': round(carbohydrates, 2),
+        'fat': round(fat, 2),
+        'fiber': round(rng.uniform(0, 15), 2),
+        'sugar': round(rng.uniform(0, carbohydrates), 2),
+        'sodium': round(rng.uniform(0, 1500), 1),
+        'calcium': round(rng.uniform(0, 500), 1),
+        'iron': round(rng.uniform(0, 10), 2),
+        'search_terms': name.split(',')[0].lower(),
+    }
+
+
+def create_measurement_units():
+    from nutrition.models import MeasurementUnit
+
+    return {
+        unit.name: unit for unit in MeasurementUnit.objects.bulk_create([
+            MeasurementUnit(
+                name=name,
+                abbreviation=UNIT_SPELLINGS[name][0],
+                type=UNIT_TYPES.get(name, 'volume')
+            )
+            for name in UNIT_GRAMS
+        ])
+    }
+
+
+def create_nutrition_fixture(count=USDA_FOOD_COUNT, seed=42, batch_size=2000):
+    """
+    Bulk-create food groups, measurement units, `count` foods and a few
+    conversions per food. Returns the created foods.
+    """
+    from nutrition.models import FoodGroup, NutritionData, FoodConversion
+    from nutrition.versioning import bump_dataset_version
+
+    rng = random.Random(seed)
+    groups = {group.name: group for group in FoodGroup.objects.bulk_create([
+        FoodGroup(name=name) for name in FOOD_GROUPS
+    ])}
+    units = create_measurement_units()
+
+    foods = []
+    for row in (food_row(rng, name) for name in food_names(count, seed)):
+        row['food_group'] = groups[row['food_group']]
+        foods.append(NutritionData(**row))
+    foods = NutritionData.objects.bulk_create(foods, batch_size=batch_size)
+
+    FoodConversion.objects.bulk_create([
+        FoodConversion(food=food, unit=units[unit_name], grams_per_unit=UNIT_GRAMS[unit_name] * rng.uniform(0.6, 1.4))
+        for food in foods
+        for unit_name in rng.sample(list(UNIT_GRAMS), 3)
+    ], batch_size=batch_size)
+    # bulk_create() sends no signals
+    bump_dataset_version()
+    return foods
+
+
+def write_nutrition_file(path, count, file_format='csv', seed=42):
+    """Write a file in the format read by the load_nutrition_data command"""
+    rng = random.Random(seed)
+    rows = []
+    for name in food_names(count, seed):
+        row = food_row(rng, name)
+        for unit_name in ('cup', 'tablespoon', 'teaspoon'):
+            row[f'{unit_name}_grams'] = round(UNIT_GRAMS[unit_name] * rng.uniform(0.6, 1.4), 2)
+        rows.append(row)
+
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        if file_format == 'json':
+            json.dump(rows, f)
+        else:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
@@ -0,0 +1,116 @@
+"""
+Requests per second of a database-bound endpoint (the recipe list) when every
+request opens a new connection, with persistent connections (CONN_MAX_AGE)
+and with psycopg's connection pool.
+
+    python -m benchmarks.db_connections --requests 500 --concurrency 8
+
+Run it against PostgreSQL. The pool needs psycopg 3 (pip install
+"psycopg[binary,pool]") and the ASGI server needs uvicorn; configurations
+missing either are skipped. Persistent connections are not measured under
+ASGI, where they are not reused.
+"""
+import argparse
+import json
+import logging
+import random
+
+from benchmarks import benchmark_database, setup_django
+from benchmarks.servers import load, start_asgi, start_wsgi
+
+CONFIGURATIONS = {
+    'new_connection': {'CONN_MAX_AGE': 0, 'OPTIONS': {}},
+    'persistent': {'CONN_MAX_AGE': 60, 'OPTIONS': {}},
+    'pool': {'CONN_MAX_AGE': 0, 'OPTIONS': {'pool': {'min_size': 2, 'max_size': 10, 'timeout': 10}}},
+}
+
+
+def available(configuration, server):
+    if server == 'asgi':
+        try:
+            import uvicorn  # noqa: F401
+        except ImportError:
+            return False
+        if configuration == 'persistent':
+            return False
+    if configuration == 'pool':
+        try:
+            import psycopg_pool  # noqa: F401
+        except ImportError:
+            return False
+    return True
+
+
+def run(request_count, concurrency, wsgi_threads, recipe_count, seed):
+    from django.contrib.auth.models import User
+    from django.db import connections
+    from rest_framework.authtoken.models import Token
+    from nutriparse_project.metrics import DB_CONNECTIONS
+    from recipes.models import Recipe
+
+    rng = random.Random(seed)
+    user = User.objects.create_user(username='benchmark', password='benchmark')
+    token = Token.objects.create(user=user)
+    Recipe.objects.bulk_create([
+        Recipe(title=f"Benchmark recipe {i}", user=user, instructions='Mix.', servings=rng.randint(1, 8))
+        for i in range(recipe_count)
+    ])
+    headers = {'Authorization': f"Token {token.key}"}
+    starters = {'wsgi': lambda: start_wsgi(wsgi_threads), 'asgi': start_asgi}
+
+    database = connections['default'].settings_dict
+    original = {key: database[key] for key in ('CONN_MAX_AGE', 'OPTIONS')}
+    logging.disable(logging.INFO)
+    results = {}
+    try:
+        for configuration, options in CONFIGURATIONS.items():
+            for server, start in starters.items():
+                if not available(configuration, server):
+                    continue
+                # Connections made from now on, in the server threads, use these options
+                database.update(options)
+                base_url, stop = start()
+                try:
+                    opened = DB_CONNECTIONS.value(alias='default')
+                    stats = load(f"{base_url}/api/recipes/", [None] * request_count, concurrency, headers)
+                    stats['connections'] = DB_CONNECTIONS.value(alias='default') - opened
+                finally:
+                    stop()
+                    connections['default'].close_pool()
+                results.setdefault(configuration, {})[server] = stats
+    finally:
+        database.update(original)
+        logging.disable(logging.NOTSET)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=500, help='Requests per configuration')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent callers')
+    parser.add_argument('--wsgi-threads', type=int, default=4, help='Request threads of the WSGI server')
+    parser.add_argument('--recipes', type=int, default=50, help='Recipes in the listed table')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of the synthetic data')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    setup_django()
+    with benchmark_database():
+        results = run(args.requests, args.concurrency, args.wsgi_threads, args.recipes, args.seed)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{args.requests} requests of /api/recipes/ by {args.concurrency} callers")
+    print(f"{'configuration':<16}{'server':<8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'connections':>13}{'errors':>8}")
+    for configuration, servers in results.items():
+        for server, stats in servers.items():
+            print(
+                f"{configuration:<16}{server:<8}{stats['requests_per_second']:>10.1f}{stats['p50_ms']:>10.2f}"
+                f"{stats['p95_ms']:>10.2f}{stats['connections']:>13.0f}{stats['errors']:>8}"
+            )
+
+
+if __name__ == '__main__':
+    main()
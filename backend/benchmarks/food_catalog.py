@@ -0,0 +1,122 @@
+"""
+Memory and latency of the in-process food catalog against NutritionData
+model instances: the memory held by every food of the table, the time to
+load it, and the matcher and search on each. The catalog is loaded from the
+database and from the memory-mapped nutrition snapshot.
+
+    python -m benchmarks.food_catalog --foods 100000
+
+Memory is measured with tracemalloc as the allocations still held once the
+foods are loaded; the mapped snapshot itself is shared page cache, not
+counted. Load times are measured again without tracing.
+"""
+import argparse
+import gc
+import itertools
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks import benchmark_database, format_stats, measure, setup_django
+from benchmarks.corpus import FOODS, create_nutrition_fixture
+
+
+def held_memory(load):
+    """(result, bytes still allocated) of calling load()"""
+    gc.collect()
+    tracemalloc.start()
+    result = load()
+    gc.collect()
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, held
+
+
+def timed(load):
+    start = time.perf_counter()
+    load()
+    return time.perf_counter() - start
+
+
+def run(food_count, repeat, seed):
+    from nutrition.catalog import FoodCatalog
+    from nutrition.models import NutritionData
+    from nutrition.snapshot import Snapshot, open_snapshot, write_snapshot
+    from nutrition.versioning import get_dataset_version
+
+    create_nutrition_fixture(food_count, seed)
+    rng = random.Random(seed)
+    names = [rng.choice(FOODS) for _ in range(repeat)]
+    version = get_dataset_version()
+
+    def load_instances():
+        return list(NutritionData.objects.select_related('food_group').order_by('pk'))
+
+    instances, instance_bytes = held_memory(load_instances)
+    count = len(instances)
+    del instances
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'nutrition.snapshot')
+        write_snapshot(path)
+        loads = {
+            'model_instances': load_instances,
+            'catalog_database': lambda: FoodCatalog.from_database(version),
+            # As a worker starts: check the snapshot is current, then map it
+            'catalog_snapshot': lambda: FoodCatalog.from_snapshot(version, open_snapshot(path, version)),
+        }
+        memory = {'model_instances': {'bytes': instance_bytes}}
+        for name in ('catalog_database', 'catalog_snapshot'):
+            memory[name] = {'bytes': held_memory(loads[name])[1]}
+        for name, load in loads.items():
+            memory[name]['bytes_per_food'] = memory[name]['bytes'] / count
+            memory[name]['load_seconds'] = min(timed(load) for _ in range(3))
+        snapshot_bytes = os.path.getsize(path)
+        catalog = FoodCatalog.from_snapshot(version, Snapshot(path))
+
+        terms = itertools.cycle(names)
+        latency = {
+            'exact_match': {
+                'orm': measure(lambda: NutritionData.objects.filter(name__iexact=next(terms)).first(), repeat),
+                'catalog': measure(lambda: catalog.exact_match(next(terms)), repeat),
+            },
+            'search': {
+                'orm': measure(lambda: list(NutritionData.objects.filter(name__icontains=next(terms))[:20]), repeat),
+                'catalog': measure(lambda: catalog.search([next(terms)], 20), repeat),
+            },
+        }
+    return {'foods': count, 'snapshot_bytes': snapshot_bytes, 'memory': memory, 'latency': latency}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--foods', type=int, default=100000, help='Foods in the nutrition table')
+    parser.add_argument('--repeat', type=int, default=50, help='Timed runs per lookup')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of the synthetic data')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    setup_django()
+    with benchmark_database():
+        results = run(args.foods, args.repeat, args.seed)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{results['foods']} foods, snapshot of {results['snapshot_bytes'] / 2 ** 20:.1f} MiB")
+    for name, memory in results['memory'].items():
+        print(
+            f"{name:<18}{memory['bytes'] / 2 ** 20:9.1f} MiB {memory['bytes_per_food']:8.0f} B/food"
+            f"   loaded in {memory['load_seconds']:.2f} s"
+        )
+    for lookup, modes in results['latency'].items():
+        for mode, stats in modes.items():
+            print(format_stats(f"{lookup}/{mode}", stats))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+"""
+Latency of the parser, matcher, nutrition calculation, nutrition loader and
+main API endpoints, on a seeded synthetic corpus and a USDA-sized dataset.
+
+    python -m benchmarks.hot_paths --output baseline.json
+    python -m benchmarks.hot_paths --compare baseline.json --threshold 10
+
+With --compare the exit status is 1 when any p50 regressed by more than the
+threshold (in percent). Two saved runs can also be compared without running:
+
+    python -m benchmarks.hot_paths --compare baseline.json --current current.json
+"""
+import argparse
+import io
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+from benchmarks import (
+    benchmark_database, compare_results, format_comparison, format_stats, measure, setup_django
+)
+from benchmarks.corpus import (
+    USDA_FOOD_COUNT, create_nutrition_fixture, generate_ingredient_lines, generate_recipe_texts,
+    write_nutrition_file
+)
+
+
+def create_recipes(user, foods, count, rng, ingredients_per_recipe=10):
+    """Bulk-create recipes whose ingredients have units with conversions"""
+    from nutrition.models import FoodConversion
+    from recipes.models import Recipe, RecipeIngredient
+
+    conversions = list(
+        FoodConversion.objects.filter(food__in=foods[:500]).select_related('food', 'unit')
+    )
+    recipes = Recipe.objects.bulk_create([
+        Recipe(title=f"Benchmark recipe {i}", user=user, instructions='Mix and bake.', servings=rng.randint(1, 8))
+        for i in range(count)
+    ])
+    RecipeIngredient.objects.bulk_create([
+        RecipeIngredient(
+            recipe=recipe,
+            food=conversion.food,
+            unit=conversion.unit,
+            quantity=rng.uniform(0.25, 4),
+            original_text=conversion.food.name,
+            is_parsed=True
+        )
+        for recipe in recipes
+        for conversion in rng.sample(conversions, ingredients_per_recipe)
+    ])
+    for recipe in recipes:
+        recipe.calculate_nutrition()
+    return recipes
+
+
+def run(food_count, loader_count, repeat, seed):
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.db import connection
+    from rest_framework.test import APIClient
+    from nutrition.cache import response_cache
+    from nutrition.models import NutritionData
+    from recipes.parser import (
+        identify_ingredient_section, match_ingredients_to_foods, parse_ingredient_line, parse_recipe_text
+    )
+
+    # Keep per-request logging out of the timings and the report
+    logging.disable(logging.INFO)
+
+    rng = random.Random(seed)
+    foods = create_nutrition_fixture(food_count, seed)
+    user = User.objects.create_user(username='benchmark', password='benchmark')
+    recipes = create_recipes(user, foods, 200, rng)
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    lines = generate_ingredient_lines(500, seed)
+    with_headers = generate_recipe_texts(100, seed, header_ratio=1)
+    without_headers = generate_recipe_texts(20, seed, header_ratio=0)
+    parsed = itertools.cycle([parse_recipe_text(text)['ingredients'] for text in with_headers])
+    texts = itertools.cycle(with_headers)
+    free_texts = itertools.cycle(without_headers)
+    recipe_cycle = itertools.cycle(recipes)
+
+    client = APIClient()
+    client.force_authenticate(user=user)
+    food_ids = itertools.cycle(food.pk for food in foods[:200])
+    queries = itertools.cycle(['chicken breast', 'olive oil raw', 'flour', 'cheddar', 'lentils cooked'])
+
+    def request(method, url, data=None):
+        if method == 'post':
+            response = client.post(url, data, format='json')
+        else:
+            response = client.get(url, data)
+        assert response.status_code == 200, (url, response.status_code)
+
+    results = {'parser': {}, 'nutrition': {}, 'endpoints': {}}
+    results['parser']['parse_ingredient_line x500'] = measure(
+        lambda: [parse_ingredient_line(line) for line in lines], repeat
+    )
+    results['parser']['identify_ingredient_section (headers)'] = measure(
+        lambda: identify_ingredient_section(next(texts)), repeat
+    )
+    results['parser']['identify_ingredient_section (no headers)'] = measure(
+        lambda: identify_ingredient_section(next(free_texts)), repeat
+    )
+    results['parser']['match_ingredients_to_foods'] = measure(
+        lambda: match_ingredients_to_foods(next(parsed)), repeat
+    )
+    results['nutrition']['calculate_nutrition'] = measure(
+        lambda: next(recipe_cycle).calculate_nutrition(), repeat
+    )
+
+    endpoints = results['endpoints']
+    endpoints['POST /api/recipes/parse/'] = measure(
+        lambda: request('post', '/api/recipes/parse/', {'recipe_text': next(texts)}), repeat
+    )
+    endpoints['GET /api/recipes/'] = measure(lambda: request('get', '/api/recipes/'), repeat)
+    endpoints['GET /api/recipes/<id>/'] = measure(
+        lambda: request('get', f'/api/recipes/{next(recipe_cycle).pk}/'), repeat
+    )
+    endpoints['GET /api/nutrition-data/?search= (cold)'] = measure(
+        lambda: request('get', '/api/nutrition-data/', {'search': next(queries)}), repeat,
+        setup=response_cache.clear
+    )
+    endpoints['GET /api/nutrition-data/<id>/ (cold)'] = measure(
+        lambda: request('get', f'/api/nutrition-data/{next(food_ids)}/'), repeat,
+        setup=response_cache.clear
+    )
+    endpoints['POST /api/nutrition-data/search/ (cold)'] = measure(
+        lambda: request('post', '/api/nutrition-data/search/', {'query': next(queries)}), repeat,
+        setup=response_cache.clear
+    )
+    endpoints['POST /api/nutrition-data/search/ (cached)'] = measure(
+        lambda: request('post', '/api/nutrition-data/search/', {'query': 'flour'}), repeat
+    )
+
+    # The loader runs last: every run starts from an empty food table
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'foods.csv')
+        write_nutrition_file(path, loader_count, seed=seed)
+        loader_repeat = max(1, repeat // 10)
+        stats = measure(
+            lambda: call_command('load_nutrition_data', path, stdout=io.StringIO(), stderr=io.StringIO()),
+            loader_repeat, warmup=0, setup=lambda: NutritionData.objects.all().delete()
+        )
+        stats['rows_per_second'] = loader_count / (stats['p50_ms'] / 1000)
+        results['nutrition'][f'load_nutrition_data x{loader_count}'] = stats
+
+    logging.disable(logging.NOTSET)
+    return results
+
+
+def metadata(args):
+    import django
+    from django.db import connection
+
+    return {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'foods': args.foods,
+        'loader_foods': args.loader_foods,
+        'repeat': args.repeat,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--foods', type=int, default=USDA_FOOD_COUNT, help='Number of synthetic foods')
+    parser.add_argument('--loader-foods', type=int, default=1000, help='Foods in the file loaded by the loader benchmark')
+    parser.add_argument('--repeat', type=int, default=30, help='Timed runs per benchmark')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of the synthetic data')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    parser.add_argument('--compare', metavar='BASELINE', help='Compare against a saved JSON result')
+    parser.add_argument('--current', help='With --compare, a saved result to compare instead of running')
+    parser.add_argument('--threshold', type=float, default=10.0, help='Regression threshold in percent of p50')
+    args = parser.parse_args()
+
+    if args.current:
+        with open(args.current) as f:
+            report = json.load(f)
+    else:
+        setup_django()
+        with benchmark_database():
+            report = {'meta': metadata(args), 'results': run(args.foods, args.loader_foods, args.repeat, args.seed)}
+
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            for group, benchmarks in report['results'].items():
+                print(f"[{group}]")
+                for name, stats in benchmarks.items():
+                    print(format_stats(name, stats))
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows = compare_results(baseline['results'], report['results'], args.threshold)
+        print(f"\nCompared with {args.compare} (threshold {args.threshold:g}% of p50)")
+        for row in rows:
+            print(format_comparison(row))
+        if any(row['regression'] for row in rows):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Accuracy and speed of the rules that classify header-less recipe lines,
+against classifying every line with spaCy, on a seeded labelled corpus.
+
+    python -m benchmarks.line_classifier --lines 2000
+"""
+import argparse
+import json
+import time
+
+from benchmarks import benchmark_database, setup_django
+from benchmarks.corpus import USDA_FOOD_COUNT, create_nutrition_fixture, generate_labelled_lines
+
+
+def evaluate(classify, corpus):
+    """Accuracy, precision, recall and time per line of a line classifier"""
+    from recipes.timing import SPACY_INVOCATIONS
+
+    spacy_before = SPACY_INVOCATIONS.value()
+    start = time.perf_counter()
+    predictions = [classify(line) for line, _ in corpus]
+    elapsed = time.perf_counter() - start
+
+    pairs = list(zip(predictions, (label for _, label in corpus)))
+    true_positives = sum(1 for predicted, label in pairs if predicted and label)
+    predicted_positives = sum(1 for predicted, _ in pairs if predicted)
+    positives = sum(1 for _, label in pairs if label)
+    return {
+        'accuracy': sum(1 for predicted, label in pairs if predicted == label) / len(pairs),
+        'precision': true_positives / predicted_positives if predicted_positives else None,
+        'recall': true_positives / positives if positives else None,
+        'ms_per_line': elapsed * 1000 / len(corpus),
+        'spacy_calls': SPACY_INVOCATIONS.value() - spacy_before,
+        'predictions': predictions,
+    }
+
+
+def run(line_count, food_count, seed):
+    from recipes.parser import classify_line, food_vocabulary, is_ingredient_line, model_classify_line
+
+    create_nutrition_fixture(food_count, seed)
+    corpus = generate_labelled_lines(line_count, seed)
+    vocabulary = food_vocabulary()
+
+    # Warm up the model so its first call is not part of the timings
+    model_classify_line('1 cup sugar')
+
+    decisions = [classify_line(line, vocabulary) for line, _ in corpus]
+    decided = [(decision, label) for decision, (_, label) in zip(decisions, corpus) if decision is not None]
+    model = evaluate(model_classify_line, corpus)
+    rules = evaluate(lambda line: is_ingredient_line(line, vocabulary), corpus)
+    agreement = sum(
+        1 for a, b in zip(model.pop('predictions'), rules.pop('predictions')) if a == b
+    ) / len(corpus)
+
+    return {
+        'lines': line_count,
+        'foods': food_count,
+        'vocabulary_words': len(vocabulary),
+        'decided_by_rules': len(decided) / len(corpus),
+        'rules_accuracy_on_decided': sum(1 for decision, label in decided if decision == label) / len(decided) if decided else None,
+        'agreement_with_model': agreement,
+        'model': model,
+        'rules_with_model_fallback': rules,
+    }
+
+
+def format_rate(value):
+    return 'n/a' if value is None else f"{value * 100:6.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lines', type=int, default=2000, help='Number of labelled lines')
+    parser.add_argument('--foods', type=int, default=USDA_FOOD_COUNT, help='Foods in the vocabulary source table')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of the synthetic data')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    setup_django()
+    with benchmark_database():
+        report = run(args.lines, args.foods, args.seed)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{report['lines']} lines, {report['vocabulary_words']} food words from {report['foods']} foods")
+    print(f"Decided by rules:           {format_rate(report['decided_by_rules'])}")
+    print(f"Rules accuracy (decided):   {format_rate(report['rules_accuracy_on_decided'])}")
+    print(f"Agreement with spaCy only:  {format_rate(report['agreement_with_model'])}")
+    print(f"\n{'':<28}{'accuracy':>9}{'precision':>11}{'recall':>9}{'ms/line':>10}{'spaCy calls':>13}")
+    for name in ('model', 'rules_with_model_fallback'):
+        stats = report[name]
+        print(
+            f"{name:<28}{format_rate(stats['accuracy']):>9}{format_rate(stats['precision']):>11}"
+            f"{format_rate(stats['recall']):>9}{stats['ms_per_line']:>10.3f}{stats['spacy_calls']:>13}"
+        )
+
+
+if __name__ == '__main__':
+    main()
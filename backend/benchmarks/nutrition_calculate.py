@@ -0,0 +1,83 @@
+"""
+Throughput of the stateless nutrition/calculate endpoint on batches of
+ingredient lists, against recalculating saved recipes one by one with
+Recipe.calculate_nutrition (what clients had to do before).
+
+    python -m benchmarks.nutrition_calculate --batches 1 100 1000 5000
+"""
+import argparse
+import json
+import random
+
+from benchmarks import benchmark_database, format_stats, measure, setup_django
+from benchmarks.corpus import create_nutrition_fixture
+
+
+def run(food_count, batches, ingredients, saved, repeat, seed):
+    from django.contrib.auth.models import User
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+    from nutrition.catalog import get_food_catalog
+    from nutrition.models import FoodConversion
+    from recipes.models import Recipe, RecipeIngredient
+
+    create_nutrition_fixture(food_count, seed)
+    rng = random.Random(seed)
+    conversions = list(FoodConversion.objects.values_list('food_id', 'unit_id')[:2000])
+
+    def ingredient_list():
+        return {
+            'ingredients': [[food_id, rng.uniform(0.25, 4), unit_id] for food_id, unit_id in rng.sample(conversions, ingredients)],
+            'servings': rng.randint(1, 8),
+        }
+
+    client = APIClient()
+    url = reverse('nutritiondata-calculate')
+    catalog = get_food_catalog()
+    catalog.converter
+    results = {}
+    for size in batches:
+        data = {'recipes': [ingredient_list() for _ in range(size)]}
+        results[size] = {
+            'endpoint': measure(lambda: client.post(url, data, format='json'), repeat),
+            'catalog': measure(lambda: [catalog.nutrient_totals(r['ingredients']) for r in data['recipes']], repeat),
+        }
+
+    # Lists saved as recipes and recalculated in turn
+    user = User.objects.create_user(username='benchmark')
+    recipes = Recipe.objects.bulk_create([Recipe(title=f"Recipe {i}", user=user, servings=2) for i in range(saved)])
+    RecipeIngredient.objects.bulk_create([
+        RecipeIngredient(recipe=recipe, food_id=food_id, unit_id=unit_id, quantity=quantity, original_text='')
+        for recipe in recipes
+        for food_id, quantity, unit_id in ingredient_list()['ingredients']
+    ])
+    results.setdefault(saved, {})['calculate_nutrition'] = measure(lambda: [recipe.calculate_nutrition() for recipe in recipes], repeat)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--foods', type=int, default=10000, help='Foods in the nutrition table')
+    parser.add_argument('--batches', type=int, nargs='+', default=[1, 100, 1000, 5000], help='Ingredient lists per request')
+    parser.add_argument('--ingredients', type=int, default=10, help='Ingredients per list')
+    parser.add_argument('--saved', type=int, default=100, help='Saved recipes recalculated for comparison')
+    parser.add_argument('--repeat', type=int, default=10, help='Timed runs per batch size')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of the synthetic data')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    setup_django()
+    with benchmark_database():
+        results = run(args.foods, args.batches, args.ingredients, args.saved, args.repeat, args.seed)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for size, modes in results.items():
+        for mode, stats in modes.items():
+            print(format_stats(f"{size} lists/{mode}", stats))
+
+
+if __name__ == '__main__':
+    main()
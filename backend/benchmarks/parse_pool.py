@@ -0,0 +1,78 @@
+"""
+Recipe parse throughput with the parser process pool at 1 to N workers,
+against parsing in threads of a single process (bound by the GIL).
+
+    python -m benchmarks.parse_pool --workers 4 --texts 400
+
+Needs no database: the food vocabulary is built from the synthetic corpus.
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import setup_django
+from benchmarks.corpus import FOODS, generate_recipe_texts
+
+
+def throughput(parse, texts, threads):
+    """Recipes per second when `threads` callers parse the texts concurrently"""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(parse, texts))
+    return len(texts) / (time.perf_counter() - start)
+
+
+def run(max_workers, text_count, seed):
+    from recipes.parser import WORD, parse_recipe_text_in_process, singular
+    from recipes.workers import ParsePool
+
+    # Mostly header-less texts, which take the spaCy path
+    texts = generate_recipe_texts(text_count, seed, header_ratio=0.3)
+    vocabulary = frozenset(singular(word) for food in FOODS for word in WORD.findall(food))
+
+    results = {'in_process_threads': {}, 'pool_workers': {}}
+    for count in range(1, max_workers + 1):
+        results['in_process_threads'][count] = throughput(
+            lambda text: parse_recipe_text_in_process(text, vocabulary), texts, count
+        )
+
+        pool = ParsePool(workers=count, queue_size=text_count, timeout=600)
+        pool.start()
+        try:
+            # Twice the callers as workers keeps every worker busy; the vocabulary
+            # is sent with a version, so workers receive its words only once
+            results['pool_workers'][count] = throughput(
+                lambda text: pool.parse(text, vocabulary, 1), texts, count * 2
+            )
+        finally:
+            pool.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Largest number of workers to measure')
+    parser.add_argument('--texts', type=int, default=400, help='Recipe texts parsed per measurement')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of the synthetic data')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    setup_django()
+    results = run(args.workers, args.texts, args.seed)
+
+    if args.json:
+        print(json.dumps({'cpu_count': os.cpu_count(), **results}, indent=2))
+        return
+
+    print(f"{args.texts} recipes, {os.cpu_count()} CPUs (recipes per second)")
+    print(f"{'workers':>8}{'threads':>12}{'pool':>12}{'pool speedup':>14}")
+    single = results['pool_workers'][1]
+    for count in range(1, args.workers + 1):
+        threads, pool = results['in_process_threads'][count], results['pool_workers'][count]
+        print(f"{count:>8}{threads:>12.1f}{pool:>12.1f}{pool / single:>13.2f}x")
+
+
+if __name__ == '__main__':
+    main()
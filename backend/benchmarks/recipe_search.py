@@ -0,0 +1,130 @@
+"""
+Recipe search latency: full-text search document vs the former SearchFilter
+(`icontains` over title, description and a join on ingredient food names).
+
+    python -m benchmarks.recipe_search --recipes 100000
+"""
+import argparse
+import json
+import random
+
+from benchmarks import benchmark_database, format_stats, measure, setup_django
+
+WORDS = [
+    'tomato', 'basil', 'garlic', 'onion', 'chicken', 'beef', 'lentil', 'rice',
+    'pasta', 'lemon', 'ginger', 'coconut', 'spinach', 'mushroom', 'potato',
+    'carrot', 'pepper', 'cheese', 'yogurt', 'honey', 'almond', 'oat', 'bean',
+    'salmon', 'tofu', 'chili', 'cumin', 'pumpkin', 'apple', 'cinnamon',
+]
+DISHES = ['soup', 'salad', 'stew', 'curry', 'bake', 'stir fry', 'pie', 'bowl', 'tart', 'risotto']
+QUERIES = ['tomato', 'garlic soup', 'coconut curry', 'cinnamon', 'salmon rice bowl', 'nonexistentword']
+
+
+def create_dataset(recipe_count, ingredients_per_recipe=8, batch_size=5000, seed=42):
+    """Bulk-create a synthetic recipe corpus with matched ingredients"""
+    from django.contrib.auth.models import User
+    from nutrition.models import FoodGroup, NutritionData
+    from recipes.models import Recipe, RecipeIngredient
+    from nutrition.versioning import bump_dataset_version
+    from recipes.search import update_search_documents
+
+    rng = random.Random(seed)
+    user = User.objects.create_user(username='benchmark')
+    group = FoodGroup.objects.create(name='Benchmark')
+    foods = NutritionData.objects.bulk_create([
+        NutritionData(
+            name=f"{word} {variant}".strip(),
+            food_group=group,
+            calories=rng.uniform(10, 600),
+            protein=rng.uniform(0, 30),
+            carbohydrates=rng.uniform(0, 80),
+            fat=rng.uniform(0, 40)
+        )
+        for word in WORDS for variant in ('', 'raw', 'cooked')
+    ])
+    # bulk_create() sends no signals
+    bump_dataset_version()
+
+    for start in range(0, recipe_count, batch_size):
+        recipes = Recipe.objects.bulk_create([
+            Recipe(
+                title=f"{rng.choice(WORDS).title()} {rng.choice(WORDS)} {rng.choice(DISHES)}",
+                user=user,
+                description=' '.join(rng.choices(WORDS, k=12)),
+                instructions=' '.join(rng.choices(WORDS + DISHES, k=40)),
+                servings=rng.randint(1, 8)
+            )
+            for _ in range(min(batch_size, recipe_count - start))
+        ])
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(
+                recipe=recipe,
+                food=food,
+                quantity=rng.uniform(0.25, 4),
+                original_text=food.name,
+                is_parsed=True
+            )
+            for recipe in recipes
+            for food in rng.sample(foods, ingredients_per_recipe)
+        ])
+        update_search_documents([recipe.pk for recipe in recipes])
+
+
+def run(recipe_count, repeat):
+    from django.db import connection
+    from django.db.models import Q
+    from recipes.models import Recipe
+    from recipes.search import full_text_search_available, search_recipes
+
+    create_dataset(recipe_count)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("ANALYZE")
+
+    def legacy_search(query):
+        # Equivalent of DRF SearchFilter over title, description and ingredients__food__name
+        queryset = Recipe.objects.all()
+        for term in query.split():
+            queryset = queryset.filter(
+                Q(title__icontains=term) | Q(description__icontains=term)
+                | Q(ingredients__food__name__icontains=term)
+            )
+        return queryset.distinct()
+
+    def page(queryset):
+        # What the paginated list endpoint evaluates: a count and the first page
+        queryset.count()
+        list(queryset[:20])
+
+    results = {'recipes': recipe_count, 'full_text': full_text_search_available(), 'queries': {}}
+    for query in QUERIES:
+        results['queries'][query] = {
+            'search_document': measure(lambda: page(search_recipes(Recipe.objects.all(), query)), repeat),
+            'icontains_join': measure(lambda: page(legacy_search(query)), repeat),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--recipes', type=int, default=100000, help='Number of synthetic recipes')
+    parser.add_argument('--repeat', type=int, default=20, help='Timed runs per query')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    setup_django()
+    with benchmark_database():
+        results = run(args.recipes, args.repeat)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"Recipe search at {results['recipes']} recipes (full-text: {results['full_text']})")
+    for query, variants in results['queries'].items():
+        for variant, stats in variants.items():
+            print(format_stats(f"{query!r} [{variant}]", stats))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Throughput and memory of the NDJSON recipe export and import: recipes with
+their ingredients and tags are exported to a gzip-compressed file through
+the server-side cursor, deleted, and imported again in batches.
+
+    python -m benchmarks.recipe_transfer --recipes 100000
+
+Peak memory is measured with tracemalloc in a second, traced run; it should
+stay flat as --recipes grows, bounded by the batch size.
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks import benchmark_database, setup_django
+from benchmarks.corpus import create_nutrition_fixture
+
+
+def create_recipes(count, ingredients_per_recipe, rng, batch_size=2000):
+    """Bulk-create recipes with matched ingredients and a few tags"""
+    from django.contrib.auth.models import User
+    from nutrition.models import FoodConversion
+    from recipes.models import Recipe, RecipeIngredient, RecipeTag, Tag
+
+    user = User.objects.create_user(username='benchmark')
+    conversions = list(FoodConversion.objects.values_list('food_id', 'unit_id')[:2000])
+    tags = Tag.objects.bulk_create([Tag(name=f"tag {i}") for i in range(50)])
+    for start in range(0, count, batch_size):
+        recipes = Recipe.objects.bulk_create([
+            Recipe(title=f"Recipe {i}", user=user, instructions='Mix and bake.', servings=rng.randint(1, 8))
+            for i in range(start, min(count, start + batch_size))
+        ])
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(
+                recipe=recipe, food_id=food_id, unit_id=unit_id, quantity=rng.uniform(0.25, 4),
+                original_text=f"ingredient {food_id}", is_parsed=True
+            )
+            for recipe in recipes
+            for food_id, unit_id in rng.sample(conversions, ingredients_per_recipe)
+        ])
+        RecipeTag.objects.bulk_create([
+            RecipeTag(recipe=recipe, tag=tag) for recipe in recipes for tag in rng.sample(tags, 3)
+        ])
+
+
+def timed(func):
+    """(result, seconds) of calling func()"""
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def peak_memory(func):
+    """Peak bytes allocated while calling func()"""
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def run(recipe_count, ingredients, batch_size, seed):
+    from django.conf import settings
+    from recipes.models import Recipe
+    from recipes.transfer import export_lines, import_recipes
+
+    settings.NUTRITION_RECOMPUTE_DELAY = None
+    # With DEBUG the connection keeps the SQL of its last 9000 queries, which would count as held memory
+    settings.DEBUG = False
+    create_nutrition_fixture(5000, seed)
+    create_recipes(recipe_count, ingredients, random.Random(seed))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'recipes.ndjson.gz')
+
+        def export():
+            with gzip.open(path, 'wt', encoding='utf-8') as f:
+                f.writelines(export_lines(Recipe.objects.all(), batch_size))
+
+        _, export_seconds = timed(export)
+        export_peak = peak_memory(export)
+        size = os.path.getsize(path)
+
+        def load():
+            with gzip.open(path, 'rb') as f:
+                return import_recipes(f, batch_size=batch_size)
+
+        Recipe.objects.all().delete()
+        result, import_seconds = timed(load)
+        Recipe.objects.all().delete()
+        import_peak = peak_memory(load)
+    return {
+        'recipes': recipe_count,
+        'ingredients': result['ingredients'],
+        'file_bytes': size,
+        'export': {'seconds': export_seconds, 'recipes_per_second': recipe_count / export_seconds, 'peak_bytes': export_peak},
+        'import': {'seconds': import_seconds, 'recipes_per_second': result['recipes'] / import_seconds, 'peak_bytes': import_peak},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--recipes', type=int, default=20000, help='Recipes to export and import')
+    parser.add_argument('--ingredients', type=int, default=10, help='Ingredients per recipe')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Recipes per chunk and batch')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of the synthetic data')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    setup_django()
+    with benchmark_database():
+        results = run(args.recipes, args.ingredients, args.batch_size, args.seed)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{results['recipes']} recipes, {results['ingredients']} ingredients, "
+          f"{results['file_bytes'] / 2 ** 20:.1f} MiB compressed")
+    for name in ('export', 'import'):
+        stats = results[name]
+        print(f"{name:<8}{stats['seconds']:8.2f} s {stats['recipes_per_second']:10.0f} recipes/s"
+              f"   peak {stats['peak_bytes'] / 2 ** 20:.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
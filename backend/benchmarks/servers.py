@@ -0,0 +1,130 @@
+"""
+Local HTTP servers and a load generator for the benchmarks that measure
+whole requests, including connection handling.
+"""
+import json
+import queue
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from benchmarks import percentile
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class PooledWSGIServer(WSGIServer):
+    """A WSGI server handling requests in a fixed pool of threads"""
+    request_queue_size = 256
+    threads = 4
+
+    def server_activate(self):
+        super().server_activate()
+        self.requests = queue.Queue()
+        self.workers = [threading.Thread(target=self.work, daemon=True) for _ in range(self.threads)]
+        for worker in self.workers:
+            worker.start()
+
+    def process_request(self, request, client_address):
+        self.requests.put((request, client_address))
+
+    def work(self):
+        from django.db import connections
+
+        while (item := self.requests.get()) is not None:
+            request, client_address = item
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+        # Persistent connections belong to this thread; close them so the
+        # benchmark database can be dropped
+        connections.close_all()
+
+    def stop(self):
+        self.shutdown()
+        for _ in self.workers:
+            self.requests.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.server_close()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_wsgi(threads):
+    from nutriparse_project.wsgi import application
+
+    server_class = type('Server', (PooledWSGIServer,), {'threads': threads})
+    server = make_server('127.0.0.1', free_port(), application, server_class=server_class, handler_class=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server.stop
+
+
+def start_asgi():
+    """
+    Serve the ASGI application with uvicorn. Persistent connections are not
+    reused under ASGI; set CONN_MAX_AGE to 0 or they are left open.
+    """
+    import uvicorn
+    from nutriparse_project.asgi import application
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(
+        application, host='127.0.0.1', port=port, log_level='warning', lifespan='off', backlog=256
+    ))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+
+    def stop():
+        server.should_exit = True
+    return f"http://127.0.0.1:{port}", stop
+
+
+def load(url, bodies, concurrency, headers):
+    """
+    Send a request per body (JSON posts, or GETs for None bodies) with
+    `concurrency` callers; returns requests per second and latencies
+    """
+    def send(body):
+        if body is None:
+            request = urllib.request.Request(url, headers=headers)
+        else:
+            request = urllib.request.Request(
+                url, data=json.dumps(body).encode(), headers={'Content-Type': 'application/json', **headers}
+            )
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=120) as response:
+                response.read()
+                ok = response.status == 200
+        except urllib.error.URLError:
+            ok = False
+        return (time.perf_counter() - start) * 1000, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(send, bodies))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, _ in results)
+    return {
+        'requests_per_second': len(bodies) / elapsed,
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'errors': sum(1 for _, ok in results if not ok),
+    }
@@ -0,0 +1,81 @@
+"""
+p50 latency of /api/measurement-units/ for a token-authenticated client,
+with the plain TokenAuthentication and with CachedTokenAuthentication. The
+token cache is turned on for the run; one process, so local memory is enough.
+
+    python -m benchmarks.token_auth --repeat 500
+"""
+import argparse
+import json
+
+from benchmarks import benchmark_database, format_stats, measure, setup_django
+
+
+def run(repeat):
+    from django.core.cache import cache
+    from django.test import override_settings
+    from django.contrib.auth.models import User
+    from rest_framework.authentication import SessionAuthentication, TokenAuthentication
+    from rest_framework.authtoken.models import Token
+    from rest_framework.test import APIClient
+    from nutrition.models import MeasurementUnit
+    from nutrition.views import MeasurementUnitViewSet
+    from users.authentication import (
+        CachedTokenAuthentication, get_token_cache_stats, reset_token_cache_stats
+    )
+
+    for name, abbreviation, unit_type in [
+        ('cup', 'c', 'volume'), ('tablespoon', 'tbsp', 'volume'), ('teaspoon', 'tsp', 'volume'),
+        ('gram', 'g', 'weight'), ('ounce', 'oz', 'weight'), ('piece', 'pc', 'count'),
+    ]:
+        MeasurementUnit.objects.create(name=name, abbreviation=abbreviation, type=unit_type)
+
+    user = User.objects.create_user(username='benchmark', password='benchmark')
+    token = Token.objects.create(user=user)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def request():
+        response = client.get('/api/measurement-units/')
+        assert response.status_code == 200, response.status_code
+
+    original = MeasurementUnitViewSet.authentication_classes
+    results = {}
+    try:
+        for name, authenticator in [
+            ('TokenAuthentication', TokenAuthentication),
+            ('CachedTokenAuthentication', CachedTokenAuthentication),
+        ]:
+            cache.clear()
+            reset_token_cache_stats()
+            MeasurementUnitViewSet.authentication_classes = [authenticator, SessionAuthentication]
+            with override_settings(TOKEN_CACHE_TIMEOUT=60):
+                results[name] = measure(request, repeat)
+        results['CachedTokenAuthentication']['token_cache'] = get_token_cache_stats()
+    finally:
+        MeasurementUnitViewSet.authentication_classes = original
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=500, help='Timed requests per authenticator')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    setup_django()
+    with benchmark_database():
+        results = run(args.repeat)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    for name, stats in results.items():
+        print(format_stats(name, stats))
+    print(f"Token cache: {results['CachedTokenAuthentication']['token_cache']}")
+
+
+if __name__ == '__main__':
+    main()
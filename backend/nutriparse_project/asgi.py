@@ -12,5 +12,13 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nutriparse_project.settings')
+# Every ASGI request runs its database calls in a new thread, so persistent
+# connections would be left open instead of reused; pool them (DATABASE_POOL)
+os.environ.setdefault('DATABASE_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
+
+# Load the food catalog before the first request
+from nutrition.catalog import preload_food_catalog  # noqa: E402
+
+preload_food_catalog()
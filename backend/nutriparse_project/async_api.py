@@ -0,0 +1,73 @@
+"""
+Async API views for the endpoints where a request mostly waits: on the
+database, or on a parse running in another thread or process.
+
+DRF views are synchronous, so under ASGI each request to them holds a thread
+for its whole duration. The views built with async_api_view() are plain
+Django async views that authenticate with the REST_FRAMEWORK authenticators
+and validate with the DRF serializers, and render their own JSON responses.
+"""
+import functools
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, status
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+
+def json_response(data, status=status.HTTP_200_OK, headers=None):
+    return JsonResponse(data, status=status, headers=headers, encoder=DjangoJSONEncoder, safe=False)
+
+
+def error_response(exc):
+    """Render an APIException the way DRF's exception handler does"""
+    headers = {}
+    if getattr(exc, 'auth_header', None):
+        headers['WWW-Authenticate'] = exc.auth_header
+    if getattr(exc, 'wait', None):
+        headers['Retry-After'] = str(int(exc.wait))
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    return json_response(data, exc.status_code, headers)
+
+
+def _prepare(request, authenticated):
+    """Authenticate the request and parse its body, raising APIException on failure"""
+    if authenticated and not request.user.is_authenticated:
+        auth_header = request.authenticators[0].authenticate_header(request) if request.authenticators else None
+        exc = exceptions.NotAuthenticated()
+        if auth_header:
+            exc.auth_header = auth_header
+        else:
+            # Like DRF, without a WWW-Authenticate challenge the response is a 403
+            exc.status_code = status.HTTP_403_FORBIDDEN
+        raise exc
+    # Parse the body here too; parsers may read a spooled upload from disk
+    request.data
+
+
+def async_api_view(methods, authenticated=True):
+    """
+    Turn an async function taking a DRF Request into an async Django view.
+    Authentication (which may query the database or the cache) runs in a
+    thread; the CSRF check of session authentication is kept.
+    """
+    def decorator(view):
+        @csrf_exempt
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return error_response(exceptions.MethodNotAllowed(request.method))
+            request = Request(
+                request,
+                parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES],
+                authenticators=[authenticator() for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES],
+            )
+            try:
+                await sync_to_async(_prepare)(request, authenticated)
+            except exceptions.APIException as exc:
+                return error_response(exc)
+            return await view(request, *args, **kwargs)
+        return wrapper
+    return decorator
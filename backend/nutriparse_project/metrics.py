@@ -0,0 +1,206 @@
+"""
+In-process metrics rendered in the Prometheus text exposition format.
+
+Metrics are kept per process; with several workers each one is scraped
+(or aggregated) separately.
+"""
+import bisect
+import threading
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Registry:
+    """Collection of metrics plus callbacks refreshing them at scrape time"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+        self._collectors = []
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Duplicate metric: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, collector):
+        """Register a callable run before every scrape, e.g. to set gauges"""
+        with self._lock:
+            self._collectors.append(collector)
+        return collector
+
+    def get(self, name):
+        return self._metrics[name]
+
+    def render(self):
+        with self._lock:
+            collectors = list(self._collectors)
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        for collector in collectors:
+            collector()
+        return ''.join(metric.render() for metric in metrics)
+
+
+REGISTRY = Registry()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series = {}
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def _header(self):
+        return f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.type}\n"
+
+    def render(self):
+        with self._lock:
+            series = sorted(self._series.items())
+        lines = [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}\n"
+            for key, value in series
+        ]
+        return self._header() + ''.join(lines)
+
+
+class Counter(Metric):
+    """Monotonically increasing value"""
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._series.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    """Value that can go up and down"""
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = value
+
+    def value(self, **labels):
+        return self._series.get(self._key(labels))
+
+
+class Histogram(Metric):
+    """Distribution of observed values over fixed upper bucket bounds"""
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=(), registry=REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {
+                    'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0
+                }
+            series['counts'][index] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def snapshot(self):
+        """
+        Return {label value(s): {'buckets': [(upper_bound, cumulative_count), ...], 'sum', 'count'}},
+        the last bucket having an upper bound of None (+Inf). Series of a histogram
+        with a single label are keyed by that label's value.
+        """
+        with self._lock:
+            series = {key: dict(data, counts=list(data['counts'])) for key, data in self._series.items()}
+
+        result = {}
+        for key, data in series.items():
+            cumulative, buckets = 0, []
+            for bound, count in zip(self.buckets + (None,), data['counts']):
+                cumulative += count
+                buckets.append((bound, cumulative))
+            label = key[0] if len(key) == 1 else key
+            result[label] = {'buckets': buckets, 'sum': data['sum'], 'count': data['count']}
+        return result
+
+    def render(self):
+        lines = []
+        for key, data in sorted(self.snapshot().items(), key=lambda item: str(item[0])):
+            key = key if isinstance(key, tuple) else (key,)
+            for bound, cumulative in data['buckets']:
+                le = '+Inf' if bound is None else _format_value(float(bound))
+                labels = _format_labels(self.labelnames, key, [('le', le)])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}\n")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(float(data['sum']))}\n")
+            lines.append(f"{self.name}_count{labels} {data['count']}\n")
+        return self._header() + ''.join(lines)
+
+
+# Metrics shared across apps
+
+REQUEST_COUNT = Counter(
+    'nutriparse_http_requests_total', 'HTTP requests by view, method and status code',
+    ['view', 'method', 'status']
+)
+REQUEST_LATENCY = Histogram(
+    'nutriparse_http_request_duration_seconds', 'HTTP request latency by view',
+    ['view', 'method'],
+    buckets=[0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+)
+REQUEST_QUERIES = Histogram(
+    'nutriparse_http_request_queries', 'Database queries per HTTP request by view',
+    ['view'],
+    buckets=[0, 1, 2, 5, 10, 20, 50, 100, 200, 500]
+)
+DB_CONNECTIONS = Counter(
+    'nutriparse_db_connections_total', 'Database connections made by this process, opened or taken from the pool',
+    ['alias']
+)
+CACHE_REQUESTS = Counter(
+    'nutriparse_cache_requests_total', 'Cache lookups by cache and result (hit or miss)',
+    ['cache', 'result']
+)
+
+
+def record_cache_lookup(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
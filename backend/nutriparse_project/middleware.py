@@ -0,0 +1,186 @@
+import contextvars
+import cProfile
+import logging
+import random
+import secrets
+import time
+from contextlib import contextmanager
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from .metrics import DB_CONNECTIONS, REQUEST_COUNT, REQUEST_LATENCY, REQUEST_QUERIES
+from .profiling import PROFILE_HEADER, get_profile_store
+from .routers import get_replica_alias, routing_request
+
+logger = logging.getLogger(__name__)
+
+
+# Database queries of the request handled in the current context. sync_to_async()
+# copies the context into the thread running an async view's queries, so those
+# are counted too.
+_request_queries = contextvars.ContextVar('request_queries', default=None)
+
+
+def count_request_query(execute, sql, params, many, context):
+    counter = _request_queries.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+@receiver(connection_created)
+def count_connection(sender=None, connection=None, **kwargs):
+    # Rare once connections are persistent; with a pool, every checkout counts
+    DB_CONNECTIONS.inc(alias=connection.alias)
+
+
+@receiver(connection_created)
+def install_query_counter(sender=None, connection=None, **kwargs):
+    # First in the list, so execute_wrapper() blocks can still push and pop their own
+    if count_request_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, count_request_query)
+
+
+@contextmanager
+def counting_queries():
+    counter = [0]
+    token = _request_queries.set(counter)
+    try:
+        yield counter
+    finally:
+        _request_queries.reset(token)
+
+
+class MetricsMiddleware:
+    """
+    Record the latency, status code and number of database queries of every
+    request, labelled by the resolved view name (e.g. 'recipe-list')
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Under ASGI, stay async so async views are not run in a thread
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        # Connections opened before this module was imported have no counter yet
+        for connection in connections.all():
+            install_query_counter(connection=connection)
+
+        start = time.perf_counter()
+        with counting_queries() as queries:
+            response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - start, queries[0])
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        with counting_queries() as queries:
+            response = await self.get_response(request)
+        self.record(request, response, time.perf_counter() - start, queries[0])
+        return response
+
+    def record(self, request, response, duration, queries):
+        # Unresolved URLs share one label to keep the number of series bounded
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name or match._func_path) if match else 'unresolved'
+
+        REQUEST_COUNT.inc(view=view, method=request.method, status=response.status_code)
+        REQUEST_LATENCY.observe(duration, view=view, method=request.method)
+        REQUEST_QUERIES.observe(queries, view=view)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Let ReplicaRouter route the queries of each request; removed from the
+    stack when no replica is configured
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if get_replica_alias() is None:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with routing_request(request):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with routing_request(request):
+            return await self.get_response(request)
+
+
+class ProfilingMiddleware:
+    """
+    Profile sampled or explicitly requested requests; removed from the stack
+    unless PROFILING_SAMPLE_RATE or PROFILING_TOKEN is set
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+        self.token = settings.PROFILING_TOKEN
+        if not self.sample_rate and not self.token:
+            raise MiddlewareNotUsed()
+        self.store = get_profile_store()
+
+    def get_trigger(self, request):
+        """Why this request is profiled ('header' or 'sample'), or None"""
+        value = request.headers.get(PROFILE_HEADER)
+        if self.token and value and secrets.compare_digest(value, self.token):
+            return 'header'
+        if self.sample_rate and random.random() < self.sample_rate:
+            return 'sample'
+        return None
+
+    def __call__(self, request):
+        trigger = self.get_trigger(request)
+        if trigger is None:
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already active in this thread
+            return self.get_response(request)
+
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+        duration = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        info = {
+            'method': request.method,
+            'path': request.path,
+            'view': (match.view_name or match._func_path) if match else None,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 3),
+            'trigger': trigger,
+        }
+        try:
+            summary = self.store.save(profiler, info, settings.PROFILING_TOP_N)
+        except OSError:
+            logger.exception("Could not store the profile of %s %s", request.method, request.path)
+        else:
+            response['X-Profile-Id'] = summary['id']
+        return response
@@ -0,0 +1,121 @@
+"""
+Storage of request profiles made with cProfile.
+
+ProfilingMiddleware profiles a fraction of requests (PROFILING_SAMPLE_RATE)
+plus any request sending the PROFILING_TOKEN in the X-Profile header. Each
+profile is kept in PROFILING_DIR as a raw pstats dump, loadable with
+`python -m pstats` or snakeviz, next to a JSON summary of its hottest
+functions. Only the newest PROFILING_MAX_PROFILES are kept.
+"""
+import json
+import os
+import pstats
+import re
+import uuid
+from datetime import datetime, timezone
+from django.conf import settings
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_ID = re.compile(r'^\d{8}T\d{12}-[0-9a-f]{8}$')
+
+
+def top_functions(profiler, limit):
+    """The `limit` functions with the most time spent in their own code"""
+    stats = pstats.Stats(profiler).stats
+    rows = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)[:limit]
+    return [
+        {
+            'function': f"{filename}:{line}({name})",
+            'calls': calls,
+            'primitive_calls': primitive_calls,
+            'tottime_ms': round(tottime * 1000, 3),
+            'cumtime_ms': round(cumtime * 1000, 3),
+        }
+        for (filename, line, name), (primitive_calls, calls, tottime, cumtime, _) in rows
+    ]
+
+
+class ProfileStore:
+    """
+    Bounded on-disk ring buffer of profiles. Ids start with a UTC timestamp,
+    so sorting them orders profiles from oldest to newest.
+    """
+    def __init__(self, directory, max_profiles):
+        self.directory = directory
+        self.max_profiles = max_profiles
+
+    def _path(self, profile_id, extension):
+        return os.path.join(self.directory, f"{profile_id}.{extension}")
+
+    def ids(self):
+        """Stored profile ids, newest first"""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        ids = [name[:-5] for name in names if name.endswith('.json') and PROFILE_ID.match(name[:-5])]
+        return sorted(ids, reverse=True)
+
+    def save(self, profiler, info, top_n):
+        """Store a finished profiler with its request info and return the summary"""
+        now = datetime.now(timezone.utc)
+        profile_id = f"{now.strftime('%Y%m%dT%H%M%S%f')}-{uuid.uuid4().hex[:8]}"
+        os.makedirs(self.directory, exist_ok=True)
+
+        profiler.dump_stats(self._path(profile_id, 'prof'))
+        summary = {
+            'id': profile_id,
+            'created_at': now.isoformat(),
+            **info,
+            'functions': top_functions(profiler, top_n),
+        }
+        # Write the summary last and atomically: it is what makes a profile visible
+        temporary = self._path(profile_id, 'json.tmp')
+        with open(temporary, 'w') as f:
+            json.dump(summary, f, indent=2)
+        os.replace(temporary, self._path(profile_id, 'json'))
+
+        self.prune()
+        return summary
+
+    def prune(self):
+        """Delete the oldest profiles beyond max_profiles"""
+        for profile_id in self.ids()[self.max_profiles:]:
+            for extension in ('json', 'prof'):
+                try:
+                    os.remove(self._path(profile_id, extension))
+                except FileNotFoundError:
+                    # Already pruned by another worker
+                    pass
+
+    def get(self, profile_id):
+        """The summary of a profile, or None"""
+        if not PROFILE_ID.match(profile_id):
+            return None
+        try:
+            with open(self._path(profile_id, 'json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def list(self):
+        """Summaries without their function lists, newest first"""
+        summaries = []
+        for profile_id in self.ids():
+            summary = self.get(profile_id)
+            if summary is not None:
+                summary.pop('functions', None)
+                summaries.append(summary)
+        return summaries
+
+    def raw_path(self, profile_id):
+        """Path of the pstats dump of a profile, or None"""
+        if not PROFILE_ID.match(profile_id):
+            return None
+        path = self._path(profile_id, 'prof')
+        return path if os.path.exists(path) else None
+
+
+def get_profile_store():
+    return ProfileStore(settings.PROFILING_DIR, settings.PROFILING_MAX_PROFILES)
+
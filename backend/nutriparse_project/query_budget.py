@@ -0,0 +1,187 @@
+"""
+Query-budget guardrails for the test suite.
+
+QueryBudgetMixin.assertQueryBudget() records the SQL sent inside a block and
+fails when it exceeds a number of queries, repeats an identical statement or
+runs a query slower than `slow_query_ms`. ViewSetQueryBudgetMixin applies it
+to every action of a set of ViewSets.
+
+Set QUERY_PROFILE_DIR to write the recorded queries of every test as JSON.
+"""
+import json
+import os
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+from django.core.cache import caches
+from django.db import connection, transaction
+from rest_framework import mixins
+from rest_framework.test import APIClient
+
+# Actions provided by the generic ViewSet mixins
+MIXIN_ACTIONS = [
+    (mixins.ListModelMixin, ['list']),
+    (mixins.CreateModelMixin, ['create']),
+    (mixins.RetrieveModelMixin, ['retrieve']),
+    (mixins.UpdateModelMixin, ['update', 'partial_update']),
+    (mixins.DestroyModelMixin, ['destroy']),
+]
+
+# Transaction control sent by atomic blocks, not counted against the budget
+TRANSACTION_STATEMENT = re.compile(r'^\s*(SAVEPOINT|RELEASE SAVEPOINT|ROLLBACK TO SAVEPOINT|BEGIN|COMMIT)\b', re.I)
+
+
+def viewset_actions(viewset):
+    """Names of all actions routed for a ViewSet, including @action methods"""
+    actions = [
+        name for mixin, names in MIXIN_ACTIONS if issubclass(viewset, mixin) for name in names
+    ]
+    return actions + [extra.__name__ for extra in viewset.get_extra_actions()]
+
+
+class QueryRecorder:
+    """Record the SQL, parameters and duration of every query on a connection"""
+    def __init__(self, using=connection):
+        self.connection = using
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if not TRANSACTION_STATEMENT.match(sql):
+                self.queries.append({
+                    'sql': sql,
+                    'params': repr(params),
+                    'many': many,
+                    'time_ms': (time.perf_counter() - start) * 1000,
+                })
+
+    def __enter__(self):
+        self._wrapper = self.connection.execute_wrapper(self)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._wrapper.__exit__(*exc_info)
+
+    def __len__(self):
+        return len(self.queries)
+
+    def duplicates(self):
+        """Statements sent more than once with the same parameters"""
+        counts = Counter((query['sql'], query['params']) for query in self.queries)
+        return {statement: count for statement, count in counts.items() if count > 1}
+
+    def summary(self):
+        """Query templates ordered by how often they ran, for failure messages"""
+        counts = Counter(query['sql'] for query in self.queries)
+        return '\n'.join(f"  {count} x {sql}" for sql, count in counts.most_common())
+
+
+@dataclass
+class Budget:
+    """A request exercising a ViewSet action and the queries it may send"""
+    method: str
+    url: str
+    max_queries: int
+    data: dict = None
+    status: int = None
+    allow_duplicates: bool = False
+    user: object = None
+
+
+class QueryBudgetMixin:
+    """TestCase mixin providing assertQueryBudget() and per-test query profiles"""
+    slow_query_ms = 250
+
+    def setUp(self):
+        super().setUp()
+        self._query_profile = []
+
+    def tearDown(self):
+        directory = os.environ.get('QUERY_PROFILE_DIR')
+        if directory and self._query_profile:
+            os.makedirs(directory, exist_ok=True)
+            with open(os.path.join(directory, f"{self.id()}.json"), 'w') as f:
+                json.dump(self._query_profile, f, indent=2)
+        super().tearDown()
+
+    @contextmanager
+    def assertQueryBudget(self, max_queries, name=None, allow_duplicates=False):
+        name = name or f"block {len(self._query_profile) + 1}"
+        with QueryRecorder() as recorder:
+            yield recorder
+
+        self._query_profile.append({
+            'name': name,
+            'count': len(recorder),
+            'total_ms': sum(query['time_ms'] for query in recorder.queries),
+            'queries': recorder.queries,
+        })
+
+        self.assertLessEqual(
+            len(recorder), max_queries,
+            f"{name} sent {len(recorder)} queries, budget is {max_queries}:\n{recorder.summary()}"
+        )
+        if not allow_duplicates:
+            duplicates = recorder.duplicates()
+            self.assertFalse(duplicates, f"{name} sent duplicate statements:\n" + '\n'.join(
+                f"  {count} x {sql} {params}" for (sql, params), count in duplicates.items()
+            ))
+        slow = [query for query in recorder.queries if query['time_ms'] > self.slow_query_ms]
+        self.assertFalse(slow, f"{name} ran queries slower than {self.slow_query_ms} ms:\n" + '\n'.join(
+            f"  {query['time_ms']:.1f} ms {query['sql']}" for query in slow
+        ))
+
+
+class ViewSetQueryBudgetMixin(QueryBudgetMixin):
+    """
+    Declare a Budget for every action of `viewsets` in get_budgets(), keyed by
+    (ViewSet, action). Each request runs in its own rolled-back transaction,
+    with empty caches, as `self.user`. Combine with TestCase, which stays out
+    of this class so importing it does not collect its tests.
+    """
+    client_class = APIClient
+    viewsets = ()
+
+    def get_budgets(self):
+        raise NotImplementedError
+
+    def request(self, budget):
+        if budget.method == 'get':
+            response = self.client.get(budget.url, budget.data)
+        else:
+            response = getattr(self.client, budget.method)(budget.url, budget.data, format='json')
+        if response.streaming:
+            # A streamed body runs its queries while it is consumed
+            response.data = b''.join(response.streaming_content)
+        return response
+
+    def test_every_action_has_a_budget(self):
+        budgets = self.get_budgets()
+        missing = [
+            f"{viewset.__name__}.{action}"
+            for viewset in self.viewsets for action in viewset_actions(viewset)
+            if (viewset, action) not in budgets
+        ]
+        self.assertFalse(missing, f"Actions without a query budget: {', '.join(missing)}")
+
+    def test_query_budgets(self):
+        for (viewset, action), budget in self.get_budgets().items():
+            name = f"{viewset.__name__}.{action}"
+            with self.subTest(name):
+                for cache in caches.all():
+                    cache.clear()
+                self.client.force_authenticate(user=budget.user or self.user)
+                with transaction.atomic():
+                    with self.assertQueryBudget(budget.max_queries, name, budget.allow_duplicates):
+                        response = self.request(budget)
+                    transaction.set_rollback(True)
+                if budget.status is not None:
+                    self.assertEqual(response.status_code, budget.status, f"{name}: {response.data}")
+                else:
+                    self.assertLess(response.status_code, 400, f"{name}: {response.data}")
@@ -0,0 +1,131 @@
+"""
+Database router sending reads to a read replica.
+
+When the DATABASE_REPLICA_ALIAS database is configured, reads made while
+handling a request go to it for the nutrition reference tables, and for
+recipes in read-only (GET, HEAD, OPTIONS) requests. Everything else, and any
+query outside a request, uses the primary.
+
+Reads stay consistent with a user's own writes: once a request writes, its
+remaining reads use the primary, and so do the user's requests for the next
+DATABASE_REPLICA_PIN_SECONDS, while the replica catches up. These pins are
+kept in the default cache, which has to be shared between worker processes;
+the settings refuse a replica with the local-memory cache.
+
+Reads whose results outlive the request, such as responses stored in the
+nutrition cache under the current dataset version, are made inside
+primary_reads(), so data the replica has not caught up with is never cached
+as current.
+"""
+import contextvars
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+# Apps whose tables are read from the replica in every request
+REPLICA_APPS = {'nutrition'}
+# Apps whose tables are read from the replica in read-only requests
+READ_ONLY_REPLICA_APPS = {'recipes'}
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_current_state = contextvars.ContextVar('replica_routing', default=None)
+_primary_reads = contextvars.ContextVar('replica_primary_reads', default=False)
+
+
+def get_replica_alias():
+    """The replica's database alias, or None when no replica is configured"""
+    alias = getattr(settings, 'DATABASE_REPLICA_ALIAS', None)
+    return alias if alias in settings.DATABASES else None
+
+
+def pin_key(user_id):
+    return f"replica:pin:{user_id}"
+
+
+class RoutingState:
+    """The request being handled and whether its reads must use the primary"""
+    def __init__(self, request):
+        self.request = request
+        self.read_only = request.method in SAFE_METHODS
+        self.wrote = False
+        self.pinned = None
+
+    def user_id(self):
+        # DRF sets request.user once it has authenticated the request in the view
+        user = getattr(self.request, 'user', None)
+        return user.pk if user is not None and user.is_authenticated else None
+
+    def is_pinned(self):
+        """Whether the user wrote recently, looked up once the user is known"""
+        if self.pinned is None:
+            user_id = self.user_id()
+            if user_id is None:
+                return False
+            self.pinned = cache.get(pin_key(user_id)) is not None
+        return self.pinned
+
+    def record_write(self):
+        if self.wrote:
+            return
+        self.wrote = True
+        user_id = self.user_id()
+        if user_id is not None:
+            cache.set(pin_key(user_id), True, settings.DATABASE_REPLICA_PIN_SECONDS)
+
+
+@contextmanager
+def routing_request(request):
+    """Route the queries made in this context as part of handling `request`"""
+    token = _current_state.set(RoutingState(request))
+    try:
+        yield
+    finally:
+        _current_state.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    """Read from the primary in this context, also while handling a request"""
+    token = _primary_reads.set(True)
+    try:
+        yield
+    finally:
+        _primary_reads.reset(token)
+
+
+class ReplicaRouter:
+    """Read-replica routing with read-after-write consistency per user"""
+
+    def db_for_read(self, model, **hints):
+        state = _current_state.get()
+        if state is None:
+            return None
+        if _primary_reads.get():
+            return DEFAULT_DB_ALIAS
+        app_label = model._meta.app_label
+        if app_label not in REPLICA_APPS and not (state.read_only and app_label in READ_ONLY_REPLICA_APPS):
+            return None
+        replica = get_replica_alias()
+        if replica is None:
+            return None
+        if state.wrote or state.is_pinned():
+            # Explicitly, since objects read from the replica would otherwise pull their relations from it
+            return DEFAULT_DB_ALIAS
+        return replica
+
+    def db_for_write(self, model, **hints):
+        if get_replica_alias() is None:
+            return None
+        state = _current_state.get()
+        if state is not None:
+            state.record_write()
+        # Also for objects that were read from the replica
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        replica = get_replica_alias()
+        # The replica holds the primary's data
+        if replica is not None and {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, replica}:
+            return True
+        return None
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 import os
 from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
 from datetime import timedelta
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -52,12 +53,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'nutriparse_project.middleware.MetricsMiddleware',  # First, so it times the whole stack
+    'nutriparse_project.middleware.ProfilingMiddleware',  # Inactive unless profiling is configured
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # Add CORS middleware before CommonMiddleware
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'nutriparse_project.middleware.ReplicaRoutingMiddleware',  # Inactive without a read replica
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -93,9 +97,113 @@ DATABASES = {
         'PASSWORD': 'Pinkeltje1',  # Use environment variables in production
         'HOST': 'localhost',
         'PORT': '5432',
+        # Keep connections open between requests (seconds; 0 closes them after
+        # every request) and check a reused connection is alive before using it
+        'CONN_MAX_AGE': int(os.environ.get('DATABASE_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Optional connection pool (DATABASE_POOL=1), which needs psycopg 3:
+# pip install "psycopg[binary,pool]". Persistent connections are per thread,
+# so they are not reused under ASGI, where a pool is the way to reuse them.
+if os.environ.get('DATABASE_POOL', '').lower() in ('1', 'true', 'yes'):
+    DATABASES['default']['CONN_MAX_AGE'] = 0  # Connections go back to the pool instead
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.environ.get('DATABASE_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DATABASE_POOL_MAX_SIZE', 10)),
+            # Seconds a request waits for a free connection before failing
+            'timeout': float(os.environ.get('DATABASE_POOL_TIMEOUT', 10)),
+        },
+    }
+
+# Optional read replica (DATABASE_REPLICA_HOST). Requests read the nutrition
+# tables, and recipes in GET requests, from it; see nutriparse_project/routers.py.
+# After writing, a user reads from the primary for DATABASE_REPLICA_PIN_SECONDS.
+DATABASE_REPLICA_ALIAS = 'replica'
+DATABASE_REPLICA_PIN_SECONDS = int(os.environ.get('DATABASE_REPLICA_PIN_SECONDS', 5))
+if os.environ.get('DATABASE_REPLICA_HOST'):
+    DATABASES[DATABASE_REPLICA_ALIAS] = {
+        **DATABASES['default'],
+        'HOST': os.environ['DATABASE_REPLICA_HOST'],
+        'PORT': os.environ.get('DATABASE_REPLICA_PORT', DATABASES['default']['PORT']),
+        'NAME': os.environ.get('DATABASE_REPLICA_NAME', DATABASES['default']['NAME']),
+        # No test database is created on the replica. The test suite expects
+        # no replica: leave DATABASE_REPLICA_HOST unset when running it
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['nutriparse_project.routers.ReplicaRouter']
+
+
+# Caches
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+#
+# The 'nutrition' cache holds serialized responses of the read-only nutrition
+# endpoints, keyed on the dataset version kept in the database, so no worker
+# serves an outdated entry. Local memory is per process; use the 'file' or 'db'
+# backend to share the entries between workers (the 'db' backend needs
+# `manage.py createcachetable`).
+
+NUTRITION_CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'nutrition'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', os.path.join(BASE_DIR, 'cache', 'nutrition')),
+    'db': ('django.core.cache.backends.db.DatabaseCache', 'nutrition_cache'),
+}
+NUTRITION_CACHE_BACKEND, NUTRITION_CACHE_LOCATION = NUTRITION_CACHE_BACKENDS[
+    os.environ.get('NUTRITION_CACHE_BACKEND', 'locmem')
+]
+
+# The default cache holds the token authentication cache (users.authentication)
+# and the read replica pins (nutriparse_project.routers). Both must be shared
+# by every worker process: set CACHE_BACKEND to 'redis' (with CACHE_LOCATION
+# its URL; needs the redis package), 'db' (needs `manage.py createcachetable`)
+# or 'file' (workers on one host only). With local memory, tokens are not cached.
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', ''),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', os.path.join(BASE_DIR, 'cache', 'default')),
+    'db': ('django.core.cache.backends.db.DatabaseCache', 'default_cache'),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379'),
+}
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+DEFAULT_CACHE_BACKEND, DEFAULT_CACHE_LOCATION = CACHE_BACKENDS[CACHE_BACKEND]
+SHARED_CACHE = CACHE_BACKEND != 'locmem'
+
+if DATABASE_REPLICA_ALIAS in DATABASES and not SHARED_CACHE:
+    # Pins kept in one worker's memory would let the user's next request read stale data
+    raise ImproperlyConfigured(
+        "DATABASE_REPLICA_HOST requires a shared default cache for the read-after-write "
+        "pins: set CACHE_BACKEND to 'redis', 'db' or 'file'"
+    )
+
+CACHES = {
+    'default': {
+        'BACKEND': DEFAULT_CACHE_BACKEND,
+        'LOCATION': os.environ.get('CACHE_LOCATION', DEFAULT_CACHE_LOCATION),
+    },
+    'nutrition': {
+        'BACKEND': NUTRITION_CACHE_BACKEND,
+        'LOCATION': os.environ.get('NUTRITION_CACHE_LOCATION', NUTRITION_CACHE_LOCATION),
+        'TIMEOUT': int(os.environ.get('NUTRITION_CACHE_TIMEOUT', 60 * 60)),
+        'OPTIONS': {
+            # Bound the cache size; a third of the entries are culled when full
+            'MAX_ENTRIES': int(os.environ.get('NUTRITION_CACHE_MAX_ENTRIES', 2000)),
+            'CULL_FREQUENCY': 3,
+        },
+    },
+}
+
+
+# Memory-mapped snapshot of the nutrition dataset, written by
+# `manage.py export_nutrition_snapshot`. Workers load the food catalog from it
+# while it matches the database, and from the database otherwise.
+NUTRITION_SNAPSHOT_PATH = os.environ.get('NUTRITION_SNAPSHOT_PATH', os.path.join(BASE_DIR, 'cache', 'nutrition.snapshot'))
+
+# Seconds a worker uses its food catalog before checking the dataset version
+# in the database again; 0 checks on every use. Bumps made by the worker itself
+# and code running in a transaction always see the current version.
+NUTRITION_CATALOG_REVALIDATE_SECONDS = float(os.environ.get('NUTRITION_CATALOG_REVALIDATE_SECONDS', 1))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -145,7 +253,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
@@ -155,6 +263,53 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 20,
 }
 
+# Seconds an authenticated token stays in the cache before it is looked up again;
+# 0 disables the cache, the default unless the default cache is shared
+TOKEN_CACHE_TIMEOUT = int(os.environ.get('TOKEN_CACHE_TIMEOUT', 60 if SHARED_CACHE else 0))
+
+# Addresses allowed to scrape /metrics (comma-separated); localhost by default,
+# empty denies everyone
+METRICS_ALLOWED_IPS = [
+    ip for ip in os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip
+]
+
+# Parser processes for CPU-bound recipe parsing; 0 parses in the request thread.
+# Parses beyond the busy workers plus the queue size are rejected with a 503.
+PARSE_WORKERS = int(os.environ.get('PARSE_WORKERS', 0))
+PARSE_QUEUE_SIZE = int(os.environ.get('PARSE_QUEUE_SIZE', 32))
+PARSE_TIMEOUT = float(os.environ.get('PARSE_TIMEOUT', 30))
+# Parses after which a worker is replaced, to cap memory growth
+PARSE_MAX_TASKS_PER_WORKER = int(os.environ.get('PARSE_MAX_TASKS_PER_WORKER', 500))
+# Lines accepted by the streaming parse, which runs in the request thread
+PARSE_STREAM_MAX_LINES = int(os.environ.get('PARSE_STREAM_MAX_LINES', 500))
+
+# Recipes read per chunk by the recipe export and written per batch by the import
+RECIPE_TRANSFER_BATCH_SIZE = int(os.environ.get('RECIPE_TRANSFER_BATCH_SIZE', 1000))
+
+# Largest batch of ingredient lists, and ingredients per list, of one
+# nutrition/calculate request, and the requests per client it accepts (a DRF
+# rate such as '30/minute'; empty disables the throttle). The endpoint is
+# open to anonymous clients, which are told apart by IP
+NUTRITION_CALCULATE_MAX_RECIPES = int(os.environ.get('NUTRITION_CALCULATE_MAX_RECIPES', 5000))
+NUTRITION_CALCULATE_MAX_INGREDIENTS = int(os.environ.get('NUTRITION_CALCULATE_MAX_INGREDIENTS', 100))
+NUTRITION_CALCULATE_RATE = os.environ.get('NUTRITION_CALCULATE_RATE', '30/minute') or None
+
+# Recipes whose cached nutrition went stale (recipes.invalidation) are
+# recomputed in a background pass this many seconds after the change, in
+# batches; empty leaves them to `manage.py recompute_stale_nutrition`
+NUTRITION_RECOMPUTE_DELAY = os.environ.get('NUTRITION_RECOMPUTE_DELAY', '2')
+NUTRITION_RECOMPUTE_DELAY = float(NUTRITION_RECOMPUTE_DELAY) if NUTRITION_RECOMPUTE_DELAY else None
+NUTRITION_RECOMPUTE_BATCH_SIZE = int(os.environ.get('NUTRITION_RECOMPUTE_BATCH_SIZE', 500))
+
+# Request profiling, off by default: the fraction of requests to profile, and a
+# token that profiles any request sending it in the X-Profile header
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN', '')
+PROFILING_DIR = os.environ.get('PROFILING_DIR', os.path.join(BASE_DIR, 'logs', 'profiles'))
+# Profiles kept on disk (oldest are deleted first) and functions listed per profile
+PROFILING_MAX_PROFILES = int(os.environ.get('PROFILING_MAX_PROFILES', 100))
+PROFILING_TOP_N = int(os.environ.get('PROFILING_TOP_N', 30))
+
 # CORS settings
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",  # React development server
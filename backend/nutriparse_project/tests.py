@@ -0,0 +1,397 @@
+import json
+import os
+import pstats
+import re
+import shutil
+import tempfile
+from unittest import mock, skipUnless
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.backends.signals import connection_created
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from nutrition.cache import response_cache
+from nutrition.metrics import record_loader_run
+from nutrition.models import FoodGroup, MeasurementUnit, NutritionData
+from recipes.models import Recipe
+from .metrics import CONTENT_TYPE, Counter, Histogram, Registry
+from .profiling import PROFILE_HEADER, get_profile_store
+from .query_budget import QueryBudgetMixin
+from .routers import ReplicaRouter, pin_key, primary_reads, routing_request
+
+SAMPLE = re.compile(r'^(?P<name>[a-z_]+)(?P<labels>\{.*\})? (?P<value>\S+)$')
+
+
+def scrape(client):
+    """Scrape /metrics and return {'name{labels}': value}"""
+    response = client.get(reverse('metrics'))
+    samples = {}
+    for line in response.content.decode().splitlines():
+        if line.startswith('#'):
+            continue
+        match = SAMPLE.match(line)
+        samples[match['name'] + (match['labels'] or '')] = float(match['value'])
+    return samples
+
+
+class MetricsFormatTest(TestCase):
+    """Test the Prometheus text rendering"""
+    
+    def setUp(self):
+        self.registry = Registry()
+    
+    def test_counter(self):
+        counter = self.registry.register(Counter('jobs_total', 'Jobs run', ['queue'], registry=None))
+        counter.inc(queue='default')
+        counter.inc(2, queue='say "hi"\n')
+        self.assertEqual(self.registry.render(), (
+            '# HELP jobs_total Jobs run\n'
+            '# TYPE jobs_total counter\n'
+            'jobs_total{queue="default"} 1\n'
+            'jobs_total{queue="say \\"hi\\"\\n"} 2\n'
+        ))
+    
+    def test_histogram(self):
+        histogram = self.registry.register(Histogram('latency_seconds', 'Latency', buckets=[0.1, 1], registry=None))
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+        self.assertEqual(self.registry.render(), (
+            '# HELP latency_seconds Latency\n'
+            '# TYPE latency_seconds histogram\n'
+            'latency_seconds_bucket{le="0.1"} 1\n'
+            'latency_seconds_bucket{le="1.0"} 2\n'
+            'latency_seconds_bucket{le="+Inf"} 3\n'
+            'latency_seconds_sum 5.55\n'
+            'latency_seconds_count 3\n'
+        ))
+    
+    def test_labels_must_match(self):
+        counter = Counter('jobs_total', 'Jobs run', ['queue'], registry=None)
+        with self.assertRaises(ValueError):
+            counter.inc(queues='default')
+
+
+class MetricsEndpointTest(TestCase):
+    """Scrape /metrics after exercising the API"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        MeasurementUnit.objects.create(name="gram", abbreviation="g", type="weight")
+        response_cache.clear()
+    
+    def test_content_type(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], CONTENT_TYPE)
+    
+    def test_request_latency_and_queries(self):
+        before = scrape(self.client)
+        self.client.get('/api/measurement-units/')
+        after = scrape(self.client)
+        
+        requests = 'nutriparse_http_requests_total{view="measurementunit-list",method="GET",status="200"}'
+        latency = 'nutriparse_http_request_duration_seconds_count{view="measurementunit-list",method="GET"}'
+        queries = 'nutriparse_http_request_queries_sum{view="measurementunit-list"}'
+        self.assertEqual(after[requests] - before.get(requests, 0), 1)
+        self.assertEqual(after[latency] - before.get(latency, 0), 1)
+        self.assertGreater(after[queries] - before.get(queries, 0), 0)
+    
+    async def test_async_views(self):
+        before = await sync_to_async(scrape)(self.client)
+        await self.async_client.post(
+            reverse('nutritiondata-search-async'), {'query': 'gram'}, content_type='application/json'
+        )
+        after = await sync_to_async(scrape)(self.client)
+        
+        requests = 'nutriparse_http_requests_total{view="nutritiondata-search-async",method="POST",status="200"}'
+        queries = 'nutriparse_http_request_queries_sum{view="nutritiondata-search-async"}'
+        self.assertEqual(after[requests] - before.get(requests, 0), 1)
+        # Counted although the search query runs in a sync_to_async() thread
+        self.assertGreater(after[queries] - before.get(queries, 0), 0)
+    
+    def test_database_connections(self):
+        before = scrape(self.client)
+        connection_created.send(sender=connection.__class__, connection=connection)
+        after = scrape(self.client)
+        
+        key = 'nutriparse_db_connections_total{alias="default"}'
+        self.assertEqual(after[key] - before.get(key, 0), 1)
+    
+    def test_cache_hits_and_misses(self):
+        before = scrape(self.client)
+        self.client.get('/api/measurement-units/')
+        self.client.get('/api/measurement-units/')
+        after = scrape(self.client)
+        
+        for result in ('hit', 'miss'):
+            key = f'nutriparse_cache_requests_total{{cache="nutrition_response",result="{result}"}}'
+            self.assertEqual(after[key] - before.get(key, 0), 1)
+    
+    def test_spacy_invocations(self):
+        self.client.force_authenticate(user=self.user)
+        before = scrape(self.client)
+        # Without an "Ingredients" header, lines the rules cannot decide go to spaCy
+        self.client.post(reverse('recipe-parse'), {'recipe_text': "4 shallots\n1 cup sugar"}, format='json')
+        after = scrape(self.client)
+        
+        key = 'nutriparse_spacy_invocations_total'
+        self.assertGreater(after[key] - before.get(key, 0), 0)
+    
+    def test_loader_throughput(self):
+        record_loader_run(500, 2.0)
+        samples = scrape(self.client)
+        self.assertEqual(samples['nutriparse_loader_last_run_rows'], 500)
+        self.assertEqual(samples['nutriparse_loader_last_run_rows_per_second'], 250)
+    
+    @override_settings(METRICS_ALLOWED_IPS=['10.0.0.1'])
+    def test_allowed_ips(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+    
+    @override_settings(METRICS_ALLOWED_IPS=[])
+    def test_empty_allowed_ips_deny_everyone(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, status.HTTP_403_FORBIDDEN)
+
+
+class QueryBudgetMixinTest(QueryBudgetMixin, TestCase):
+    """Test the query budget assertions themselves"""
+    
+    def test_within_budget(self):
+        with self.assertQueryBudget(2) as recorder:
+            MeasurementUnit.objects.count()
+            list(MeasurementUnit.objects.all())
+        self.assertEqual(len(recorder), 2)
+    
+    def test_over_budget_fails(self):
+        with self.assertRaisesMessage(AssertionError, "sent 2 queries, budget is 1"):
+            with self.assertQueryBudget(1, "units"):
+                MeasurementUnit.objects.count()
+                list(MeasurementUnit.objects.all())
+    
+    def test_duplicates_fail_unless_allowed(self):
+        with self.assertRaisesMessage(AssertionError, "units sent duplicate statements"):
+            with self.assertQueryBudget(5, "units"):
+                MeasurementUnit.objects.count()
+                MeasurementUnit.objects.count()
+        with self.assertQueryBudget(5, allow_duplicates=True):
+            MeasurementUnit.objects.count()
+            MeasurementUnit.objects.count()
+    
+    def test_savepoints_are_not_counted(self):
+        with self.assertQueryBudget(1) as recorder:
+            with transaction.atomic():
+                MeasurementUnit.objects.count()
+        self.assertEqual(len(recorder), 1)
+    
+    def test_profile_is_written(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with mock.patch.dict(os.environ, {'QUERY_PROFILE_DIR': directory}):
+                with self.assertQueryBudget(1, "count"):
+                    MeasurementUnit.objects.count()
+                self.tearDown()
+            with open(os.path.join(directory, f"{self.id()}.json")) as f:
+                profile = json.load(f)
+        self.assertEqual(profile[0]['name'], "count")
+        self.assertEqual(profile[0]['count'], 1)
+
+
+class ProfilingTest(TestCase):
+    """Test the opt-in request profiler and its staff endpoints"""
+    
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        override = override_settings(
+            PROFILING_DIR=directory, PROFILING_TOKEN='secret', PROFILING_SAMPLE_RATE=0, PROFILING_MAX_PROFILES=2
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        
+        self.client = APIClient()
+        self.staff = User.objects.create_user(username="staff", password="testpassword", is_staff=True)
+        MeasurementUnit.objects.create(name="gram", abbreviation="g", type="weight")
+    
+    def profile(self):
+        return self.client.get('/api/measurement-units/', headers={PROFILE_HEADER: 'secret'})
+    
+    def test_header_triggers_profile(self):
+        response = self.profile()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        summary = get_profile_store().get(response['X-Profile-Id'])
+        self.assertEqual(summary['view'], 'measurementunit-list')
+        self.assertEqual(summary['trigger'], 'header')
+        self.assertTrue(summary['functions'])
+        self.assertIsNotNone(get_profile_store().raw_path(summary['id']))
+    
+    def test_requests_are_not_profiled_by_default(self):
+        self.assertNotIn('X-Profile-Id', self.client.get('/api/measurement-units/'))
+        response = self.client.get('/api/measurement-units/', headers={PROFILE_HEADER: 'wrong'})
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(get_profile_store().list(), [])
+    
+    @override_settings(PROFILING_SAMPLE_RATE=1)
+    def test_sampled_requests(self):
+        response = self.client.get('/api/measurement-units/')
+        self.assertEqual(get_profile_store().get(response['X-Profile-Id'])['trigger'], 'sample')
+    
+    def test_oldest_profiles_are_dropped(self):
+        ids = [self.profile()['X-Profile-Id'] for _ in range(3)]
+        self.assertEqual([summary['id'] for summary in get_profile_store().list()], ids[:0:-1])
+        self.assertIsNone(get_profile_store().raw_path(ids[0]))
+    
+    def test_endpoints_are_staff_only(self):
+        profile_id = self.profile()['X-Profile-Id']
+        user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.force_authenticate(user=user)
+        for url in (
+            reverse('profile-list'),
+            reverse('profile-detail', args=[profile_id]),
+            reverse('profile-download', args=[profile_id]),
+        ):
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+    
+    def test_list_and_download(self):
+        profile_id = self.profile()['X-Profile-Id']
+        self.client.force_authenticate(user=self.staff)
+        
+        response = self.client.get(reverse('profile-list'))
+        self.assertEqual([summary['id'] for summary in response.data], [profile_id])
+        self.assertNotIn('functions', response.data[0])
+        
+        response = self.client.get(reverse('profile-detail', args=[profile_id]))
+        self.assertEqual(response.data['path'], '/api/measurement-units/')
+        self.assertTrue(response.data['functions'])
+        
+        response = self.client.get(reverse('profile-download', args=[profile_id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        path = os.path.join(tempfile.mkdtemp(), 'profile.prof')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(b''.join(response.streaming_content))
+        self.assertTrue(pstats.Stats(path).stats)
+        
+        response = self.client.get(reverse('profile-detail', args=['..settings']))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+def has_separate_replica():
+    """Whether the tests run with a replica database that is not a mirror of the primary"""
+    replica = settings.DATABASES.get(settings.DATABASE_REPLICA_ALIAS)
+    return replica is not None and not replica.get('TEST', {}).get('MIRROR')
+
+
+class ReplicaRouterTest(TestCase):
+    """Test the routing decisions of the read-replica router"""
+    
+    def setUp(self):
+        if settings.DATABASE_REPLICA_ALIAS not in settings.DATABASES:
+            # Routing decisions need the alias to exist, not the database
+            self.enterContext(mock.patch.dict(settings.DATABASES, {'replica': settings.DATABASES['default']}))
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.other = User.objects.create_user(username="other", password="testpassword")
+        cache.clear()
+    
+    def request(self, method='get', user=None):
+        request = getattr(self.factory, method)('/')
+        request.user = user or self.user
+        return routing_request(request)
+    
+    def test_reads_outside_requests_use_primary(self):
+        self.assertIsNone(self.router.db_for_read(NutritionData))
+        self.assertIsNone(self.router.db_for_read(Recipe))
+    
+    def test_reads_in_read_only_requests(self):
+        with self.request():
+            self.assertEqual(self.router.db_for_read(NutritionData), 'replica')
+            self.assertEqual(self.router.db_for_read(Recipe), 'replica')
+            self.assertIsNone(self.router.db_for_read(User))
+    
+    def test_recipes_are_read_from_primary_in_writing_requests(self):
+        with self.request('post'):
+            self.assertEqual(self.router.db_for_read(NutritionData), 'replica')
+            self.assertIsNone(self.router.db_for_read(Recipe))
+    
+    def test_reads_after_a_write_use_primary(self):
+        with self.request('post'):
+            self.assertEqual(self.router.db_for_write(Recipe), 'default')
+            self.assertEqual(self.router.db_for_read(NutritionData), 'default')
+        
+        # The user stays pinned to the primary for a while; other users are not
+        with self.request():
+            self.assertEqual(self.router.db_for_read(Recipe), 'default')
+        with self.request(user=self.other):
+            self.assertEqual(self.router.db_for_read(Recipe), 'replica')
+        
+        cache.delete(pin_key(self.user.pk))
+        with self.request():
+            self.assertEqual(self.router.db_for_read(Recipe), 'replica')
+    
+    def test_primary_reads(self):
+        with self.request(), primary_reads():
+            self.assertEqual(self.router.db_for_read(NutritionData), 'default')
+            self.assertEqual(self.router.db_for_read(Recipe), 'default')
+    
+    @override_settings(DATABASE_REPLICA_ALIAS='missing')
+    def test_no_replica_configured(self):
+        with self.request():
+            self.assertIsNone(self.router.db_for_read(NutritionData))
+            self.assertIsNone(self.router.db_for_write(NutritionData))
+
+
+@skipUnless(has_separate_replica(), "needs a separate replica database")
+class ReplicaRoutingTest(TestCase):
+    """Test the routing of API requests between two databases"""
+    # The test runner sets up every database listed here, skipped or not
+    databases = {'default', 'replica'} if has_separate_replica() else {'default'}
+    
+    def setUp(self):
+        cache.clear()
+        response_cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.force_authenticate(user=self.user)
+        for database, calories in (('default', 52), ('replica', 50)):
+            food_group = FoodGroup.objects.using(database).create(name="Fruits")
+            NutritionData.objects.using(database).create(
+                name="Apple", food_group=food_group, calories=calories, protein=0.3, carbohydrates=14, fat=0.2
+            )
+    
+    def test_recipes_are_read_from_replica(self):
+        # bulk_create(), as the signal creating the user's profile would write it to the primary
+        [owner] = User.objects.using('replica').bulk_create([User(pk=self.user.pk, username=self.user.username)])
+        Recipe.objects.using('replica').create(title="Replica Recipe", user=owner, servings=1)
+        response = self.client.get(reverse('recipe-list'))
+        self.assertEqual([recipe['title'] for recipe in response.data['results']], ['Replica Recipe'])
+    
+    def test_cached_responses_and_the_catalog_are_read_from_primary(self):
+        # Both are kept under the primary's dataset version
+        response = self.client.get(reverse('nutritiondata-list'))
+        self.assertEqual(response.data['results'][0]['calories'], 52)
+        apple = NutritionData.objects.get(name="Apple")
+        response = self.client.post(reverse('nutritiondata-calculate'), {
+            'recipes': [{'ingredients': [[apple.pk, 100, 'g']]}]
+        }, format='json')
+        self.assertAlmostEqual(response.data['results'][0]['totals']['calories'], 52)
+    
+    def test_users_read_their_own_writes(self):
+        data = {'title': 'Fresh Recipe', 'instructions': 'Mix', 'servings': 2}
+        self.assertEqual(self.client.post(reverse('recipe-list'), data).status_code, status.HTTP_201_CREATED)
+        
+        response = self.client.get(reverse('recipe-list'))
+        self.assertEqual([recipe['title'] for recipe in response.data['results']], ['Fresh Recipe'])
+        
+        # Another user's listing is served by the replica, which has not caught up
+        other = APIClient()
+        other.force_authenticate(user=User.objects.create_user(username="other", password="testpassword"))
+        self.assertEqual(other.get(reverse('recipe-list')).data['results'], [])
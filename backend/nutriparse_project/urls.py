@@ -3,24 +3,35 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from rest_framework.routers import DefaultRouter
-from nutrition.views import FoodGroupViewSet, NutritionDataViewSet, MeasurementUnitViewSet
+from nutrition.views import FoodGroupViewSet, NutritionDataViewSet, MeasurementUnitViewSet, FoodConversionViewSet
+from nutrition.async_views import search_nutrition_data
 from recipes.views import RecipeViewSet, TagViewSet
+from recipes.async_views import parse_recipe
 from users.views import UserViewSet, CustomAuthToken
+from .views import metrics, profile_list, profile_detail, profile_download
 
 # Create a router and register our viewsets
 router = DefaultRouter()
 router.register(r'food-groups', FoodGroupViewSet)
 router.register(r'nutrition-data', NutritionDataViewSet)
 router.register(r'measurement-units', MeasurementUnitViewSet)
+router.register(r'food-conversions', FoodConversionViewSet)
 router.register(r'recipes', RecipeViewSet)
 router.register(r'tags', TagViewSet)
 router.register(r'users', UserViewSet)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    # Async variants of the parse and search endpoints, for ASGI deployments
+    path('api/async/recipes/parse/', parse_recipe, name='recipe-parse-async'),
+    path('api/async/nutrition-data/search/', search_nutrition_data, name='nutritiondata-search-async'),
     path('api/', include(router.urls)),
     path('api/auth/', include('rest_framework.urls')),
     path('api/token-auth/', CustomAuthToken.as_view()),
+    path('metrics', metrics, name='metrics'),
+    path('api/profiles/', profile_list, name='profile-list'),
+    path('api/profiles/<str:profile_id>/', profile_detail, name='profile-detail'),
+    path('api/profiles/<str:profile_id>/download/', profile_download, name='profile-download'),
 ]
 
 # Serve media files in development
@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from .metrics import REGISTRY, CONTENT_TYPE
+from .profiling import get_profile_store
+
+
+def metrics(request):
+    """
+    Metrics of this process in the Prometheus text format, for the
+    addresses in METRICS_ALLOWED_IPS only
+    """
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    return HttpResponse(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def profile_list(request):
+    """
+    Stored request profiles, newest first
+    """
+    return Response(get_profile_store().list())
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def profile_detail(request, profile_id):
+    """
+    A stored profile with its hottest functions
+    """
+    summary = get_profile_store().get(profile_id)
+    if summary is None:
+        raise Http404
+    return Response(summary)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def profile_download(request, profile_id):
+    """
+    The raw pstats dump of a stored profile
+    """
+    path = get_profile_store().raw_path(profile_id)
+    if path is None:
+        raise Http404
+    return FileResponse(
+        open(path, 'rb'), as_attachment=True, filename=f"{profile_id}.prof",
+        content_type='application/octet-stream'
+    )
\ No newline at end of file
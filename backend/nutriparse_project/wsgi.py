@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nutriparse_project.settings')
 
 application = get_wsgi_application()
+
+# Load the food catalog before the first request
+from nutrition.catalog import preload_food_catalog  # noqa: E402
+
+preload_food_catalog()
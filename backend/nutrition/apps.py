@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class NutritionConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'nutrition'
+
+    def ready(self):
+        import nutrition.signals  # noqa
+        import nutrition.metrics  # noqa
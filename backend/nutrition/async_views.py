@@ -0,0 +1,33 @@
+from rest_framework import status
+from nutriparse_project.async_api import async_api_view, json_response
+from nutriparse_project.metrics import record_cache_lookup
+
+from .cache import response_cache, make_cache_key
+from .catalog import aget_food_catalog
+from .serializers import FoodRecordSerializer, NutritionSearchSerializer
+from .versioning import aget_dataset_version
+
+
+@async_api_view(['POST'], authenticated=False)
+async def search_nutrition_data(request):
+    """
+    Async variant of NutritionDataViewSet.search, sharing its cached responses
+    """
+    serializer = NutritionSearchSerializer(data=request.data)
+    if not serializer.is_valid():
+        return json_response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+    query_terms = serializer.validated_data['query'].strip().lower().split()
+    limit = serializer.validated_data.get('limit', 20)
+
+    # The cache key of NutritionDataViewSet.search ('<basename>:<action>')
+    key = make_cache_key('nutritiondata:search', {'query': query_terms, 'limit': limit})
+    version = await aget_dataset_version()
+
+    data = await response_cache.aget(key, version=version)
+    record_cache_lookup('nutrition_response', data is not None)
+    if data is None:
+        catalog = await aget_food_catalog(version)
+        data = FoodRecordSerializer(catalog.search(query_terms, limit), many=True).data
+        await response_cache.aset(key, data, version=version)
+    return json_response(data)
@@ -0,0 +1,27 @@
+import hashlib
+import json
+from django.core.cache import caches
+
+# Cache holding serialized nutrition responses, keyed on the dataset version
+response_cache = caches['nutrition']
+
+
+def normalize_params(params):
+    """
+    Normalize request parameters so equivalent requests share a cache entry:
+    keys are sorted, values are stripped, lower-cased and whitespace-collapsed
+    """
+    normalized = {}
+    for key, value in params.items():
+        values = value if isinstance(value, (list, tuple)) else [value]
+        values = [' '.join(str(v).lower().split()) for v in values]
+        normalized[key] = values[0] if len(values) == 1 else sorted(values)
+    return dict(sorted(normalized.items()))
+
+
+def make_cache_key(prefix, params):
+    """Build a cache key from a prefix and a dict of request parameters"""
+    digest = hashlib.sha1(
+        json.dumps(normalize_params(params), sort_keys=True).encode('utf-8')
+    ).hexdigest()
+    return f"nutrition:{prefix}:{digest}"
@@ -0,0 +1,259 @@
+"""
+Read-only, in-process catalog of the nutrition table.
+
+The matcher, the food search and the nutrition calculation read foods from
+here instead of materializing NutritionData instances. Foods are held as
+FoodRecord objects with __slots__ and only the fields those paths use; their
+nutrients live in one float64 column table. The catalog is reloaded when the
+dataset version changes, from the nutrition snapshot (NUTRITION_SNAPSHOT_PATH)
+while it is current, else from the database in one query. Database loads
+read the primary, never a lagging read replica, as the catalog is labelled
+with the primary's dataset version.
+"""
+import logging
+from array import array
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from .conversions import UnitConverter
+from .metrics import CATALOG_LOADS
+from .models import NutritionData, FoodConversion, MeasurementUnit
+from .snapshot import SnapshotError, food_columns, open_snapshot, search_text
+from .versioning import recent_dataset_version, arecent_dataset_version
+
+logger = logging.getLogger(__name__)
+
+NUTRIENT_COUNT = len(NutritionData.NUTRIENT_FIELDS)
+
+# The current FoodCatalog of this process
+_catalog = None
+
+
+class FoodRecord:
+    """
+    A food of the catalog: a NutritionData row without its model state. The
+    nutrients are read from the catalog's column table.
+    """
+    __slots__ = ('id', 'name', 'common_name', 'food_group_id', 'food_group_name', 'search_text', '_nutrients', '_offset')
+
+    def __init__(self, id, name, common_name, food_group_id, food_group_name, search_text, nutrients, row):
+        self.id = id
+        self.name = name
+        self.common_name = common_name
+        self.food_group_id = food_group_id
+        self.food_group_name = food_group_name
+        self.search_text = search_text
+        self._nutrients = nutrients
+        self._offset = row * NUTRIENT_COUNT
+
+    @property
+    def pk(self):
+        return self.id
+
+    def __repr__(self):
+        return f"<FoodRecord {self.id}: {self.name}>"
+
+
+def _nutrient(index):
+    return property(lambda record: record._nutrients[record._offset + index])
+
+
+for _index, _field in enumerate(NutritionData.NUTRIENT_FIELDS):
+    setattr(FoodRecord, _field, _nutrient(_index))
+
+
+class FoodCatalog:
+    """The foods of one dataset version, indexed by id and by lower-cased name"""
+
+    def __init__(self, version, records, conversions=None, vocabulary=None, source='database'):
+        self.version = version
+        self.source = source
+        # The parser's food vocabulary, when the snapshot holds it
+        self.vocabulary = vocabulary
+        # Foods by id, in id order
+        self.foods = {}
+        # The first food (by id) with each lower-cased name and common name
+        self.by_name = {}
+        self.by_common_name = {}
+        # Grams per unit keyed by (food id, unit id), or a callable loading them
+        self._conversions = conversions
+        self._converter = None
+        for record in records:
+            self.foods[record.id] = record
+            self.by_name.setdefault(record.name.lower(), record)
+            if record.common_name:
+                self.by_common_name.setdefault(record.common_name.lower(), record)
+
+    @classmethod
+    def load(cls, version):
+        """Load the catalog from the snapshot of this version, else from the database"""
+        path = getattr(settings, 'NUTRITION_SNAPSHOT_PATH', None)
+        try:
+            snapshot = open_snapshot(path, version)
+        except SnapshotError:
+            logger.warning("Ignoring the nutrition snapshot", exc_info=True)
+            snapshot = None
+        if snapshot is None:
+            catalog = cls.from_database(version)
+        else:
+            catalog = cls.from_snapshot(version, snapshot)
+        CATALOG_LOADS.inc(source=catalog.source)
+        return catalog
+
+    @classmethod
+    def from_database(cls, version, food_ids=None):
+        """
+        Load every food, or only those in food_ids, in one query; conversions
+        are loaded on first use
+        """
+        nutrients = array('d')
+        # One string object per food group name
+        groups = {}
+        records = []
+        for row in food_columns(food_ids):
+            nutrients.extend(row[6:])
+            records.append(FoodRecord(
+                row[0], row[3], row[4], row[1], groups.setdefault(row[2], row[2]), search_text(*row[3:6]),
+                nutrients, len(records)
+            ))
+        return cls(version, records, conversions=lambda: cls._query_conversions(food_ids))
+
+    @classmethod
+    def from_snapshot(cls, version, snapshot):
+        """Records over the snapshot's mapped nutrient columns"""
+        nutrients = snapshot.section('nutrients', 'd')
+        groups = {int(pk): name for pk, name in snapshot.metadata['food_groups'].items()}
+        records = [
+            FoodRecord(food_id, name, common_name, group_id, groups[group_id], text, nutrients, row)
+            for row, (food_id, group_id, (name, common_name, text)) in enumerate(zip(
+                snapshot.section('ids', 'q'), snapshot.section('food_group_ids', 'q'), snapshot.strings()
+            ))
+        ]
+
+        def conversions():
+            keys = zip(snapshot.section('conversion_food_ids', 'q'), snapshot.section('conversion_unit_ids', 'q'))
+            return dict(zip(keys, snapshot.section('conversion_grams', 'd')))
+
+        return cls(version, records, conversions=conversions, vocabulary=snapshot.vocabulary(), source='snapshot')
+
+    @staticmethod
+    def _query_conversions(food_ids=None):
+        conversions = FoodConversion.objects.using(DEFAULT_DB_ALIAS)
+        if food_ids is not None:
+            conversions = conversions.filter(food_id__in=food_ids)
+        return {
+            (food_id, unit_id): grams_per_unit
+            for food_id, unit_id, grams_per_unit in conversions.values_list('food_id', 'unit_id', 'grams_per_unit')
+        }
+
+    def __len__(self):
+        return len(self.foods)
+
+    def get(self, pk):
+        return self.foods.get(pk)
+
+    def exact_match(self, key):
+        """The food named `key` (lower-cased); names take precedence over common names"""
+        return self.by_name.get(key) or self.by_common_name.get(key)
+
+    def partial_match(self, text):
+        """The first food whose name, common name or search terms contain `text`"""
+        text = text.lower()
+        return next((record for record in self.foods.values() if text in record.search_text), None)
+
+    def search(self, query_terms, limit):
+        """
+        Up to `limit` foods whose name, common name or search terms contain any
+        of the lower-cased query terms
+        """
+        results = []
+        for record in self.foods.values():
+            if any(term in record.search_text for term in query_terms):
+                results.append(record)
+                if len(results) >= limit:
+                    break
+        return results
+
+    def nutrient_totals(self, items):
+        """
+        (grams, totals, skipped) of (food id, quantity, unit) items: the total
+        weight, the total of every nutrient in NutritionData.NUTRIENT_FIELDS
+        order, and the indexes of the items skipped because their food is not
+        in the catalog or their unit does not convert to grams
+        """
+        converter = self.converter
+        weight = 0.0
+        totals = [0.0] * NUTRIENT_COUNT
+        skipped = []
+        for index, (food_id, quantity, unit) in enumerate(items):
+            record = self.foods.get(food_id)
+            grams = converter.grams(food_id, quantity, unit) if record is not None else None
+            if grams is None:
+                skipped.append(index)
+                continue
+            weight += grams
+            # Nutrients are per 100 g; read straight from the column table
+            proportion = grams / 100
+            offset = record._offset
+            nutrients = record._nutrients[offset:offset + NUTRIENT_COUNT]
+            totals = [total + value * proportion for total, value in zip(totals, nutrients)]
+        return weight, totals, skipped
+
+    @property
+    def conversions(self):
+        """Grams per unit keyed by (food id, unit id), loaded on first use"""
+        if callable(self._conversions):
+            self._conversions = self._conversions()
+        return self._conversions
+
+    @property
+    def converter(self):
+        """The UnitConverter of this dataset version, built on first use"""
+        if self._converter is None:
+            units = MeasurementUnit.objects.using(DEFAULT_DB_ALIAS).values_list('pk', 'name', 'abbreviation')
+            self._converter = UnitConverter(self.conversions, units)
+        return self._converter
+
+
+def get_food_catalog(version=None):
+    """
+    The catalog of the current dataset version, reloaded when the version
+    changes. The version is checked at most every
+    NUTRITION_CATALOG_REVALIDATE_SECONDS; callers that have just read it can
+    pass it.
+    """
+    global _catalog
+    # The version is read first, so data changed during the load leaves the catalog outdated
+    if version is None:
+        version = recent_dataset_version(settings.NUTRITION_CATALOG_REVALIDATE_SECONDS)
+    catalog = _catalog
+    if catalog is None or catalog.version != version:
+        catalog = _catalog = FoodCatalog.load(version)
+    return catalog
+
+
+async def aget_food_catalog(version=None):
+    """get_food_catalog() for async views"""
+    global _catalog
+    if version is None:
+        version = await arecent_dataset_version(settings.NUTRITION_CATALOG_REVALIDATE_SECONDS)
+    catalog = _catalog
+    if catalog is None or catalog.version != version:
+        catalog = _catalog = await sync_to_async(FoodCatalog.load)(version)
+    return catalog
+
+
+def preload_food_catalog():
+    """
+    Load the catalog while the server starts instead of in its first request.
+    The connection is closed afterwards so forked workers never share it.
+    """
+    try:
+        catalog = get_food_catalog()
+    except DatabaseError:
+        logger.warning("Could not preload the food catalog", exc_info=True)
+        return
+    finally:
+        connections.close_all()
+    logger.info("Loaded %d foods into the food catalog from the %s", len(catalog), catalog.source)
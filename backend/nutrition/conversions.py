@@ -0,0 +1,122 @@
+"""
+Conversion of ingredient quantities to grams.
+
+A quantity in a unit converts with the food's own conversion for that unit
+when there is one. Otherwise weight units convert at their fixed weight,
+volume units through the food's density, derived from any of its volume
+conversions ("1 tbsp = 8 g" also converts cups), and count units (slice,
+clove, ...) through the food's conversion for that count unit.
+
+Units are the canonical names of the recipe parser's UNITS table, or
+MeasurementUnit ids resolved to those names. Every lookup is a dictionary
+access into tables built once per dataset version by FoodCatalog.converter.
+"""
+
+# Millilitres per volume unit
+ML_PER_UNIT = {
+    'teaspoon': 4.92892,
+    'tablespoon': 14.7868,
+    'fluid ounce': 29.5735,
+    'cup': 236.588,
+    'pint': 473.176,
+    'quart': 946.353,
+    'gallon': 3785.41,
+    'milliliter': 1.0,
+    'liter': 1000.0,
+    # By the usual kitchen definitions, 1/16 and 1/8 teaspoon
+    'pinch': 0.308,
+    'dash': 0.616,
+}
+
+# Grams per weight unit
+GRAMS_PER_UNIT = {
+    'pound': 453.592,
+    'ounce': 28.3495,
+    'gram': 1.0,
+    'kilogram': 1000.0,
+}
+
+# Units whose weight depends on the food alone
+COUNT_UNITS = {'slice', 'piece', 'handful', 'bunch', 'can', 'clove'}
+
+# Abbreviations of MeasurementUnit rows named differently from the parser's units
+ABBREVIATIONS = {
+    'tsp': 'teaspoon', 'tbsp': 'tablespoon', 'tbs': 'tablespoon', 'fl oz': 'fluid ounce', 'c': 'cup',
+    'pt': 'pint', 'qt': 'quart', 'gal': 'gallon', 'ml': 'milliliter', 'l': 'liter',
+    'lb': 'pound', 'lbs': 'pound', 'oz': 'ounce', 'g': 'gram', 'kg': 'kilogram',
+}
+
+KNOWN_UNITS = set(ML_PER_UNIT) | set(GRAMS_PER_UNIT) | COUNT_UNITS
+
+
+def canonical_unit(name, abbreviation=''):
+    """The parser's name for a unit ("Cups", "tbsp"), or None for units it does not know"""
+    for text in (name, abbreviation):
+        text = (text or '').strip().lower()
+        if text in KNOWN_UNITS:
+            return text
+        if text.endswith('s') and text[:-1] in KNOWN_UNITS:
+            return text[:-1]
+        if text in ABBREVIATIONS:
+            return ABBREVIATIONS[text]
+    return None
+
+
+class UnitConverter:
+    """Grams per unit of every food, from its conversions and the standard unit measures"""
+
+    def __init__(self, conversions, units):
+        """
+        `conversions` maps (food id, unit id) to grams per unit, `units` holds
+        (id, name, abbreviation) of every MeasurementUnit
+        """
+        self.conversions = conversions
+        # Canonical unit name by MeasurementUnit id, and the ids by name
+        self.unit_names = {}
+        self.unit_ids = {}
+        for pk, name, abbreviation in units:
+            canonical = canonical_unit(name, abbreviation)
+            if canonical is not None:
+                self.unit_names[pk] = canonical
+                self.unit_ids.setdefault(canonical, []).append(pk)
+
+        # Grams per millilitre of each food, averaged over its volume conversions
+        densities = {}
+        # Grams per count unit of each food, keyed by (food id, unit name)
+        self.count_grams = {}
+        for (food_id, unit_id), grams_per_unit in conversions.items():
+            name = self.unit_names.get(unit_id)
+            if name in ML_PER_UNIT:
+                densities.setdefault(food_id, []).append(grams_per_unit / ML_PER_UNIT[name])
+            elif name in COUNT_UNITS:
+                self.count_grams.setdefault((food_id, name), grams_per_unit)
+        self.densities = {food_id: sum(values) / len(values) for food_id, values in densities.items()}
+
+    def grams_per_unit(self, food_id, unit):
+        """
+        Grams in one `unit` (a MeasurementUnit id or a unit name) of the food,
+        or None when it cannot be converted
+        """
+        if isinstance(unit, str):
+            name = canonical_unit(unit)
+            for unit_id in self.unit_ids.get(name, ()):
+                grams = self.conversions.get((food_id, unit_id))
+                if grams is not None:
+                    return grams
+        else:
+            grams = self.conversions.get((food_id, unit))
+            if grams is not None:
+                return grams
+            name = self.unit_names.get(unit)
+
+        if name in GRAMS_PER_UNIT:
+            return GRAMS_PER_UNIT[name]
+        if name in ML_PER_UNIT:
+            density = self.densities.get(food_id)
+            return ML_PER_UNIT[name] * density if density is not None else None
+        return self.count_grams.get((food_id, name))
+
+    def grams(self, food_id, quantity, unit):
+        """`quantity` of `unit` of the food in grams, or None when it cannot be converted"""
+        grams_per_unit = self.grams_per_unit(food_id, unit)
+        return quantity * grams_per_unit if grams_per_unit is not None else None
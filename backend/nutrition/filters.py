@@ -0,0 +1,31 @@
+from rest_framework import filters
+from rest_framework.exceptions import ValidationError
+
+
+class NutrientRangeFilter(filters.BaseFilterBackend):
+    """
+    Filter a queryset on nutrient ranges given as `min_<name>` and
+    `max_<name>` query parameters, e.g. `?max_calories=500&min_protein=30`.
+
+    Views declare the filterable nutrients with `range_filter_fields`,
+    a mapping of parameter names to model fields.
+    """
+    def get_range_filters(self, request, view):
+        range_filters = {}
+        for name, field in getattr(view, 'range_filter_fields', {}).items():
+            for prefix, lookup in (('min', 'gte'), ('max', 'lte')):
+                param = f"{prefix}_{name}"
+                value = request.query_params.get(param)
+                if value in (None, ''):
+                    continue
+                try:
+                    range_filters[f"{field}__{lookup}"] = float(value)
+                except ValueError:
+                    raise ValidationError({param: 'A valid number is required.'})
+        return range_filters
+
+    def filter_queryset(self, request, queryset, view):
+        range_filters = self.get_range_filters(request, view)
+        if range_filters:
+            queryset = queryset.filter(**range_filters)
+        return queryset
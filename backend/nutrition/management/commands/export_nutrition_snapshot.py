@@ -0,0 +1,39 @@
+import os
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from nutrition.snapshot import SnapshotError, write_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Export the nutrition dataset to the memory-mapped snapshot read by the food catalog'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            type=str,
+            default=settings.NUTRITION_SNAPSHOT_PATH,
+            help='Path of the snapshot file (defaults to NUTRITION_SNAPSHOT_PATH)'
+        )
+    
+    def handle(self, *args, **options):
+        output = options['output']
+        if not output:
+            raise CommandError('No output path: pass --output or set NUTRITION_SNAPSHOT_PATH')
+        
+        # The parser's vocabulary is stored too, so workers do not rebuild it
+        from recipes.parser import vocabulary_words
+        from nutrition.catalog import FoodCatalog
+        
+        start = time.perf_counter()
+        try:
+            foods = FoodCatalog.from_database(None).foods.values()
+            metadata = write_snapshot(output, vocabulary_words(foods))
+        except (OSError, SnapshotError) as e:
+            raise CommandError(f'Could not write the snapshot: {e}')
+        duration = time.perf_counter() - start
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {metadata['foods']} foods and {metadata['conversions']} conversions to {output} "
+            f"({os.path.getsize(output) / 2 ** 20:.1f} MiB in {duration:.2f} s)"
+        ))
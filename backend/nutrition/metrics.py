@@ -0,0 +1,36 @@
+from nutriparse_project.metrics import REGISTRY, Counter, Gauge
+
+LOADER_ROWS = Gauge('nutriparse_loader_last_run_rows', 'Food items processed by the last nutrition data load')
+LOADER_SECONDS = Gauge('nutriparse_loader_last_run_seconds', 'Duration of the last nutrition data load')
+LOADER_THROUGHPUT = Gauge(
+    'nutriparse_loader_last_run_rows_per_second', 'Throughput of the last nutrition data load'
+)
+LOADER_TIMESTAMP = Gauge(
+    'nutriparse_loader_last_run_timestamp_seconds', 'Unix time the last nutrition data load finished'
+)
+
+CATALOG_LOADS = Counter(
+    'nutriparse_food_catalog_loads_total', 'Food catalog loads by source (snapshot or database)', ['source']
+)
+
+
+def record_loader_run(rows, seconds):
+    """
+    Store the stats of a nutrition data load. The loader runs as a management
+    command, so they go to the database for the web processes to read.
+    """
+    from .models import LoaderRun
+    LoaderRun.objects.create(rows=rows, seconds=seconds)
+
+
+@REGISTRY.add_collector
+def collect_loader_run():
+    from .models import LoaderRun
+    try:
+        run = LoaderRun.objects.latest()
+    except LoaderRun.DoesNotExist:
+        return
+    LOADER_ROWS.set(run.rows)
+    LOADER_SECONDS.set(run.seconds)
+    LOADER_THROUGHPUT.set(run.rows / run.seconds if run.seconds else 0)
+    LOADER_TIMESTAMP.set(run.finished_at.timestamp())
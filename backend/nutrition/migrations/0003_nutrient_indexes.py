@@ -0,0 +1,41 @@
+# Generated by Django 5.2.1 on 2026-10-19 06:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nutrition', '0002_dataset_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='nutritiondata',
+            index=models.Index(fields=['calories'], name='nutrition_calories_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='nutritiondata',
+            index=models.Index(fields=['protein'], name='nutrition_protein_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='nutritiondata',
+            index=models.Index(fields=['carbohydrates'], name='nutrition_carbohydrates_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='nutritiondata',
+            index=models.Index(fields=['fat'], name='nutrition_fat_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='nutritiondata',
+            index=models.Index(fields=['fiber'], name='nutrition_fiber_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='nutritiondata',
+            index=models.Index(fields=['sugar', 'protein'], name='nutrition_sugar_protein_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='nutritiondata',
+            index=models.Index(condition=models.Q(('sugar__lte', 5)), fields=['-fiber'], name='nutrition_low_sugar_fiber_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.1 on 2026-10-19 08:58
+
+import secrets
+
+from django.db import migrations, models
+
+
+def create_version(apps, schema_editor):
+    DatasetVersion = apps.get_model('nutrition', 'DatasetVersion')
+    DatasetVersion.objects.using(schema_editor.connection.alias).get_or_create(
+        pk=1, defaults={'version': secrets.randbits(62)}
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nutrition', '0003_nutrient_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DatasetVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(create_version, migrations.RunPython.noop),
+    ]
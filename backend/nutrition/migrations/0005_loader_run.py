@@ -0,0 +1,25 @@
+# Generated by Django 5.2.1 on 2026-10-19 09:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nutrition', '0004_dataset_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoaderRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rows', models.PositiveIntegerField()),
+                ('seconds', models.FloatField()),
+                ('finished_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'get_latest_by': 'finished_at',
+            },
+        ),
+    ]
@@ -4,6 +4,7 @@ from django.db import models
 class FoodGroup(models.Model):
     """Food categories like Fruits, Vegetables, Grains, etc."""
     name = models.CharField(max_length=100, unique=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return self.name
@@ -59,11 +60,34 @@ class NutritionData(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    # Nutrient columns, all expressed per 100g
+    NUTRIENT_FIELDS = (
+        'calories', 'protein', 'carbohydrates', 'fat', 'fiber', 'sugar',
+        'vitamin_a', 'vitamin_c', 'vitamin_d', 'vitamin_e', 'vitamin_k',
+        'thiamin', 'riboflavin', 'niacin', 'vitamin_b6', 'folate', 'vitamin_b12',
+        'calcium', 'iron', 'magnesium', 'phosphorus', 'potassium', 'sodium', 'zinc',
+        'cholesterol', 'saturated_fat', 'monounsaturated_fat', 'polyunsaturated_fat', 'trans_fat',
+    )
+    
     class Meta:
         verbose_name_plural = "Nutrition Data"
         indexes = [
             models.Index(fields=['name']),
             models.Index(fields=['common_name']),
+            # Range filters and ordering on the macronutrients
+            models.Index(fields=['calories'], name='nutrition_calories_idx'),
+            models.Index(fields=['protein'], name='nutrition_protein_idx'),
+            models.Index(fields=['carbohydrates'], name='nutrition_carbohydrates_idx'),
+            models.Index(fields=['fat'], name='nutrition_fat_idx'),
+            models.Index(fields=['fiber'], name='nutrition_fiber_idx'),
+            # Serves sugar-only filters as well as the common low-sugar, high-protein query
+            models.Index(fields=['sugar', 'protein'], name='nutrition_sugar_protein_idx'),
+            # Low-sugar foods ordered by fiber
+            models.Index(
+                fields=['-fiber'],
+                name='nutrition_low_sugar_fiber_idx',
+                condition=models.Q(sugar__lte=5),
+            ),
         ]
     
     def __str__(self):
@@ -81,6 +105,7 @@ class MeasurementUnit(models.Model):
     name = models.CharField(max_length=50)
     abbreviation = models.CharField(max_length=10)
     type = models.CharField(max_length=10, choices=TYPE_CHOICES)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         unique_together = ('name', 'type')
@@ -94,9 +119,37 @@ class FoodConversion(models.Model):
     food = models.ForeignKey(NutritionData, on_delete=models.CASCADE, related_name='conversions')
     unit = models.ForeignKey(MeasurementUnit, on_delete=models.CASCADE)
     grams_per_unit = models.FloatField(help_text="Weight in grams for one unit")
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         unique_together = ('food', 'unit')
     
     def __str__(self):
-        return f"{self.food.name}: 1 {self.unit.name} = {self.grams_per_unit}g"
\ No newline at end of file
+        return f"{self.food.name}: 1 {self.unit.name} = {self.grams_per_unit}g"
+
+class DatasetVersion(models.Model):
+    """
+    The version of the nutrition reference data: a single row, bumped in the
+    same transaction as every change to it (see nutrition.versioning)
+    """
+    version = models.BigIntegerField()
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Nutrition dataset version {self.version}"
+
+
+class LoaderRun(models.Model):
+    """
+    Stats of a nutrition data load, kept in the database so every web process
+    can expose the last one on /metrics
+    """
+    rows = models.PositiveIntegerField()
+    seconds = models.FloatField()
+    finished_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        get_latest_by = 'finished_at'
+    
+    def __str__(self):
+        return f"{self.rows} food items in {self.seconds:.1f}s"
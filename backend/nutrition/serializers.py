@@ -1,3 +1,5 @@
+import math
+from django.conf import settings
 from rest_framework import serializers
 from .models import FoodGroup, NutritionData, MeasurementUnit, FoodConversion
 
@@ -20,7 +22,7 @@ class FoodConversionSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = FoodConversion
-        fields = ['id', 'unit', 'unit_name', 'unit_abbreviation', 'grams_per_unit']
+        fields = ['id', 'food', 'unit', 'unit_name', 'unit_abbreviation', 'grams_per_unit']
 
 
 class NutritionDataSerializer(serializers.ModelSerializer):
@@ -52,6 +54,18 @@ class NutritionDataLightSerializer(serializers.ModelSerializer):
         ]
 
 
+class FoodRecordSerializer(serializers.Serializer):
+    """The fields of NutritionDataLightSerializer for the food catalog's records"""
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    food_group_name = serializers.CharField()
+    calories = serializers.FloatField()
+    protein = serializers.FloatField()
+    carbohydrates = serializers.FloatField()
+    fat = serializers.FloatField()
+    fiber = serializers.FloatField()
+
+
 class NutritionSearchSerializer(serializers.Serializer):
     """Serializer for the nutrition search endpoint"""
     query = serializers.CharField(required=True, help_text="Food name to search for")
@@ -60,4 +74,65 @@ class NutritionSearchSerializer(serializers.Serializer):
     def validate_limit(self, value):
         if value < 1 or value > 100:
             raise serializers.ValidationError("Limit must be between 1 and 100")
-        return value
\ No newline at end of file
+        return value
+
+class IngredientListField(serializers.Field):
+    """
+    An ingredient list of the calculate endpoint: {"ingredients": [[food id,
+    quantity, unit], ...], "servings": n}, where unit is a MeasurementUnit id
+    or a unit name. Validated in one pass, as a request holds thousands.
+    """
+    MAX_QUANTITY = 100000
+    MAX_SERVINGS = 1000
+    
+    default_error_messages = {
+        'invalid': 'Expected an object with an "ingredients" list and "servings".',
+        'servings': 'Servings must be a number between 1 and {max_servings}.',
+        'too_long': 'No more than {max_length} ingredients per list.',
+        'ingredient': 'Ingredient {index} must be [food id, quantity, unit] with a quantity between 0 and {max_quantity}.',
+    }
+    
+    @staticmethod
+    def _is_number(value, low, high):
+        # Also rejects inf and nan, which JSON parses from 1e400 and which
+        # would make the totals unserializable
+        return (
+            not isinstance(value, bool) and isinstance(value, (int, float))
+            and math.isfinite(value) and low <= value <= high
+        )
+    
+    def to_internal_value(self, data):
+        if not isinstance(data, dict) or not isinstance(data.get('ingredients'), list):
+            self.fail('invalid')
+        servings = data.get('servings', 1)
+        if not self._is_number(servings, 1, self.MAX_SERVINGS):
+            self.fail('servings', max_servings=self.MAX_SERVINGS)
+        ingredients = data['ingredients']
+        max_length = settings.NUTRITION_CALCULATE_MAX_INGREDIENTS
+        if len(ingredients) > max_length:
+            self.fail('too_long', max_length=max_length)
+        
+        items = []
+        for index, ingredient in enumerate(ingredients):
+            try:
+                food_id, quantity, unit = ingredient
+            except (TypeError, ValueError):
+                self.fail('ingredient', index=index, max_quantity=self.MAX_QUANTITY)
+            if (
+                type(food_id) is not int
+                or not self._is_number(quantity, 0, self.MAX_QUANTITY)
+                or isinstance(unit, bool) or not isinstance(unit, (int, str))
+            ):
+                self.fail('ingredient', index=index, max_quantity=self.MAX_QUANTITY)
+            items.append((food_id, quantity, unit))
+        return {'ingredients': items, 'servings': servings}
+
+
+class NutritionCalculationSerializer(serializers.Serializer):
+    """Serializer for the nutrition calculation endpoint"""
+    recipes = serializers.ListField(
+        child=IngredientListField(),
+        allow_empty=False,
+        max_length=settings.NUTRITION_CALCULATE_MAX_RECIPES,
+        help_text="Ingredient lists to calculate the nutrition of"
+    )
@@ -0,0 +1,28 @@
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import FoodGroup, NutritionData, MeasurementUnit, FoodConversion
+from .versioning import bump_dataset_version
+
+
+@receiver(post_save, sender=FoodGroup)
+@receiver(post_save, sender=NutritionData)
+@receiver(post_save, sender=MeasurementUnit)
+@receiver(post_save, sender=FoodConversion)
+@receiver(post_delete, sender=FoodGroup)
+@receiver(post_delete, sender=NutritionData)
+@receiver(post_delete, sender=MeasurementUnit)
+@receiver(post_delete, sender=FoodConversion)
+def invalidate_nutrition_cache(sender, origin=None, **kwargs):
+    """
+    Bump the dataset version whenever reference data changes, in the same
+    transaction as the change
+    """
+    # Rows deleted along with another one are covered by its bump
+    if origin is not None and _origin_model(origin) is not sender:
+        return
+    bump_dataset_version()
+
+
+def _origin_model(origin):
+    return origin.model if isinstance(origin, QuerySet) else type(origin)
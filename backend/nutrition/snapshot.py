@@ -0,0 +1,197 @@
+"""
+Binary snapshot of the nutrition dataset for the food catalog.
+
+`manage.py export_nutrition_snapshot` writes the foods, their conversions and
+the parser's food vocabulary to one file. Workers map it read-only, so the
+nutrient and conversion columns are shared between processes through the OS
+page cache instead of being loaded from the database by every worker.
+
+Layout: the magic bytes, the length of a JSON metadata block, the metadata,
+then 8-byte aligned sections whose offsets and lengths the metadata lists:
+
+    ids, food_group_ids          int64 per food
+    nutrients                    float64 per food and NutritionData.NUTRIENT_FIELDS
+    strings                      UTF-8 name, common name and search text per food, NUL-separated
+    conversion_food_ids,
+    conversion_unit_ids          int64 per conversion
+    conversion_grams             float64 per conversion
+    vocabulary                   UTF-8 words, newline-separated
+
+The metadata also holds the dataset version (nutrition.versioning) the
+snapshot was taken at; a snapshot is only used for a catalog of that version.
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+
+from .models import FoodGroup, NutritionData, FoodConversion
+from .versioning import get_dataset_version
+
+MAGIC = b'NUTRSNAP'
+FORMAT_VERSION = 2
+
+_HEADER = struct.Struct('<8sI')
+_ALIGNMENT = 8
+
+
+class SnapshotError(Exception):
+    """The snapshot is missing, unreadable or of another format"""
+
+
+def food_columns(food_ids=None):
+    """
+    Rows of (id, food_group_id, food group name, name, common_name,
+    search_terms, *nutrients) in id order, in one query to the primary;
+    of the given foods only when food_ids is set
+    """
+    foods = NutritionData.objects.using(DEFAULT_DB_ALIAS)
+    if food_ids is not None:
+        foods = foods.filter(pk__in=food_ids)
+    return foods.order_by('pk').values_list(
+        'id', 'food_group_id', 'food_group__name', 'name', 'common_name', 'search_terms',
+        *NutritionData.NUTRIENT_FIELDS
+    )
+
+
+def search_text(name, common_name, search_terms):
+    """The lower-cased text the food search and partial matches look in"""
+    return '\n'.join((name, common_name or '', search_terms or '')).lower()
+
+
+def write_snapshot(path, vocabulary=()):
+    """
+    Write a snapshot of the current dataset to `path`, replacing it atomically.
+    Returns the snapshot's metadata.
+    """
+    # Read before the rows, so rows changed meanwhile leave the snapshot stale
+    version = get_dataset_version()
+
+    ids, group_ids, nutrients, strings = array('q'), array('q'), array('d'), []
+    for row in food_columns():
+        ids.append(row[0])
+        group_ids.append(row[1])
+        strings.extend((row[3], row[4] or '', search_text(*row[3:6])))
+        nutrients.extend(row[6:])
+
+    conversion_food_ids, conversion_unit_ids, conversion_grams = array('q'), array('q'), array('d')
+    conversions = FoodConversion.objects.using(DEFAULT_DB_ALIAS).values_list('food_id', 'unit_id', 'grams_per_unit')
+    for food_id, unit_id, grams_per_unit in conversions:
+        conversion_food_ids.append(food_id)
+        conversion_unit_ids.append(unit_id)
+        conversion_grams.append(grams_per_unit)
+
+    sections = {
+        'ids': ids.tobytes(),
+        'food_group_ids': group_ids.tobytes(),
+        'nutrients': nutrients.tobytes(),
+        'strings': '\0'.join(strings).encode('utf-8'),
+        'conversion_food_ids': conversion_food_ids.tobytes(),
+        'conversion_unit_ids': conversion_unit_ids.tobytes(),
+        'conversion_grams': conversion_grams.tobytes(),
+        'vocabulary': '\n'.join(sorted(vocabulary)).encode('utf-8'),
+    }
+    metadata = {
+        'format': FORMAT_VERSION,
+        'byteorder': sys.byteorder,
+        'version': version,
+        'exported_at': timezone.now().isoformat(),
+        'foods': len(ids),
+        'conversions': len(conversion_grams),
+        'nutrient_fields': list(NutritionData.NUTRIENT_FIELDS),
+        'food_groups': {
+            str(pk): name for pk, name in FoodGroup.objects.using(DEFAULT_DB_ALIAS).values_list('pk', 'name')
+        },
+    }
+
+    # Section offsets depend on the metadata length, which depends on the offsets:
+    # lay out the sections after a metadata block padded to a fixed size
+    offsets, offset = {}, 0
+    for name, data in sections.items():
+        offsets[name] = [offset, len(data)]
+        offset += _padded(len(data))
+    metadata['sections'] = offsets
+    encoded = json.dumps(metadata).encode('utf-8')
+    start = _padded(_HEADER.size + len(encoded) + 256)
+    for section in offsets.values():
+        section[0] += start
+    encoded = json.dumps(metadata).encode('utf-8')
+    if _HEADER.size + len(encoded) > start:
+        raise SnapshotError("Snapshot metadata outgrew its block")
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    # Written next to the target and renamed, so workers never map a partial file
+    with tempfile.NamedTemporaryFile('wb', dir=directory, delete=False) as f:
+        try:
+            f.write(_HEADER.pack(MAGIC, len(encoded)))
+            f.write(encoded)
+            f.write(b'\0' * (start - _HEADER.size - len(encoded)))
+            for data in sections.values():
+                f.write(data)
+                f.write(b'\0' * (_padded(len(data)) - len(data)))
+        except BaseException:
+            os.unlink(f.name)
+            raise
+    os.replace(f.name, path)
+    return metadata
+
+
+def _padded(size):
+    return (size + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+class Snapshot:
+    """A snapshot mapped read-only into memory"""
+
+    def __init__(self, path):
+        try:
+            with open(path, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            raise SnapshotError(f"Cannot map {path}: {e}") from e
+        try:
+            magic, length = _HEADER.unpack_from(self._mmap)
+            if magic != MAGIC:
+                raise SnapshotError(f"{path} is not a nutrition snapshot")
+            self.metadata = json.loads(self._mmap[_HEADER.size:_HEADER.size + length])
+        except (struct.error, ValueError) as e:
+            raise SnapshotError(f"Cannot read {path}: {e}") from e
+        if (
+            self.metadata.get('format') != FORMAT_VERSION
+            or self.metadata.get('byteorder') != sys.byteorder
+            or self.metadata.get('nutrient_fields') != list(NutritionData.NUTRIENT_FIELDS)
+        ):
+            raise SnapshotError(f"{path} was written in another format")
+        self.path = path
+        self.version = self.metadata['version']
+
+    def section(self, name, typecode=None):
+        """A section as a memoryview of the mapped file, of typecode items if given"""
+        offset, length = self.metadata['sections'][name]
+        view = memoryview(self._mmap)[offset:offset + length]
+        return view.cast(typecode) if typecode else view
+
+    def strings(self):
+        """(name, common name, search text) of every food, in id order"""
+        values = str(self.section('strings'), 'utf-8').split('\0') if self.metadata['foods'] else []
+        return zip(values[0::3], values[1::3], values[2::3])
+
+    def vocabulary(self):
+        words = str(self.section('vocabulary'), 'utf-8')
+        return frozenset(words.split('\n')) if words else frozenset()
+
+
+def open_snapshot(path, version):
+    """The snapshot at `path` if it was taken at dataset version `version`, else None"""
+    if not path or not os.path.exists(path):
+        return None
+    snapshot = Snapshot(path)
+    if snapshot.version != version:
+        return None
+    return snapshot
@@ -1,8 +1,25 @@
-from django.test import TestCase
+import io
+import os
+import tempfile
+import time
+from unittest.mock import patch
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, override_settings
 from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
-from .models import FoodGroup, NutritionData, MeasurementUnit, FoodConversion
+from .models import FoodGroup, NutritionData, MeasurementUnit, FoodConversion, DatasetVersion
+from .cache import response_cache, make_cache_key
+from .catalog import FoodRecord, get_food_catalog
+from .conversions import UnitConverter, canonical_unit
+from .versioning import bump_dataset_version, get_dataset_version
+from .views import FoodGroupViewSet, NutritionDataViewSet, MeasurementUnitViewSet, FoodConversionViewSet
+from nutriparse_project.query_budget import Budget, ViewSetQueryBudgetMixin
 
 
 class FoodGroupModelTest(TestCase):
@@ -103,6 +120,26 @@ class NutritionDataAPITest(TestCase):
         response = self.client.get(self.detail_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['name'], "Test Food")
+    
+    def test_update_returns_saved_food_with_conversions(self):
+        """Test the update response is rendered from the saved row"""
+        unit = MeasurementUnit.objects.create(name="cup", abbreviation="c", type="volume")
+        FoodConversion.objects.create(food=self.nutrition_data, unit=unit, grams_per_unit=120)
+        self.client.force_authenticate(user=User.objects.create_user(username="admin", is_staff=True))
+        response = self.client.patch(self.detail_url, {'calories': 150}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['calories'], 150)
+        self.assertEqual([c['unit_name'] for c in response.data['conversions']], ["cup"])
+    
+    def test_admin_creates_conversion(self):
+        """Test a conversion is created for the food given in the request"""
+        unit = MeasurementUnit.objects.create(name="cup", abbreviation="c", type="volume")
+        self.client.force_authenticate(user=User.objects.create_user(username="admin", is_staff=True))
+        response = self.client.post(reverse('foodconversion-list'), {
+            'food': self.nutrition_data.id, 'unit': unit.id, 'grams_per_unit': 120
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(FoodConversion.objects.filter(food=self.nutrition_data, unit=unit).exists())
 
 
 class NutritionSearchTest(TestCase):
@@ -145,4 +182,651 @@ class NutritionSearchTest(TestCase):
         response = self.client.post(self.search_url, {'query': 'yellow'})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]['name'], "Banana")
\ No newline at end of file
+        self.assertEqual(response.data[0]['name'], "Banana")
+
+
+class NutritionCalculateTest(TestCase):
+    """Test the stateless nutrition calculation endpoint"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        food_group = FoodGroup.objects.create(name="Baking")
+        self.gram = MeasurementUnit.objects.create(name="gram", abbreviation="g", type="weight")
+        self.cup = MeasurementUnit.objects.create(name="cup", abbreviation="c", type="volume")
+        self.flour = NutritionData.objects.create(
+            name="Flour", food_group=food_group, calories=364, protein=10, carbohydrates=76, fat=1, fiber=3, iron=4.6
+        )
+        self.butter = NutritionData.objects.create(
+            name="Butter", food_group=food_group, calories=717, protein=0.9, carbohydrates=0.1, fat=81
+        )
+        FoodConversion.objects.create(food=self.flour, unit=self.cup, grams_per_unit=120)
+        self.url = reverse('nutritiondata-calculate')
+        # Throttle counts live in the default cache
+        cache.clear()
+    
+    def calculate(self, *recipes):
+        return self.client.post(self.url, {'recipes': list(recipes)}, format='json')
+    
+    def test_full_profile_at_other_servings(self):
+        ingredients = [[self.flour.id, 2, self.cup.id], [self.butter.id, 50, 'g']]
+        response = self.calculate({'ingredients': ingredients, 'servings': 4}, {'ingredients': ingredients, 'servings': 6})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        four, six = response.data['results']
+        self.assertAlmostEqual(four['grams'], 290)
+        self.assertAlmostEqual(four['totals']['calories'], 2.4 * 364 + 0.5 * 717)
+        self.assertAlmostEqual(four['totals']['iron'], 2.4 * 4.6)
+        self.assertEqual(set(four['totals']), set(NutritionData.NUTRIENT_FIELDS))
+        self.assertEqual(four['totals'], six['totals'])
+        self.assertAlmostEqual(six['per_serving']['fat'], (2.4 * 1 + 0.5 * 81) / 6)
+        self.assertEqual(four['skipped'], [])
+    
+    def test_matches_saved_recipe_nutrition(self):
+        from recipes.models import Recipe, RecipeIngredient
+        user = User.objects.create_user(username="baker", password="testpassword")
+        recipe = Recipe.objects.create(title="Shortbread", user=user, servings=4)
+        RecipeIngredient.objects.create(recipe=recipe, food=self.flour, quantity=2, unit=self.cup)
+        RecipeIngredient.objects.create(recipe=recipe, food=self.butter, quantity=100, unit=self.gram)
+        recipe.calculate_nutrition()
+        
+        response = self.calculate({
+            'ingredients': [[self.flour.id, 2, self.cup.id], [self.butter.id, 100, self.gram.id]], 'servings': 4
+        })
+        result = response.data['results'][0]
+        self.assertAlmostEqual(result['totals']['calories'], recipe.total_calories)
+        self.assertAlmostEqual(result['per_serving']['protein'], recipe.protein_per_serving)
+    
+    def test_unknown_foods_and_units_are_skipped(self):
+        response = self.calculate({'ingredients': [
+            [self.flour.id, 100, 'gram'], [self.butter.id, 1, self.cup.id], [999999, 1, 'gram'], [self.flour.id, 1, 'bushel']
+        ]})
+        result = response.data['results'][0]
+        self.assertEqual(result['skipped'], [1, 2, 3])
+        self.assertAlmostEqual(result['totals']['calories'], 364)
+        self.assertEqual(result['servings'], 1)
+    
+    def test_invalid_lists(self):
+        response = self.client.post(self.url, {'recipes': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.calculate({'ingredients': [[self.flour.id, -1, 'gram']]})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Ingredient 0', str(response.data))
+        response = self.calculate({'ingredients': [], 'servings': 0})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        with override_settings(NUTRITION_CALCULATE_MAX_INGREDIENTS=1):
+            response = self.calculate({'ingredients': [[self.flour.id, 1, 'gram']] * 2})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_non_finite_and_out_of_range_numbers(self):
+        # JSON numbers that overflow to inf, or servings that make the
+        # per-serving values overflow
+        for body in (
+            f'{{"recipes": [{{"ingredients": [[{self.flour.id}, 1e400, "gram"]]}}]}}',
+            f'{{"recipes": [{{"ingredients": [[{self.flour.id}, 1, "gram"]], "servings": 1e-320}}]}}',
+            f'{{"recipes": [{{"ingredients": [[{self.flour.id}, 1, "gram"]], "servings": 1e400}}]}}',
+            f'{{"recipes": [{{"ingredients": [[{self.flour.id}, NaN, "gram"]]}}]}}',
+        ):
+            response = self.client.post(self.url, body, content_type='application/json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, body)
+        response = self.calculate({'ingredients': [[self.flour.id, 100001, 'gram']]})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.calculate({'ingredients': [[self.flour.id, 1, 'gram']], 'servings': 1001})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    @override_settings(NUTRITION_CALCULATE_RATE='2/minute')
+    def test_requests_are_throttled_per_client(self):
+        recipe = {'ingredients': [[self.flour.id, 1, 'gram']]}
+        for _ in range(2):
+            self.assertEqual(self.calculate(recipe).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.calculate(recipe).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        
+        # Authenticated users are counted apart from their IP
+        self.client.force_authenticate(User.objects.create_user(username="baker", password="testpassword"))
+        self.assertEqual(self.calculate(recipe).status_code, status.HTTP_200_OK)
+    
+    def test_batch_without_food_queries(self):
+        get_food_catalog().converter
+        recipes = [
+            {'ingredients': [[self.flour.id, i, 'gram'], [self.butter.id, 1, self.gram.id]], 'servings': 2}
+            for i in range(5000)
+        ]
+        # A loaded catalog answers after reading the dataset version
+        with self.assertNumQueries(1):
+            response = self.calculate(*recipes)
+        self.assertEqual(len(response.data['results']), 5000)
+        self.assertAlmostEqual(response.data['results'][100]['totals']['carbohydrates'], 0.76 * 100 + 0.001)
+        
+        # One list over the default limit
+        response = self.calculate(*recipes, recipes[0])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ConditionalGetTest(TestCase):
+    """Test ETag and Last-Modified handling on the reference data endpoints"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.food_group = FoodGroup.objects.create(name="Test Food Group")
+        self.nutrition_data = NutritionData.objects.create(
+            name="Test Food",
+            food_group=self.food_group,
+            calories=100,
+            protein=10,
+            carbohydrates=20,
+            fat=5
+        )
+        self.url = reverse('nutritiondata-list')
+        self.detail_url = reverse('nutritiondata-detail', args=[self.nutrition_data.id])
+    
+    def test_response_has_validators(self):
+        """Test that list and detail responses carry ETag and Last-Modified"""
+        for url in [self.url, self.detail_url, reverse('foodgroup-list'),
+                    reverse('measurementunit-list'), reverse('foodconversion-list')]:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(response['ETag'].startswith('"'))
+        self.assertIn('Last-Modified', self.client.get(self.url))
+    
+    def test_if_none_match_returns_304_without_serializing(self):
+        """Test that a matching If-None-Match short-circuits the view"""
+        etag = self.client.get(self.url)['ETag']
+        with patch('nutrition.views.NutritionDataViewSet.get_serializer') as get_serializer:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        get_serializer.assert_not_called()
+    
+    def test_conditional_request_reads_only_the_version(self):
+        """Test that a 304 costs the one dataset version query"""
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+    
+    def test_bulk_load_changes_the_etag(self):
+        """Test that writes without signals change the ETag once they bump the version"""
+        etag = self.client.get(self.url)['ETag']
+        NutritionData.objects.filter(pk=self.nutrition_data.pk).update(calories=90)
+        bump_dataset_version()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+    
+    def test_etag_changes_with_dataset(self):
+        """Test that modifying the dataset invalidates the ETag"""
+        etag = self.client.get(self.url)['ETag']
+        NutritionData.objects.create(
+            name="Other Food",
+            food_group=self.food_group,
+            calories=50,
+            protein=1,
+            carbohydrates=10,
+            fat=0
+        )
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+    
+    def test_etag_depends_on_query(self):
+        """Test that different pages and filters get different ETags"""
+        etag = self.client.get(self.url)['ETag']
+        self.assertNotEqual(self.client.get(self.url, {'search': 'test'})['ETag'], etag)
+
+
+class ResponseCacheTest(TestCase):
+    """Test the versioned response cache for nutrition endpoints"""
+    
+    def setUp(self):
+        response_cache.clear()
+        self.client = APIClient()
+        self.food_group = FoodGroup.objects.create(name="Test Food Group")
+        self.apple = NutritionData.objects.create(
+            name="Apple",
+            common_name="apple",
+            food_group=self.food_group,
+            calories=52,
+            protein=0.3,
+            carbohydrates=14,
+            fat=0.2,
+            search_terms="apple, red apple, green apple"
+        )
+        self.search_url = reverse('nutritiondata-search')
+        self.detail_url = reverse('nutritiondata-detail', args=[self.apple.id])
+    
+    def test_search_is_cached(self):
+        """Test that a repeated search only reads the dataset version"""
+        first = self.client.post(self.search_url, {'query': 'apple'})
+        with self.assertNumQueries(1):
+            second = self.client.post(self.search_url, {'query': '  Apple '})
+        self.assertEqual(first.data, second.data)
+    
+    async def test_async_search_shares_the_cache(self):
+        """Test that the async search serves and fills the same entries as the sync one"""
+        url = reverse('nutritiondata-search-async')
+        sync_response = await sync_to_async(self.client.post)(self.search_url, {'query': 'apple'})
+        with patch('nutrition.catalog.FoodCatalog.search') as search:
+            response = await self.async_client.post(url, {'query': 'Apple'}, content_type='application/json')
+        search.assert_not_called()
+        self.assertEqual(response.json(), sync_response.json())
+        
+        response = await self.async_client.post(url, {'query': 'red'}, content_type='application/json')
+        self.assertEqual([food['name'] for food in response.json()], ["Apple"])
+        with patch('nutrition.catalog.FoodCatalog.search') as search:
+            await sync_to_async(self.client.post)(self.search_url, {'query': 'red'})
+        search.assert_not_called()
+        
+        response = await self.async_client.post(url, {'limit': 500}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.json()), {'query', 'limit'})
+    
+    def test_retrieve_is_cached(self):
+        """Test that a repeated retrieve only reads the dataset version"""
+        self.client.get(self.detail_url)
+        with patch('nutrition.views.NutritionDataViewSet.get_object') as get_object, self.assertNumQueries(1):
+            response = self.client.get(self.detail_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['name'], "Apple")
+        get_object.assert_not_called()
+    
+    def test_dataset_change_bumps_version(self):
+        """Test that saving nutrition data invalidates cached responses"""
+        version = get_dataset_version()
+        self.client.post(self.search_url, {'query': 'apple'})
+        
+        self.apple.name = "Red Apple"
+        self.apple.save()
+        
+        self.assertNotEqual(get_dataset_version(), version)
+        response = self.client.post(self.search_url, {'query': 'apple'})
+        self.assertEqual(response.data[0]['name'], "Red Apple")
+    
+    def test_version_is_shared_through_the_database(self):
+        """Test that a version bumped by another process invalidates this one's entries"""
+        self.client.post(self.search_url, {'query': 'apple'})
+        # What a change committed by another worker leaves: new rows and a new version row
+        NutritionData.objects.filter(pk=self.apple.pk).update(name="Green Apple")
+        DatasetVersion.objects.update(version=F('version') + 1)
+        
+        response = self.client.post(self.search_url, {'query': 'apple'})
+        self.assertEqual(response.data[0]['name'], "Green Apple")
+    
+    def test_cache_key_normalization(self):
+        """Test that equivalent parameters produce the same key"""
+        self.assertEqual(
+            make_cache_key('list', {'search': ' Apple  Pie', 'page': '1'}),
+            make_cache_key('list', {'page': '1', 'search': 'apple pie'})
+        )
+        self.assertNotEqual(
+            make_cache_key('list', {'page': '1'}),
+            make_cache_key('list', {'page': '2'})
+        )
+
+
+class FoodCatalogTest(TestCase):
+    """Test the in-process food catalog"""
+    
+    def setUp(self):
+        self.food_group = FoodGroup.objects.create(name="Fruits")
+        self.apple = NutritionData.objects.create(
+            name="Apple", common_name="apple", food_group=self.food_group,
+            calories=52, protein=0.3, carbohydrates=14, fat=0.2, search_terms="red apple, green apple"
+        )
+        self.juice = NutritionData.objects.create(
+            name="Apple juice", common_name="apple", food_group=self.food_group,
+            calories=46, protein=0.1, carbohydrates=11.3, fat=0.1
+        )
+        self.cup = MeasurementUnit.objects.create(name="cup", abbreviation="c", type="volume")
+    
+    def test_loads_in_one_query(self):
+        """Test that the catalog is loaded in one query and then served from memory"""
+        # The dataset version, then the foods
+        with self.assertNumQueries(2):
+            catalog = get_food_catalog()
+        with self.assertNumQueries(1):
+            self.assertIs(get_food_catalog(), catalog)
+        
+        apple = catalog.get(self.apple.pk)
+        self.assertIsInstance(apple, FoodRecord)
+        self.assertEqual((apple.name, apple.food_group_name, apple.calories), ("Apple", "Fruits", 52))
+        self.assertFalse(hasattr(apple, '__dict__'))
+    
+    def test_reloads_when_the_dataset_changes(self):
+        """Test that the catalog follows the dataset version"""
+        catalog = get_food_catalog()
+        self.apple.calories = 50
+        self.apple.save()
+        FoodConversion.objects.create(food=self.apple, unit=self.cup, grams_per_unit=125)
+        
+        reloaded = get_food_catalog()
+        self.assertIsNot(reloaded, catalog)
+        self.assertEqual(reloaded.get(self.apple.pk).calories, 50)
+        self.assertEqual(reloaded.conversions, {(self.apple.pk, self.cup.pk): 125})
+    
+    @override_settings(NUTRITION_CATALOG_REVALIDATE_SECONDS=60)
+    def test_version_is_rechecked_after_the_revalidation_interval(self):
+        """Test that outside transactions the version is read once per interval"""
+        catalog = get_food_catalog()
+        # Tests run in a transaction, which always reads the version
+        with self.assertNumQueries(1):
+            get_food_catalog()
+        
+        with patch.object(connection, 'in_atomic_block', False):
+            get_food_catalog()
+            with self.assertNumQueries(0):
+                self.assertIs(get_food_catalog(), catalog)
+            with patch('nutrition.versioning.time.monotonic', return_value=time.monotonic() + 60):
+                with self.assertNumQueries(1):
+                    get_food_catalog()
+            
+            # The process's own changes show right away
+            bump_dataset_version()
+            self.assertIsNot(get_food_catalog(), catalog)
+    
+    def test_matching(self):
+        """Test that names take precedence over common names, then the first partial match"""
+        catalog = get_food_catalog()
+        self.assertEqual(catalog.exact_match('apple juice').pk, self.juice.pk)
+        self.assertEqual(catalog.exact_match('apple').pk, self.apple.pk)
+        self.assertEqual(catalog.partial_match('Green').pk, self.apple.pk)
+        self.assertIsNone(catalog.partial_match('banana'))
+        self.assertEqual([food.pk for food in catalog.search(['juice', 'red'], 20)], [self.apple.pk, self.juice.pk])
+        self.assertEqual(len(catalog.search(['apple'], 1)), 1)
+
+
+class UnitConverterTest(TestCase):
+    """Test converting ingredient quantities to grams"""
+    
+    def setUp(self):
+        self.units = [(1, 'cup', 'c'), (2, 'Tablespoons', 'tbsp'), (3, 'clove', 'clove'), (4, 'gram', 'g'), (5, 'medium', 'med')]
+        # Food 10 has a tablespoon and a clove conversion, food 20 a cup and a tablespoon conversion
+        self.converter = UnitConverter({(10, 2): 15, (10, 3): 5, (20, 1): 240, (20, 2): 14.7868 * 2}, self.units)
+    
+    def test_canonical_unit(self):
+        self.assertEqual(canonical_unit('Cups'), 'cup')
+        self.assertEqual(canonical_unit('Tablespoon', 'tbsp'), 'tablespoon')
+        self.assertEqual(canonical_unit('Large', 'lg'), None)
+    
+    def test_exact_conversions_take_precedence(self):
+        self.assertEqual(self.converter.grams_per_unit(20, 1), 240)
+        self.assertEqual(self.converter.grams_per_unit(20, 'cup'), 240)
+    
+    def test_volume_units_convert_through_the_density(self):
+        self.assertAlmostEqual(self.converter.grams_per_unit(10, 1), 236.588 * 15 / 14.7868)
+        self.assertAlmostEqual(self.converter.grams(10, 2, 'teaspoon'), 2 * 4.92892 * 15 / 14.7868)
+        # Densities from several conversions are averaged: (240 / 236.588 + 2) / 2
+        self.assertAlmostEqual(self.converter.densities[20], (240 / 236.588 + 2) / 2)
+    
+    def test_weight_and_count_units(self):
+        self.assertEqual(self.converter.grams(30, 3, 4), 3)
+        self.assertEqual(self.converter.grams(30, 2, 'pound'), 2 * 453.592)
+        self.assertEqual(self.converter.grams(10, 2, 'clove'), 10)
+    
+    def test_unconvertible_units(self):
+        # No density, no count conversion, and a unit the parser does not know
+        self.assertIsNone(self.converter.grams(30, 1, 'cup'))
+        self.assertIsNone(self.converter.grams(20, 1, 3))
+        self.assertIsNone(self.converter.grams(10, 1, 5))
+        self.assertIsNone(self.converter.grams(10, 1, 'handful'))
+    
+    def test_catalog_converter_follows_the_dataset(self):
+        food_group = FoodGroup.objects.create(name="Fruits")
+        apple = NutritionData.objects.create(name="Apple", food_group=food_group, calories=52, protein=0.3, carbohydrates=14, fat=0.2)
+        cup = MeasurementUnit.objects.create(name="cup", abbreviation="c", type="volume")
+        self.assertIsNone(get_food_catalog().converter.grams_per_unit(apple.pk, 'cup'))
+        
+        FoodConversion.objects.create(food=apple, unit=cup, grams_per_unit=125)
+        self.assertEqual(get_food_catalog().converter.grams_per_unit(apple.pk, 'cup'), 125)
+
+
+class NutritionSnapshotTest(TestCase):
+    """Test loading the food catalog from the exported snapshot"""
+    
+    def setUp(self):
+        food_group = FoodGroup.objects.create(name="Fruits")
+        self.apple = NutritionData.objects.create(
+            name="Apples, raw", common_name="apple", food_group=food_group,
+            calories=52, protein=0.3, carbohydrates=14, fat=0.2, fiber=2.4
+        )
+        self.cup = MeasurementUnit.objects.create(name="cup", abbreviation="c", type="volume")
+        FoodConversion.objects.create(food=self.apple, unit=self.cup, grams_per_unit=125)
+        
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'nutrition.snapshot')
+        self.enterContext(override_settings(NUTRITION_SNAPSHOT_PATH=self.path))
+    
+    def export(self):
+        call_command('export_nutrition_snapshot', stdout=io.StringIO())
+        # Reload the catalog; the snapshot is of the current version
+        self.enterContext(patch('nutrition.catalog._catalog', None))
+    
+    def test_catalog_loads_from_the_snapshot(self):
+        self.export()
+        catalog = get_food_catalog()
+        self.assertEqual(catalog.source, 'snapshot')
+        
+        apple = catalog.exact_match('apples, raw')
+        self.assertEqual((apple.pk, apple.food_group_name), (self.apple.pk, "Fruits"))
+        self.assertEqual((apple.calories, apple.fiber, apple.iron), (52, 2.4, 0))
+        self.assertEqual(catalog.search(['apple'], 20), [apple])
+        self.assertEqual(catalog.conversions, {(self.apple.pk, self.cup.pk): 125})
+        self.assertEqual(catalog.vocabulary, {'apple'})
+    
+    def test_stale_snapshot_falls_back_to_the_database(self):
+        self.export()
+        self.apple.calories = 50
+        self.apple.save()
+        
+        catalog = get_food_catalog()
+        self.assertEqual(catalog.source, 'database')
+        self.assertEqual(catalog.get(self.apple.pk).calories, 50)
+    
+    def test_bulk_update_leaves_the_snapshot_stale(self):
+        """Test that writes leaving updated_at alone still outdate the snapshot"""
+        self.export()
+        NutritionData.objects.filter(pk=self.apple.pk).update(calories=50)
+        bump_dataset_version()
+        
+        catalog = get_food_catalog()
+        self.assertEqual(catalog.source, 'database')
+        self.assertEqual(catalog.get(self.apple.pk).calories, 50)
+    
+    def test_unreadable_snapshot_falls_back_to_the_database(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not a snapshot')
+        bump_dataset_version()
+        with self.assertLogs('nutrition.catalog', 'WARNING'):
+            catalog = get_food_catalog()
+        self.assertEqual(catalog.source, 'database')
+        self.assertEqual(catalog.get(self.apple.pk).calories, 52)
+
+
+class NutrientRangeFilterTest(TestCase):
+    """Test range filtering and ordering over nutrient columns"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.food_group = FoodGroup.objects.create(name="Test Food Group")
+        for name, protein, sugar, fiber in [
+            ("Chicken Breast", 31, 0, 0),
+            ("Lentils", 25, 2, 11),
+            ("Protein Bar", 21, 18, 7),
+            ("Apple", 0.3, 10, 2.4),
+        ]:
+            NutritionData.objects.create(
+                name=name,
+                food_group=self.food_group,
+                calories=100,
+                protein=protein,
+                carbohydrates=20,
+                fat=5,
+                sugar=sugar,
+                fiber=fiber
+            )
+        self.url = reverse('nutritiondata-list')
+    
+    def test_filter_high_protein_low_sugar(self):
+        response = self.client.get(self.url, {'min_protein': 20, 'max_sugar': 5, 'ordering': '-fiber'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [food['name'] for food in response.data['results']],
+            ["Lentils", "Chicken Breast"]
+        )
+    
+    def test_order_by_nutrient(self):
+        response = self.client.get(self.url, {'ordering': 'protein'})
+        self.assertEqual(response.data['results'][0]['name'], "Apple")
+    
+    def test_invalid_range_value(self):
+        response = self.client.get(self.url, {'min_protein': 'high'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class NutrientIndexUsageTest(TestCase):
+    """Test that the common nutrient filters are answered from indexes"""
+    
+    def setUp(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest("Index usage checks require PostgreSQL")
+        
+        food_group = FoodGroup.objects.create(name="Test Food Group")
+        NutritionData.objects.bulk_create([
+            NutritionData(
+                name=f"Food {i}",
+                food_group=food_group,
+                calories=i % 900,
+                protein=i % 40,
+                carbohydrates=i % 80,
+                fat=i % 50,
+                sugar=i % 30,
+                fiber=i % 15
+            )
+            for i in range(2000)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE nutrition_nutritiondata")
+            # Small test tables would otherwise always be scanned sequentially
+            cursor.execute("SET LOCAL enable_seqscan = off")
+    
+    def assertUsesIndex(self, queryset, index_name):
+        self.assertIn(index_name, queryset.explain())
+    
+    def test_protein_and_sugar_range(self):
+        self.assertUsesIndex(
+            NutritionData.objects.filter(protein__gte=20, sugar__lte=5),
+            'nutrition_sugar_protein_idx'
+        )
+    
+    def test_low_sugar_ordered_by_fiber(self):
+        self.assertUsesIndex(
+            NutritionData.objects.filter(sugar__lte=5).order_by('-fiber')[:20],
+            'nutrition_low_sugar_fiber_idx'
+        )
+    
+    def test_protein_range(self):
+        self.assertUsesIndex(
+            NutritionData.objects.filter(protein__gte=20),
+            'nutrition_protein_idx'
+        )
+    
+    def test_calorie_range(self):
+        self.assertUsesIndex(
+            NutritionData.objects.filter(calories__lte=500),
+            'nutrition_calories_idx'
+        )
+    
+    def test_order_by_fiber(self):
+        self.assertUsesIndex(
+            NutritionData.objects.order_by('fiber')[:20],
+            'nutrition_fiber_idx'
+        )
+
+
+class LoadNutritionDataTest(TestCase):
+    """Test the load_nutrition_data command"""
+    
+    def test_creates_new_foods(self):
+        MeasurementUnit.objects.create(name="cup", abbreviation="c", type="volume")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'foods.csv')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write("name,food_group,calories,protein,carbohydrates,fat,cup_grams\n")
+                f.write("Oats,Cereal Grains and Pasta,389,16.9,66.3,6.9,81\n")
+            call_command('load_nutrition_data', path, stdout=io.StringIO(), stderr=io.StringIO())
+        
+        oats = NutritionData.objects.get(name="Oats")
+        self.assertEqual(oats.calories, 389)
+        self.assertEqual(oats.food_group.name, "Cereal Grains and Pasta")
+        self.assertEqual(oats.conversions.get().grams_per_unit, 81)
+
+
+class NutritionQueryBudgetTest(ViewSetQueryBudgetMixin, TestCase):
+    """Query budgets of the nutrition endpoints; fixtures have several rows to expose N+1s"""
+    viewsets = [FoodGroupViewSet, NutritionDataViewSet, MeasurementUnitViewSet, FoodConversionViewSet]
+    
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username="admin", password="testpassword", is_staff=True)
+        self.units = [
+            MeasurementUnit.objects.create(name=name, abbreviation=abbreviation, type="volume")
+            for name, abbreviation in (("cup", "c"), ("tablespoon", "tbsp"), ("teaspoon", "tsp"))
+        ]
+        # A unit without conversions, for creating one
+        self.spare_unit = MeasurementUnit.objects.create(name="fluid ounce", abbreviation="fl oz", type="volume")
+        self.groups = [FoodGroup.objects.create(name=name) for name in ("Fruits", "Grains", "Dairy")]
+        self.foods = []
+        for i, group in enumerate(self.groups):
+            food = NutritionData.objects.create(
+                name=f"Food {i}", food_group=group, calories=100, protein=5, carbohydrates=20, fat=1
+            )
+            for unit in self.units:
+                FoodConversion.objects.create(food=food, unit=unit, grams_per_unit=10)
+            self.foods.append(food)
+    
+    def get_budgets(self):
+        group_url = reverse('foodgroup-detail', args=[self.groups[0].id])
+        food_url = reverse('nutritiondata-detail', args=[self.foods[0].id])
+        unit_url = reverse('measurementunit-detail', args=[self.units[0].id])
+        conversion = self.foods[0].conversions.first()
+        conversion_url = reverse('foodconversion-detail', args=[conversion.id])
+        food_data = {
+            'name': 'Budget Food', 'food_group': self.groups[0].id,
+            'calories': 50, 'protein': 1, 'carbohydrates': 10, 'fat': 0
+        }
+        unit_data = {'name': 'pint', 'abbreviation': 'pt', 'type': 'volume'}
+        conversion_data = {'food': self.foods[0].id, 'unit': self.spare_unit.id, 'grams_per_unit': 12}
+        conversion_update = {'food': conversion.food_id, 'unit': conversion.unit_id, 'grams_per_unit': 12}
+        calculation_data = {'recipes': [
+            {'ingredients': [[food.id, 100, 'gram'] for food in self.foods], 'servings': 2}
+        ] * 3}
+        # Changes to foods, units and conversions bump the dataset version and mark the
+        # recipes using them stale, one query each
+        return {
+            (FoodGroupViewSet, 'list'): Budget('get', reverse('foodgroup-list'), 3),
+            (FoodGroupViewSet, 'create'): Budget('post', reverse('foodgroup-list'), 3, {'name': 'Nuts'}, status.HTTP_201_CREATED),
+            (FoodGroupViewSet, 'retrieve'): Budget('get', group_url, 2),
+            (FoodGroupViewSet, 'update'): Budget('put', group_url, 4, {'name': 'Fruit'}),
+            (FoodGroupViewSet, 'partial_update'): Budget('patch', group_url, 4, {'name': 'Fruit'}),
+            (FoodGroupViewSet, 'destroy'): Budget('delete', group_url, 9, status=status.HTTP_204_NO_CONTENT),
+            (NutritionDataViewSet, 'list'): Budget('get', reverse('nutritiondata-list'), 3),
+            (NutritionDataViewSet, 'create'): Budget('post', reverse('nutritiondata-list'), 4, food_data, status.HTTP_201_CREATED),
+            (NutritionDataViewSet, 'retrieve'): Budget('get', food_url, 3),
+            # Updates reload the saved food with its conversions for the response
+            (NutritionDataViewSet, 'update'): Budget('put', food_url, 10, food_data, allow_duplicates=True),
+            (NutritionDataViewSet, 'partial_update'): Budget('patch', food_url, 8, {'calories': 60}, allow_duplicates=True),
+            (NutritionDataViewSet, 'destroy'): Budget('delete', food_url, 8, status=status.HTTP_204_NO_CONTENT),
+            (NutritionDataViewSet, 'search'): Budget('post', reverse('nutritiondata-search'), 2, {'query': 'food'}),
+            # Loads the catalog: its foods, conversions and units
+            (NutritionDataViewSet, 'calculate'): Budget('post', reverse('nutritiondata-calculate'), 3, calculation_data),
+            (MeasurementUnitViewSet, 'list'): Budget('get', reverse('measurementunit-list'), 3),
+            (MeasurementUnitViewSet, 'create'): Budget('post', reverse('measurementunit-list'), 3, unit_data, status.HTTP_201_CREATED),
+            (MeasurementUnitViewSet, 'retrieve'): Budget('get', unit_url, 2),
+            (MeasurementUnitViewSet, 'update'): Budget('put', unit_url, 5, unit_data),
+            (MeasurementUnitViewSet, 'partial_update'): Budget('patch', unit_url, 4, {'abbreviation': 'C'}),
+            (MeasurementUnitViewSet, 'destroy'): Budget('delete', unit_url, 7, status=status.HTTP_204_NO_CONTENT),
+            (FoodConversionViewSet, 'list'): Budget('get', reverse('foodconversion-list'), 3),
+            (FoodConversionViewSet, 'create'): Budget('post', reverse('foodconversion-list'), 6, conversion_data, status.HTTP_201_CREATED),
+            (FoodConversionViewSet, 'retrieve'): Budget('get', conversion_url, 2),
+            (FoodConversionViewSet, 'update'): Budget('put', conversion_url, 6, conversion_update),
+            (FoodConversionViewSet, 'partial_update'): Budget('patch', conversion_url, 4, {'grams_per_unit': 11}),
+            (FoodConversionViewSet, 'destroy'): Budget('delete', conversion_url, 4, status=status.HTTP_204_NO_CONTENT),
+        }
@@ -0,0 +1,21 @@
+from django.conf import settings
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class CalculateRateThrottle(SimpleRateThrottle):
+    """
+    Limit nutrition/calculate requests per user, or per IP for anonymous
+    clients, to NUTRITION_CALCULATE_RATE. The rate is read per request rather
+    than from REST_FRAMEWORK, which DRF binds once at import.
+    """
+    scope = 'nutrition_calculate'
+    
+    def get_rate(self):
+        return settings.NUTRITION_CALCULATE_RATE
+    
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
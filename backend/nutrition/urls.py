@@ -1,10 +1,11 @@
 from django.urls import path
 from rest_framework.routers import DefaultRouter
-from .views import FoodGroupViewSet, NutritionDataViewSet, MeasurementUnitViewSet
+from .views import FoodGroupViewSet, NutritionDataViewSet, MeasurementUnitViewSet, FoodConversionViewSet
 
 router = DefaultRouter()
 router.register(r'food-groups', FoodGroupViewSet)
 router.register(r'nutrition-data', NutritionDataViewSet)
 router.register(r'measurement-units', MeasurementUnitViewSet)
+router.register(r'food-conversions', FoodConversionViewSet)
 
 urlpatterns = router.urls
\ No newline at end of file
@@ -0,0 +1,102 @@
+import secrets
+import time
+from asgiref.sync import sync_to_async
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
+
+from .models import DatasetVersion
+
+
+# The primary key of the DatasetVersion row
+DATASET_VERSION_ID = 1
+
+# (version, time.monotonic()) of this process's last read outside a transaction
+_last_read = None
+
+
+def new_version():
+    """
+    A random version. Versions are never reused, unlike the values of a
+    counter: a rolled-back bump would otherwise hand its number to the next
+    one, while entries cached inside that transaction may still hold it.
+    """
+    return secrets.randbits(62)
+
+
+def _seed_dataset_version():
+    """Create the version row when it is missing"""
+    row, _ = DatasetVersion.objects.using(DEFAULT_DB_ALIAS).get_or_create(
+        pk=DATASET_VERSION_ID, defaults={'version': new_version()}
+    )
+    return row.version, row.updated_at
+
+
+def read_dataset_version():
+    """
+    Return (version, updated_at) of the nutrition dataset.
+
+    The version lives in the database, so every worker process sees the same
+    one, and it is read from the primary, where the changes it versions are
+    committed.
+    """
+    global _last_read
+    row = DatasetVersion.objects.using(DEFAULT_DB_ALIAS).filter(pk=DATASET_VERSION_ID).values_list(
+        'version', 'updated_at'
+    ).first()
+    if row is None:
+        row = _seed_dataset_version()
+    if not connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        _last_read = (row[0], time.monotonic())
+    return row
+
+
+def get_dataset_version():
+    """Return the current version of the nutrition dataset"""
+    return read_dataset_version()[0]
+
+
+async def aget_dataset_version():
+    """get_dataset_version() for async views"""
+    return await sync_to_async(get_dataset_version)()
+
+
+def _reusable_version(max_age):
+    # A transaction may have bumped the version, or see one that was rolled back
+    if max_age <= 0 or _last_read is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        return None
+    version, read_at = _last_read
+    return version if time.monotonic() - read_at < max_age else None
+
+
+def recent_dataset_version(max_age):
+    """
+    The version this process read less than `max_age` seconds ago, or the
+    current one. Other workers' changes show up to `max_age` seconds late.
+    """
+    version = _reusable_version(max_age)
+    return version if version is not None else get_dataset_version()
+
+
+async def arecent_dataset_version(max_age):
+    """recent_dataset_version() for async views"""
+    version = _reusable_version(max_age)
+    return version if version is not None else await aget_dataset_version()
+
+
+def bump_dataset_version():
+    """
+    Invalidate every cached response and catalog by moving to a new dataset
+    version. The row is updated in the current transaction, so other workers
+    see the new version exactly when they can see the changes.
+
+    Signals bump it for changes made through the ORM one row at a time; bulk
+    writes (QuerySet.update(), bulk_create(), raw SQL) have to call this.
+    """
+    global _last_read
+    # This process sees its own changes right away
+    _last_read = None
+    updated = DatasetVersion.objects.using(DEFAULT_DB_ALIAS).filter(pk=DATASET_VERSION_ID).update(
+        version=new_version(), updated_at=timezone.now()
+    )
+    if not updated:
+        _seed_dataset_version()
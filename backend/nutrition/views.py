@@ -1,17 +1,109 @@
-from django.db.models import Q
+import hashlib
+from django.db.models import Prefetch
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
 from rest_framework import viewsets, filters, status
 from rest_framework.decorators import api_view, action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
+from nutriparse_project.metrics import record_cache_lookup
+from nutriparse_project.routers import primary_reads
 
 from .models import FoodGroup, NutritionData, MeasurementUnit, FoodConversion
 from .serializers import (
     FoodGroupSerializer, NutritionDataSerializer, NutritionDataLightSerializer,
-    MeasurementUnitSerializer, FoodConversionSerializer, NutritionSearchSerializer
+    MeasurementUnitSerializer, FoodConversionSerializer, NutritionSearchSerializer, FoodRecordSerializer,
+    NutritionCalculationSerializer
 )
+from .catalog import get_food_catalog
+from .cache import response_cache, make_cache_key
+from .filters import NutrientRangeFilter
+from .throttling import CalculateRateThrottle
+from .versioning import read_dataset_version
 
 
-class FoodGroupViewSet(viewsets.ModelViewSet):
+class DatasetVersionMixin:
+    """Reads the dataset version, and when it changed, once per request"""
+    dataset_version = None
+    dataset_updated_at = None
+    
+    def read_dataset_version(self):
+        if self.dataset_version is None:
+            self.dataset_version, self.dataset_updated_at = read_dataset_version()
+        return self.dataset_version
+
+
+class ConditionalGetMixin(DatasetVersionMixin):
+    """
+    Emit strong ETags and Last-Modified headers for list and retrieve actions,
+    answering conditional requests with 304 before anything is serialized.
+    Both derive from the dataset version, so they cost one primary-key query.
+    """
+    def get_etag(self, request, version):
+        """
+        Combine the dataset version with the request URL and renderer,
+        since pages, filters and formats all produce different bodies
+        """
+        renderer = getattr(request, 'accepted_renderer', None)
+        key = f"{version}:{request.get_full_path()}:{renderer.format if renderer else ''}"
+        return quote_etag(hashlib.sha1(key.encode('utf-8')).hexdigest())
+    
+    def conditional_response(self, request, handler, *args, **kwargs):
+        etag = self.get_etag(request, self.read_dataset_version())
+        last_modified = int(self.dataset_updated_at.timestamp())
+        
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+    
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(request, super().list, *args, **kwargs)
+    
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(request, super().retrieve, *args, **kwargs)
+
+
+class CachedResponseMixin(DatasetVersionMixin):
+    """
+    Cache serialized list, retrieve and search responses in the 'nutrition'
+    cache, keyed on normalized request parameters and the dataset version
+    """
+    def get_cached_response(self, params, handler, *args, **kwargs):
+        """
+        Return a cached response for these parameters, or call the handler
+        and cache its data if it succeeds
+        """
+        key = make_cache_key(f"{self.basename}:{self.action}", params)
+        version = self.read_dataset_version()
+        
+        data = response_cache.get(key, version=version)
+        record_cache_lookup('nutrition_response', data is not None)
+        if data is not None:
+            return Response(data)
+        
+        # The version is the primary's, so the data cached under it must be too
+        with primary_reads():
+            response = handler(*args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            response_cache.set(key, response.data, version=version)
+        return response
+    
+    def list(self, request, *args, **kwargs):
+        # Paginated responses contain absolute URLs, so the host is part of the key
+        params = {**dict(request.query_params.lists()), 'host': request.get_host()}
+        return self.get_cached_response(params, super().list, request, *args, **kwargs)
+    
+    def retrieve(self, request, *args, **kwargs):
+        params = {**dict(request.query_params.lists()), **kwargs}
+        return self.get_cached_response(params, super().retrieve, request, *args, **kwargs)
+
+
+class FoodGroupViewSet(ConditionalGetMixin, CachedResponseMixin, viewsets.ModelViewSet):
     """
     API endpoint for food groups
     """
@@ -30,21 +122,23 @@ class FoodGroupViewSet(viewsets.ModelViewSet):
         return [IsAdminUser()]
 
 
-class NutritionDataViewSet(viewsets.ModelViewSet):
+class NutritionDataViewSet(ConditionalGetMixin, CachedResponseMixin, viewsets.ModelViewSet):
     """
     API endpoint for nutrition data
     """
-    queryset = NutritionData.objects.all()
+    queryset = NutritionData.objects.select_related('food_group')
     serializer_class = NutritionDataSerializer
     permission_classes = [IsAuthenticated]
-    filter_backends = [filters.SearchFilter]
+    filter_backends = [filters.SearchFilter, NutrientRangeFilter, filters.OrderingFilter]
     search_fields = ['name', 'common_name', 'search_terms']
+    range_filter_fields = {field: field for field in NutritionData.NUTRIENT_FIELDS}
+    ordering_fields = ['name'] + list(NutritionData.NUTRIENT_FIELDS)
     
     def get_permissions(self):
         """
         Allow anyone to read nutrition data, but only admins to modify
         """
-        if self.action in ['list', 'retrieve', 'search']:
+        if self.action in ['list', 'retrieve', 'search', 'calculate']:
             return [AllowAny()]
         return [IsAdminUser()]
     
@@ -56,6 +150,22 @@ class NutritionDataViewSet(viewsets.ModelViewSet):
             return NutritionDataLightSerializer
         return NutritionDataSerializer
     
+    def get_queryset(self):
+        """
+        Prefetch conversions and their units for the detail serializer
+        """
+        queryset = super().get_queryset()
+        if self.action != 'list':
+            queryset = queryset.prefetch_related(
+                Prefetch('conversions', queryset=FoodConversion.objects.select_related('unit'))
+            )
+        return queryset
+    
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        # Render the response from the saved row, reloaded with its prefetched relations
+        serializer.instance = self.get_object()
+    
     @action(detail=False, methods=['post'])
     def search(self, request):
         """
@@ -70,26 +180,50 @@ class NutritionDataViewSet(viewsets.ModelViewSet):
             # Split the query into terms for better searching
             query_terms = query.strip().lower().split()
             
-            # Start with an empty Q object
-            q_objects = Q()
-            
-            # Add each term to the Q object
-            for term in query_terms:
-                q_objects |= Q(name__icontains=term)
-                q_objects |= Q(common_name__icontains=term)
-                q_objects |= Q(search_terms__icontains=term)
-            
-            # Apply the filter
-            results = NutritionData.objects.filter(q_objects).distinct()[:limit]
-            
-            # Return serialized results
-            result_serializer = NutritionDataLightSerializer(results, many=True)
-            return Response(result_serializer.data)
+            params = {'query': query_terms, 'limit': limit}
+            return self.get_cached_response(params, self.search_foods, query_terms, limit)
             
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    def search_foods(self, query_terms, limit):
+        """
+        Search the food catalog for a list of lower-cased terms
+        """
+        results = get_food_catalog(self.dataset_version).search(query_terms, limit)
+        
+        # Return serialized results
+        result_serializer = FoodRecordSerializer(results, many=True)
+        return Response(result_serializer.data)
+    
+    @action(detail=False, methods=['post'], throttle_classes=[CalculateRateThrottle])
+    def calculate(self, request):
+        """
+        Calculate the nutrition of a batch of ingredient lists, e.g. a recipe
+        at other servings or with other quantities, without saving anything.
+        Computed from the food catalog, so no query reads the foods. Open to
+        anyone, so throttled per client.
+        """
+        serializer = NutritionCalculationSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        catalog = get_food_catalog()
+        results = []
+        for recipe in serializer.validated_data['recipes']:
+            servings = recipe['servings']
+            grams, totals, skipped = catalog.nutrient_totals(recipe['ingredients'])
+            results.append({
+                'servings': servings,
+                'grams': grams,
+                'totals': dict(zip(NutritionData.NUTRIENT_FIELDS, totals)),
+                'per_serving': {field: total / servings for field, total in zip(NutritionData.NUTRIENT_FIELDS, totals)},
+                # Ingredients of unknown foods or units that do not convert to grams
+                'skipped': skipped,
+            })
+        return Response({'results': results})
 
 
-class MeasurementUnitViewSet(viewsets.ModelViewSet):
+class MeasurementUnitViewSet(ConditionalGetMixin, CachedResponseMixin, viewsets.ModelViewSet):
     """
     API endpoint for measurement units
     """
@@ -106,11 +240,11 @@ class MeasurementUnitViewSet(viewsets.ModelViewSet):
         return [IsAdminUser()]
 
 
-class FoodConversionViewSet(viewsets.ModelViewSet):
+class FoodConversionViewSet(ConditionalGetMixin, CachedResponseMixin, viewsets.ModelViewSet):
     """
     API endpoint for food conversions
     """
-    queryset = FoodConversion.objects.all()
+    queryset = FoodConversion.objects.select_related('unit')
     serializer_class = FoodConversionSerializer
     permission_classes = [IsAuthenticated]
     
@@ -120,4 +254,11 @@ class FoodConversionViewSet(viewsets.ModelViewSet):
         """
         if self.action in ['list', 'retrieve']:
             return [AllowAny()]
-        return [IsAdminUser()]
\ No newline at end of file
+        return [IsAdminUser()]
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ['update', 'partial_update']:
+            # The unique (food, unit) validator compares against instance.food
+            queryset = queryset.select_related('food')
+        return queryset
\ No newline at end of file
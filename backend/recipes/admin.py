@@ -19,7 +19,11 @@ class RecipeAdmin(admin.ModelAdmin):
     list_display = ('title', 'user', 'created_at', 'servings', 'total_calories')
     list_filter = ('created_at', 'user')
     search_fields = ('title', 'description', 'instructions')
-    readonly_fields = ('total_calories', 'total_protein', 'total_carbs', 'total_fat', 'total_fiber')
+    readonly_fields = (
+        'total_calories', 'total_protein', 'total_carbs', 'total_fat', 'total_fiber',
+        'calories_per_serving', 'protein_per_serving', 'carbs_per_serving',
+        'fat_per_serving', 'fiber_per_serving'
+    )
     fieldsets = (
         (None, {
             'fields': ('title', 'user', 'description', 'instructions', 'servings')
@@ -35,7 +39,11 @@ class RecipeAdmin(admin.ModelAdmin):
             'classes': ('collapse',),
         }),
         ('Nutritional Information', {
-            'fields': ('total_calories', 'total_protein', 'total_carbs', 'total_fat', 'total_fiber'),
+            'fields': (
+                'total_calories', 'total_protein', 'total_carbs', 'total_fat', 'total_fiber',
+                'calories_per_serving', 'protein_per_serving', 'carbs_per_serving',
+                'fat_per_serving', 'fiber_per_serving'
+            ),
             'classes': ('collapse',),
         }),
     )
@@ -4,4 +4,7 @@ from django.apps import AppConfig
 class RecipesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipes'
-    verbose_name = 'Recipe Management'
\ No newline at end of file
+    verbose_name = 'Recipe Management'
+
+    def ready(self):
+        import recipes.signals  # noqa
@@ -0,0 +1,59 @@
+from asgiref.sync import sync_to_async
+from rest_framework import status
+from nutriparse_project.async_api import async_api_view, json_response
+
+from .parser import aparse_recipe_text, amatch_ingredients_to_foods
+from .serializers import RecipeParserSerializer, MatchedIngredientSerializer
+from .timing import collect_timings, stage
+from .views import save_parsed_recipe, saved_recipe_data
+from .workers import ParsePoolError
+
+
+@async_api_view(['POST'])
+async def parse_recipe(request):
+    """
+    Async variant of RecipeViewSet.parse: the parse runs off the event loop and
+    the foods are matched with the async ORM
+    """
+    with collect_timings('parse_async', count_queries=False) as timings:
+        response = await _parse_recipe(request)
+    response['Server-Timing'] = timings.server_timing()
+    return response
+
+
+async def _parse_recipe(request):
+    serializer = RecipeParserSerializer(data=request.data)
+    if not serializer.is_valid():
+        return json_response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+    recipe_text = serializer.validated_data['recipe_text']
+    try:
+        parsed_data = await aparse_recipe_text(recipe_text)
+    except ParsePoolError as e:
+        return json_response(
+            {'error': str(e)}, status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '1'}
+        )
+
+    matched_ingredients = await amatch_ingredients_to_foods(parsed_data['ingredients'])
+
+    recipe_data = None
+    if serializer.validated_data.get('save_recipe', False):
+        recipe = await sync_to_async(save_parsed_recipe)(
+            request.user,
+            serializer.validated_data.get('title', 'Untitled Recipe'),
+            recipe_text,
+            serializer.validated_data.get('servings', 1),
+            parsed_data,
+            matched_ingredients,
+        )
+        with stage('serialize'):
+            recipe_data = await sync_to_async(saved_recipe_data)(recipe.pk)
+
+    with stage('serialize'):
+        data = {
+            'parsed_data': parsed_data,
+            'matched_ingredients': MatchedIngredientSerializer(matched_ingredients, many=True).data
+        }
+    if recipe_data is not None:
+        data = {'recipe': recipe_data, **data}
+    return json_response(data)
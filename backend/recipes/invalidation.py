@@ -0,0 +1,175 @@
+"""
+Invalidation of the nutrition cached on recipes.
+
+Recipe.total_* (and the per-serving fields) are derived from the foods,
+conversions and units of the recipe's ingredients. When one of those changes,
+recipes.signals marks the recipes depending on it stale, in the same
+transaction, by setting Recipe.nutrition_stale_since:
+
+    NutritionData       recipes with an ingredient of that food
+    FoodConversion      recipes with an ingredient of the conversion's food
+    MeasurementUnit     recipes with an ingredient in that unit, or of a food
+                        with a conversion in it (its density may change)
+
+After the commit a background pass is scheduled, NUTRITION_RECOMPUTE_DELAY
+seconds later, so a burst of changes (a dataset load) is recomputed once. The
+pass recomputes the stale recipes in batches of NUTRITION_RECOMPUTE_BATCH_SIZE.
+`manage.py recompute_stale_nutrition` runs the same pass, e.g. from cron when
+the delay is None and no background passes run.
+"""
+import logging
+import threading
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Count, F, Min, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from nutriparse_project.metrics import REGISTRY, Counter, Gauge
+from nutrition.catalog import FoodCatalog
+
+from .models import Recipe, RecipeIngredient, nutrition_totals
+
+logger = logging.getLogger(__name__)
+
+STALE_RECIPES = Gauge('nutriparse_recipe_nutrition_stale', 'Recipes whose cached nutrition is stale')
+STALENESS_SECONDS = Gauge(
+    'nutriparse_recipe_nutrition_staleness_seconds', 'Age of the oldest stale recipe nutrition'
+)
+RECOMPUTED_RECIPES = Counter(
+    'nutriparse_recipe_nutrition_recomputed_total', 'Recipes whose stale nutrition was recomputed'
+)
+
+
+def mark_stale(recipes):
+    """
+    Mark the recipes of a queryset stale and schedule a recompute. Recipes
+    that are already stale keep the time they went stale.
+    
+    Already stale recipes are updated too: a recompute_batch may hold them
+    locked after reading the old foods, and an update filtered on
+    nutrition_stale_since__isnull would skip them without waiting for its
+    commit, which then clears the flag. Updating every row waits for the
+    lock and marks the recipe again afterwards.
+    """
+    marked = recipes.update(nutrition_stale_since=Coalesce(F('nutrition_stale_since'), timezone.now()))
+    if marked:
+        transaction.on_commit(scheduler.schedule)
+    return marked
+
+
+def recipes_using_foods(food_ids):
+    return Recipe.objects.filter(pk__in=RecipeIngredient.objects.filter(food_id__in=food_ids).values('recipe_id'))
+
+
+def recipes_using_unit(unit_id):
+    return Recipe.objects.filter(pk__in=RecipeIngredient.objects.filter(
+        Q(unit_id=unit_id) | Q(food__conversions__unit_id=unit_id)
+    ).values('recipe_id'))
+
+
+def recompute_batch(batch_size):
+    """
+    Recompute the oldest stale recipes, up to batch_size, in one transaction.
+    Returns the number recomputed.
+    """
+    with transaction.atomic():
+        # Concurrent passes (one per web process) take different batches
+        recipes = list(
+            Recipe.objects.filter(nutrition_stale_since__isnull=False)
+            .order_by('nutrition_stale_since')
+            .select_for_update(skip_locked=True)
+            .only('pk', 'servings')[:batch_size]
+        )
+        if not recipes:
+            return 0
+
+        items = {recipe.pk: [] for recipe in recipes}
+        for recipe_id, food_id, quantity, unit_id in RecipeIngredient.objects.filter(
+            recipe_id__in=items
+        ).values_list('recipe_id', 'food_id', 'quantity', 'unit_id'):
+            items[recipe_id].append((food_id, quantity, unit_id))
+
+        # The batch's foods and conversions, read in this transaction after the
+        # recipes were locked, so they reflect the changes that marked them. The
+        # process-wide catalog may lag behind by its revalidation interval.
+        food_ids = {food_id for ingredients in items.values() for food_id, _, _ in ingredients if food_id}
+        catalog = FoodCatalog.from_database(None, food_ids)
+        converter = catalog.converter
+        for recipe in recipes:
+            totals = nutrition_totals(
+                ((catalog.get(food_id), quantity, unit_id) for food_id, quantity, unit_id in items[recipe.pk]),
+                converter
+            )
+            recipe.total_calories = totals['calories']
+            recipe.total_protein = totals['protein']
+            recipe.total_carbs = totals['carbs']
+            recipe.total_fat = totals['fat']
+            recipe.total_fiber = totals['fiber']
+            recipe.update_nutrition_per_serving()
+            recipe.nutrition_stale_since = None
+        Recipe.objects.bulk_update(
+            recipes,
+            ['total_calories', 'total_protein', 'total_carbs', 'total_fat', 'total_fiber', 'nutrition_stale_since',
+             *Recipe.PER_SERVING_FIELDS]
+        )
+    RECOMPUTED_RECIPES.inc(len(recipes))
+    return len(recipes)
+
+
+def recompute_stale_nutrition(batch_size=None):
+    """Recompute every stale recipe, batch by batch. Returns the number recomputed."""
+    batch_size = batch_size or settings.NUTRITION_RECOMPUTE_BATCH_SIZE
+    total = 0
+    while True:
+        count = recompute_batch(batch_size)
+        total += count
+        if count < batch_size:
+            return total
+
+
+class RecomputeScheduler:
+    """Runs recompute_stale_nutrition() in a background thread, coalescing requests"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def schedule(self):
+        delay = settings.NUTRITION_RECOMPUTE_DELAY
+        if delay is None:
+            return
+        with self._lock:
+            # A pass is already pending and will pick up these recipes too
+            if self._timer is not None:
+                return
+            self._timer = threading.Timer(delay, self._run)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _run(self):
+        with self._lock:
+            # Recipes marked from now on need another pass
+            self._timer = None
+        try:
+            count = recompute_stale_nutrition()
+            logger.info("Recomputed the nutrition of %d stale recipes", count)
+        except Exception:
+            logger.exception("Recomputing stale recipe nutrition failed")
+        finally:
+            connections.close_all()
+
+
+scheduler = RecomputeScheduler()
+
+
+@REGISTRY.add_collector
+def collect_staleness():
+    try:
+        stale = Recipe.objects.filter(nutrition_stale_since__isnull=False).aggregate(
+            count=Count('pk'), oldest=Min('nutrition_stale_since')
+        )
+    except DatabaseError:
+        logger.warning("Could not count the stale recipes", exc_info=True)
+        return
+    STALE_RECIPES.set(stale['count'])
+    STALENESS_SECONDS.set((timezone.now() - stale['oldest']).total_seconds() if stale['oldest'] else 0)
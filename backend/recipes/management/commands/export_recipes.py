@@ -0,0 +1,62 @@
+import gzip
+import sys
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from recipes.models import Recipe
+from recipes.transfer import export_lines
+
+
+class Command(BaseCommand):
+    help = 'Export recipes with their ingredients and tags as NDJSON, gzip-compressed for .gz files'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'output',
+            type=str,
+            help='Path of the NDJSON file, or - for standard output'
+        )
+        parser.add_argument(
+            '--user',
+            type=str,
+            help='Only export the recipes of this username'
+        )
+        parser.add_argument(
+            '--gzip',
+            action='store_true',
+            help='Compress the output (implied by a .gz path)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=settings.RECIPE_TRANSFER_BATCH_SIZE,
+            help='Recipes read per chunk (defaults to RECIPE_TRANSFER_BATCH_SIZE)'
+        )
+    
+    def handle(self, *args, **options):
+        output = options['output']
+        compress = options['gzip'] or output.endswith('.gz')
+        recipes = Recipe.objects.all()
+        if options['user']:
+            recipes = recipes.filter(user__username=options['user'])
+        
+        start = time.perf_counter()
+        count = 0
+        try:
+            if output == '-':
+                f = gzip.open(sys.stdout.buffer, 'wt', encoding='utf-8') if compress else self.stdout
+            else:
+                f = gzip.open(output, 'wt', encoding='utf-8') if compress else open(output, 'w', encoding='utf-8')
+            try:
+                for line in export_lines(recipes, options['chunk_size']):
+                    f.write(line)
+                    count += 1
+            finally:
+                if f is not self.stdout:
+                    f.close()
+        except OSError as e:
+            raise CommandError(f'Could not write {output}: {e}')
+        duration = time.perf_counter() - start
+        
+        # Keep standard output for the records
+        self.stderr.write(self.style.SUCCESS(f'Exported {count} recipes in {duration:.2f} s'))
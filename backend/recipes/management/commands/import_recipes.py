@@ -0,0 +1,58 @@
+import gzip
+import sys
+import time
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from recipes.transfer import import_recipes
+
+
+class Command(BaseCommand):
+    help = 'Import recipes from an NDJSON export, gzip-compressed or not'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'input',
+            type=str,
+            help='Path of the NDJSON file, or - for standard input'
+        )
+        parser.add_argument(
+            '--user',
+            type=str,
+            help='Username owning every imported recipe, instead of the user named by each record'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.RECIPE_TRANSFER_BATCH_SIZE,
+            help='Recipes written per transaction (defaults to RECIPE_TRANSFER_BATCH_SIZE)'
+        )
+    
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = get_user_model().objects.get(username=options['user'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"No user named {options['user']!r}")
+        
+        start = time.perf_counter()
+        try:
+            raw = sys.stdin.buffer if options['input'] == '-' else open(options['input'], 'rb')
+            try:
+                # Compressed files are recognized by their magic bytes
+                f = gzip.GzipFile(fileobj=raw, mode='rb') if raw.peek(2)[:2] == b'\x1f\x8b' else raw
+                result = import_recipes(f, user=user, batch_size=options['batch_size'])
+            finally:
+                if raw is not sys.stdin.buffer:
+                    raw.close()
+        except (OSError, EOFError) as e:
+            raise CommandError(f"Could not read {options['input']}: {e}")
+        duration = time.perf_counter() - start
+        
+        for error in result['errors']:
+            self.stderr.write(self.style.WARNING(f"Line {error['line']}: {error['error']}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result['recipes']} recipes with {result['ingredients']} ingredients in {duration:.2f} s "
+            f"({result['skipped']} lines skipped, {result['unmatched_foods']} ingredients of unknown foods)"
+        ))
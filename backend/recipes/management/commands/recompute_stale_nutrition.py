@@ -0,0 +1,25 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from recipes.invalidation import recompute_stale_nutrition
+
+
+class Command(BaseCommand):
+    help = 'Recompute the nutrition of recipes marked stale by changes to their foods, conversions or units'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.NUTRITION_RECOMPUTE_BATCH_SIZE,
+            help='Recipes recomputed per transaction (defaults to NUTRITION_RECOMPUTE_BATCH_SIZE)'
+        )
+    
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        count = recompute_stale_nutrition(options['batch_size'])
+        duration = time.perf_counter() - start
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"Recomputed the nutrition of {count} stale recipes in {duration:.2f} s"
+        ))
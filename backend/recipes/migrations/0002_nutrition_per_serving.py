@@ -0,0 +1,80 @@
+# Generated by Django 5.2.1 on 2026-10-19 05:58
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+PER_SERVING_FIELDS = {
+    'calories_per_serving': 'total_calories',
+    'protein_per_serving': 'total_protein',
+    'carbs_per_serving': 'total_carbs',
+    'fat_per_serving': 'total_fat',
+    'fiber_per_serving': 'total_fiber',
+}
+
+
+def populate_nutrition_per_serving(apps, schema_editor):
+    """Derive per-serving nutrition for existing recipes from their totals"""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Recipe.objects.filter(servings__gt=0).update(**{
+        field: F(total_field) * 1.0 / F('servings')
+        for field, total_field in PER_SERVING_FIELDS.items()
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='calories_per_serving',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='carbs_per_serving',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='fat_per_serving',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='fiber_per_serving',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='protein_per_serving',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(populate_nutrition_per_serving, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['calories_per_serving'], name='recipes_rec_calorie_8072bd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['protein_per_serving'], name='recipes_rec_protein_fa8fda_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['carbs_per_serving'], name='recipes_rec_carbs_p_c5f10f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['fat_per_serving'], name='recipes_rec_fat_per_20d4a6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['fiber_per_serving'], name='recipes_rec_fiber_p_a42cae_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.1 on 2026-10-19 06:05
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    """Build the GIN index and search documents; PostgreSQL only"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        "CREATE INDEX recipes_recipe_search_document_gin "
+        "ON recipes_recipe USING gin (search_document)"
+    )
+    schema_editor.execute("""
+        UPDATE recipes_recipe AS r SET search_document =
+            setweight(to_tsvector('english', coalesce(r.title, '')), 'A')
+            || setweight(to_tsvector('english', coalesce(r.description, '')), 'B')
+            || setweight(to_tsvector('english', coalesce((
+                SELECT string_agg(DISTINCT f.name, ' ')
+                FROM recipes_recipeingredient AS i
+                JOIN nutrition_nutritiondata AS f ON f.id = i.food_id
+                WHERE i.recipe_id = r.id
+            ), '')), 'B')
+            || setweight(to_tsvector('english', coalesce(r.instructions, '')), 'C')
+    """)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS recipes_recipe_search_document_gin")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('nutrition', '0003_nutrient_indexes'),
+        ('recipes', '0002_nutrition_per_serving'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_document',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
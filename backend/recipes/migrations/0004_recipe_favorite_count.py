@@ -0,0 +1,37 @@
+# Generated by Django 5.2.1 on 2026-10-19 06:09
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_favorite_counts(apps, schema_editor):
+    """Count existing favorites for every recipe"""
+    Recipe = apps.get_model('recipes', 'Recipe')
+    UserProfile = apps.get_model('users', 'UserProfile')
+    favorites = (
+        UserProfile.favorite_recipes.through.objects
+        .filter(recipe_id=OuterRef('pk'))
+        .order_by()
+        .values('recipe_id')
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    Recipe.objects.update(favorite_count=Coalesce(Subquery(favorites), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_recipe_search_document'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorite_count',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.RunPython(populate_favorite_counts, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,9 @@
 from django.db import models
 from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
+from nutrition.catalog import get_food_catalog
 from nutrition.models import NutritionData, MeasurementUnit
+from nutrition.versioning import get_dataset_version
 
 
 class Recipe(models.Model):
@@ -34,46 +37,124 @@ class Recipe(models.Model):
     total_fat = models.FloatField(null=True, blank=True)
     total_fiber = models.FloatField(null=True, blank=True)
     
+    # Per-serving nutrition, denormalized from the totals so it can be filtered and sorted in SQL
+    calories_per_serving = models.FloatField(null=True, blank=True)
+    protein_per_serving = models.FloatField(null=True, blank=True)
+    carbs_per_serving = models.FloatField(null=True, blank=True)
+    fat_per_serving = models.FloatField(null=True, blank=True)
+    fiber_per_serving = models.FloatField(null=True, blank=True)
+    
+    # When the cached nutrition went stale because foods or conversions it uses
+    # changed; cleared when it is recalculated (see recipes.invalidation)
+    nutrition_stale_since = models.DateTimeField(null=True, blank=True, editable=False)
+    
+    # Number of users who favorited this recipe, maintained by users.signals
+    favorite_count = models.PositiveIntegerField(default=0, db_index=True)
+    
+    # Full-text search document (title, description, instructions and matched food names),
+    # maintained by recipes.search and GIN-indexed on PostgreSQL
+    search_document = SearchVectorField(null=True, editable=False)
+    
+    # Mapping of per-serving fields to the totals they are derived from
+    PER_SERVING_FIELDS = {
+        'calories_per_serving': 'total_calories',
+        'protein_per_serving': 'total_protein',
+        'carbs_per_serving': 'total_carbs',
+        'fat_per_serving': 'total_fat',
+        'fiber_per_serving': 'total_fiber',
+    }
+    
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['calories_per_serving']),
+            models.Index(fields=['protein_per_serving']),
+            models.Index(fields=['carbs_per_serving']),
+            models.Index(fields=['fat_per_serving']),
+            models.Index(fields=['fiber_per_serving']),
+            # Only the few stale recipes are indexed
+            models.Index(
+                fields=['nutrition_stale_since'],
+                name='recipe_nutrition_stale_idx',
+                condition=models.Q(nutrition_stale_since__isnull=False),
+            ),
+        ]
     
     def __str__(self):
         return self.title
     
+    def save(self, *args, **kwargs):
+        """Keep the per-serving nutrition in sync with the totals and servings"""
+        self.update_nutrition_per_serving()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | set(self.PER_SERVING_FIELDS)
+        super().save(*args, **kwargs)
+    
+    def update_nutrition_per_serving(self):
+        """Derive the per-serving nutrition fields from the cached totals"""
+        for field, total_field in self.PER_SERVING_FIELDS.items():
+            total = getattr(self, total_field)
+            if total is not None and self.servings:
+                setattr(self, field, total / self.servings)
+            else:
+                setattr(self, field, None)
+    
     def calculate_nutrition(self):
         """Calculate and cache nutritional information for the recipe"""
-        total_calories = 0
-        total_protein = 0
-        total_carbs = 0
-        total_fat = 0
-        total_fiber = 0
-        
-        for ingredient in self.ingredients.all():
-            if ingredient.food and ingredient.quantity and ingredient.unit:
-                # Convert to grams
-                try:
-                    # Try to get specific conversion
-                    conversion = ingredient.food.conversions.get(unit=ingredient.unit)
-                    grams = ingredient.quantity * conversion.grams_per_unit
-                except:
-                    # Default fallback
-                    grams = ingredient.quantity  # Assume already in grams
-                
-                # Calculate nutrition based on grams
-                proportion = grams / 100  # Nutrition data is per 100g
-                total_calories += ingredient.food.calories * proportion
-                total_protein += ingredient.food.protein * proportion
-                total_carbs += ingredient.food.carbohydrates * proportion
-                total_fat += ingredient.food.fat * proportion
-                total_fiber += ingredient.food.fiber * proportion
+        # The totals are saved and the stale flag cleared, so the catalog must
+        # be of the current version, not one reused for the revalidation interval
+        catalog = get_food_catalog(get_dataset_version())
+        totals = nutrition_totals(
+            (
+                (catalog.get(food_id), quantity, unit_id)
+                for food_id, quantity, unit_id in self.ingredients.values_list('food_id', 'quantity', 'unit_id')
+            ),
+            catalog.converter
+        )
         
         # Save the calculated values
-        self.total_calories = total_calories
-        self.total_protein = total_protein
-        self.total_carbs = total_carbs
-        self.total_fat = total_fat
-        self.total_fiber = total_fiber
-        self.save()
+        self.nutrition_stale_since = None
+        self.total_calories = totals['calories']
+        self.total_protein = totals['protein']
+        self.total_carbs = totals['carbs']
+        self.total_fat = totals['fat']
+        self.total_fiber = totals['fiber']
+        # Only the nutrition, so the search document is not rebuilt
+        self.save(update_fields=[
+            'nutrition_stale_since', 'total_calories', 'total_protein', 'total_carbs', 'total_fat', 'total_fiber'
+        ])
+
+
+def nutrition_totals(items, converter=None):
+    """
+    Sum the calories, protein, carbs, fat and fiber of (food, quantity, unit)
+    items, where food is a NutritionData or a food catalog record and unit a
+    MeasurementUnit id or a unit name. Items without a food, quantity or unit,
+    and items whose unit does not convert to grams for their food, are skipped.
+    
+    Units are converted with the food catalog's converter unless one is given.
+    """
+    totals = {'calories': 0, 'protein': 0, 'carbs': 0, 'fat': 0, 'fiber': 0}
+    items = [(food, quantity, unit) for food, quantity, unit in items if food and quantity and unit]
+    if converter is None and items:
+        converter = get_food_catalog().converter
+    
+    for food, quantity, unit in items:
+        # Convert to grams
+        grams = converter.grams(food.pk, quantity, unit)
+        if grams is None:
+            continue
+        
+        # Calculate nutrition based on grams
+        proportion = grams / 100  # Nutrition data is per 100g
+        totals['calories'] += food.calories * proportion
+        totals['protein'] += food.protein * proportion
+        totals['carbs'] += food.carbohydrates * proportion
+        totals['fat'] += food.fat * proportion
+        totals['fiber'] += food.fiber * proportion
+    
+    return totals
 
 
 class RecipeIngredient(models.Model):
@@ -1,8 +1,13 @@
+import asyncio
 import re
 import spacy
+from asgiref.sync import sync_to_async
 from fractions import Fraction
-from django.db.models import Q
-from nutrition.models import NutritionData, MeasurementUnit
+from django.db.models.functions import Lower
+from nutrition.catalog import get_food_catalog, aget_food_catalog
+from nutrition.models import MeasurementUnit
+from .timing import stage, timed, SPACY_INVOCATIONS, LINE_DECISIONS
+from .workers import get_parse_pool
 
 # Load the spaCy model
 nlp = spacy.load('en_core_web_sm')
@@ -52,6 +57,34 @@ INGREDIENT_PATTERN = re.compile(
     re.IGNORECASE
 )
 
+# Line shapes that classify header-less recipe lines without the spaCy model
+NUMBERED_STEP = re.compile(r'^\s*(?:step\s*)?\d+\s*[.)]\s+', re.IGNORECASE)
+META_LINE = re.compile(
+    r'^\s*(?:serves|servings?|makes|yields?|(?:prep|preparation|cook|cooking|total) time)\b', re.IGNORECASE
+)
+LEADING_UNIT = re.compile(rf'^\s*{QUANTITY_PATTERN}\s*(?:{UNIT_PATTERN})\b', re.IGNORECASE)
+TIME_OR_TEMPERATURE = re.compile(
+    r'\d\s*(?:minutes?|mins?|hours?|hrs?|seconds?|secs?|degrees|°|(?-i:[CF])\b)', re.IGNORECASE
+)
+WORD = re.compile(r'[A-Za-z]+')
+
+# Words of food names that describe rather than name a food
+FOOD_NAME_STOPWORDS = {
+    'and', 'or', 'with', 'without', 'the', 'for', 'from', 'added', 'all', 'purpose', 'raw', 'cooked',
+    'boiled', 'baked', 'fried', 'roasted', 'fresh', 'frozen', 'canned', 'dried', 'prepared', 'whole',
+    'regular', 'commercial', 'plain', 'style', 'type', 'made', 'ready', 'serve', 'mix', 'solids',
+}
+
+# (dataset version, words) of the food name vocabulary
+_food_vocabulary = (None, frozenset())
+
+
+def run_nlp(text):
+    """Run the spaCy pipeline on text, counted and timed as the 'spacy' stage"""
+    SPACY_INVOCATIONS.inc()
+    with stage('spacy'):
+        return nlp(text)
+
 
 def convert_to_float(fraction_str):
     """Convert a string representation of a fraction to a float"""
@@ -142,119 +175,247 @@ def parse_ingredient_line(line):
     }
 
 
-def identify_ingredient_section(text):
+def singular(word):
+    if word.endswith('ies'):
+        return word[:-3] + 'y'
+    if word.endswith('oes'):
+        return word[:-2]
+    if word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+
+def vocabulary_words(foods):
     """
-    Try to identify the ingredients section in the text.
-    Returns a tuple of (ingredients_text, instructions_text)
+    Lower-cased words naming the foods, taken from the base of each name
+    ("Onion" in "Onion, raw") and the common name
+    """
+    words = set()
+    for food in foods:
+        for text in (food.name.split(',')[0], food.common_name or ''):
+            words.update(
+                singular(word) for word in WORD.findall(text.lower())
+                if len(word) > 2 and word not in FOOD_NAME_STOPWORDS
+            )
+    return frozenset(words)
+
+
+def versioned_food_vocabulary():
+    """
+    (dataset version, vocabulary_words()) of the nutrition table: read from the
+    nutrition snapshot when the food catalog was loaded from it, else rebuilt
+    from the catalog when the dataset version changes.
+    """
+    global _food_vocabulary
+    catalog = get_food_catalog()
+    if _food_vocabulary[0] != catalog.version:
+        words = catalog.vocabulary
+        if words is None:
+            words = vocabulary_words(catalog.foods.values())
+        _food_vocabulary = (catalog.version, words)
+    return _food_vocabulary
+
+
+def food_vocabulary():
+    """The vocabulary_words() of the nutrition table"""
+    return versioned_food_vocabulary()[1]
+
+
+def classify_line(line, vocabulary):
     """
-    # Common section headers
-    ingredient_headers = [
-        "ingredients:", "ingredients", "you'll need:", "you'll need", 
-        "what you'll need:", "what you'll need", "what you need:", "what you need",
-    ]
+    Decide from its shape, units and food words whether a line is an
+    ingredient. Returns True or False, or None when the model has to decide.
+    """
+    line = line.strip()
+    if not line or len(line) >= 100 or not re.search(r'\d', line):
+        return False
     
-    instruction_headers = [
-        "instructions:", "instructions", "directions:", "directions", 
-        "method:", "method", "preparation:", "preparation", "steps:", "steps",
-    ]
+    # "1. Preheat the oven" is a step; "1) 2 cups flour" is a numbered ingredient
+    step = NUMBERED_STEP.match(line)
+    if step:
+        line = line[step.end():]
+        if not line[:1].isdigit():
+            return False
     
-    # Split the text into lines
-    lines = text.split('\n')
+    if META_LINE.match(line):
+        return False
+    if LEADING_UNIT.match(line):
+        return True
+    if TIME_OR_TEMPERATURE.search(line):
+        return False
     
-    # Try to find section headers
+    words = WORD.findall(line)
+    if any(normalize_unit(word) for word in words):
+        return True
+    if any(singular(word.lower()) in vocabulary for word in words):
+        return True
+    return None
+
+
+def model_classify_line(line):
+    """The spaCy decision: a short line with a number and a noun or unit"""
+    line = line.strip()
+    if not line or len(line) >= 100 or not re.search(r'\d', line):
+        return False
+    return any(token.pos_ == 'NOUN' or normalize_unit(token.text) for token in run_nlp(line))
+
+
+def is_ingredient_line(line, vocabulary):
+    """Classify a line with the rules, falling back to spaCy for ambiguous lines"""
+    decision = classify_line(line, vocabulary)
+    if decision is None:
+        LINE_DECISIONS.inc(method='model')
+        return model_classify_line(line)
+    LINE_DECISIONS.inc(method='rules')
+    return decision
+
+
+# Common section headers
+INGREDIENT_HEADERS = [
+    "ingredients:", "ingredients", "you'll need:", "you'll need", 
+    "what you'll need:", "what you'll need", "what you need:", "what you need",
+]
+
+INSTRUCTION_HEADERS = [
+    "instructions:", "instructions", "directions:", "directions", 
+    "method:", "method", "preparation:", "preparation", "steps:", "steps",
+]
+
+
+def find_section_headers(lines):
+    """
+    Return (ingredient_start, instruction_start): the index of the line after
+    each section header, or None when there is no such header
+    """
     ingredient_start = None
     instruction_start = None
     
     for i, line in enumerate(lines):
         line_lower = line.lower().strip()
         
-        if not ingredient_start:
-            for header in ingredient_headers:
-                if line_lower == header:
-                    ingredient_start = i + 1
-                    break
+        if not ingredient_start and line_lower in INGREDIENT_HEADERS:
+            ingredient_start = i + 1
         
-        if not instruction_start:
-            for header in instruction_headers:
-                if line_lower == header:
-                    instruction_start = i + 1
-                    break
+        if not instruction_start and line_lower in INSTRUCTION_HEADERS:
+            instruction_start = i + 1
+    
+    return ingredient_start, instruction_start
+
+
+def iter_ingredient_section(text, vocabulary=None):
+    """
+    identify_ingredient_section() a line at a time, for streaming: yields
+    ('ingredient', line) for each ingredient line as soon as it is known, then
+    ('instructions', instructions_text). Without section headers each line is
+    classified (by spaCy when the rules cannot decide) only once it is reached.
+    """
+    lines = text.split('\n')
+    ingredient_start, instruction_start = find_section_headers(lines)
     
     # If we found both sections
     if ingredient_start and instruction_start:
         if ingredient_start < instruction_start:
-            ingredients_text = '\n'.join(lines[ingredient_start:instruction_start-1])
+            ingredient_lines = lines[ingredient_start:instruction_start-1]
             instructions_text = '\n'.join(lines[instruction_start:])
         else:
             instructions_text = '\n'.join(lines[instruction_start:ingredient_start-1])
-            ingredients_text = '\n'.join(lines[ingredient_start:])
+            ingredient_lines = lines[ingredient_start:]
     # If we only found ingredients
     elif ingredient_start:
-        ingredients_text = '\n'.join(lines[ingredient_start:])
+        ingredient_lines = lines[ingredient_start:]
         instructions_text = ''
     # If we only found instructions
     elif instruction_start:
         instructions_text = '\n'.join(lines[instruction_start:])
-        ingredients_text = '\n'.join(lines[:instruction_start-1])
+        ingredient_lines = lines[:instruction_start-1]
     # If we didn't find any section headers, try to infer
     else:
-        # Use NLP to try to identify ingredients
-        doc = nlp(text)
-        
         # Identify lines that are likely ingredients (have quantities or food items)
+        if vocabulary is None:
+            vocabulary = food_vocabulary()
         likely_ingredient_lines = []
         for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-                
-            # Check if line contains a number (potential quantity)
-            has_number = bool(re.search(r'\d', line))
-            
-            # Check if line contains a food item or unit
-            has_food_term = False
-            doc_line = nlp(line)
-            for token in doc_line:
-                if token.pos_ == 'NOUN' or normalize_unit(token.text):
-                    has_food_term = True
-                    break
-            
-            # If line has both a number and food term, it's likely an ingredient
-            if has_number and has_food_term and len(line) < 100:
-                likely_ingredient_lines.append(line)
+            if line.strip() and is_ingredient_line(line, vocabulary):
+                likely_ingredient_lines.append(line.strip())
+                yield 'ingredient', line.strip()
         
-        # If we found likely ingredients, use them
+        # If we found likely ingredients, instructions are everything else
         if likely_ingredient_lines:
-            ingredients_text = '\n'.join(likely_ingredient_lines)
-            
-            # Instructions are everything else
             instructions_text = text
             for line in likely_ingredient_lines:
                 instructions_text = instructions_text.replace(line, '')
-        else:
-            # As a last resort, just assume the first half is ingredients
-            mid_point = len(lines) // 2
-            ingredients_text = '\n'.join(lines[:mid_point])
-            instructions_text = '\n'.join(lines[mid_point:])
+            yield 'instructions', instructions_text
+            return
+        
+        # As a last resort, just assume the first half is ingredients
+        mid_point = len(lines) // 2
+        ingredient_lines = lines[:mid_point]
+        instructions_text = '\n'.join(lines[mid_point:])
+    
+    for line in ingredient_lines:
+        yield 'ingredient', line
+    yield 'instructions', instructions_text
+
+
+@timed('section')
+def identify_ingredient_section(text, vocabulary=None):
+    """
+    Try to identify the ingredients section in the text.
+    Returns a tuple of (ingredients_text, instructions_text)
     
-    return ingredients_text, instructions_text
+    The food vocabulary is loaded from the database unless one is given.
+    """
+    ingredient_lines = []
+    for kind, value in iter_ingredient_section(text, vocabulary):
+        if kind == 'ingredient':
+            ingredient_lines.append(value)
+        else:
+            instructions_text = value
+    return '\n'.join(ingredient_lines), instructions_text
 
 
 def parse_recipe_text(text):
-    """Parse recipe text into structured data"""
+    """
+    Parse recipe text into structured data, in the parse worker pool when
+    PARSE_WORKERS is set
+    """
+    pool = get_parse_pool()
+    if pool is not None:
+        # Workers keep the vocabulary, so it is only sent when the dataset changes
+        version, vocabulary = versioned_food_vocabulary()
+        return pool.parse(text, vocabulary, version)
+    return parse_recipe_text_in_process(text)
+
+
+async def aparse_recipe_text(text):
+    """
+    parse_recipe_text() for async views: the parse runs in the worker pool or
+    in a thread, keeping the CPU-bound work off the event loop
+    """
+    version, vocabulary = await sync_to_async(versioned_food_vocabulary)()
+    pool = get_parse_pool()
+    if pool is not None:
+        return await pool.aparse(text, vocabulary, version)
+    # to_thread() copies the context, so the stages are still timed for this request
+    return await asyncio.to_thread(parse_recipe_text_in_process, text, vocabulary)
+
+
+def parse_recipe_text_in_process(text, vocabulary=None):
+    """Parse recipe text into structured data in this process"""
     result = {}
     
     # Identify ingredients and instructions sections
-    ingredients_text, instructions_text = identify_ingredient_section(text)
+    ingredients_text, instructions_text = identify_ingredient_section(text, vocabulary)
     
     # Parse ingredient lines
     ingredients = []
-    for line in ingredients_text.split('\n'):
-        line = line.strip()
-        if line:
-            parsed = parse_ingredient_line(line)
-            if parsed:
-                ingredients.append(parsed)
+    with stage('regex'):
+        for line in ingredients_text.split('\n'):
+            line = line.strip()
+            if line:
+                parsed = parse_ingredient_line(line)
+                if parsed:
+                    ingredients.append(parsed)
     
     # Add to result
     result['ingredients'] = ingredients
@@ -263,51 +424,61 @@ def parse_recipe_text(text):
     return result
 
 
-def match_ingredients_to_foods(parsed_ingredients):
-    """Match parsed ingredients to foods in the database"""
+def _unit_matches(parsed_ingredients):
+    """The queryset finding the exact (case-insensitive) unit matches of the ingredients"""
+    unit_names = {ingredient['unit'].lower() for ingredient in parsed_ingredients if ingredient['unit']}
+    if not unit_names:
+        return None
+    return MeasurementUnit.objects.annotate(lower_name=Lower('name')).filter(lower_name__in=unit_names)
+
+
+def _combine_matches(parsed_ingredients, catalog, units):
     matched_ingredients = []
-    
+    partial_matches = {}
     for ingredient in parsed_ingredients:
-        ingredient_text = ingredient['ingredient']
+        key = ingredient['ingredient'].lower()
         # Create a copy to add matching information
         matched = ingredient.copy()
         matched['is_parsed'] = False
         
-        # Try to find a matching food
-        food = None
-        
-        # First try direct name match
-        try:
-            food = NutritionData.objects.get(
-                Q(name__iexact=ingredient_text) | 
-                Q(common_name__iexact=ingredient_text)
-            )
-        except NutritionData.DoesNotExist:
-            # If not found, try partial match
-            matches = NutritionData.objects.filter(
-                Q(name__icontains=ingredient_text) | 
-                Q(common_name__icontains=ingredient_text) |
-                Q(search_terms__icontains=ingredient_text)
-            )
-            
-            if matches.exists():
-                # Take the first match for now
-                food = matches.first()
+        # First try direct name match; names take precedence over common names,
+        # then take the first partial match
+        food = catalog.exact_match(key)
+        if food is None:
+            if key not in partial_matches:
+                partial_matches[key] = catalog.partial_match(key)
+            food = partial_matches[key]
         
         # If we found a food match
         if food:
             matched['food'] = food
             matched['is_parsed'] = True
             
-            # Try to find unit if specified
+            # Try to find unit if specified; keep as None if not found
             if ingredient['unit']:
-                try:
-                    unit = MeasurementUnit.objects.get(name__iexact=ingredient['unit'])
-                    matched['unit'] = unit
-                except MeasurementUnit.DoesNotExist:
-                    # Unit not found, keep as None
-                    matched['unit'] = None
+                matched['unit'] = units.get(ingredient['unit'].lower())
         
         matched_ingredients.append(matched)
     
-    return matched_ingredients
\ No newline at end of file
+    return matched_ingredients
+
+
+@timed('match')
+def match_ingredients_to_foods(parsed_ingredients):
+    """
+    Match parsed ingredients to foods of the food catalog; matched foods are
+    FoodRecords
+    """
+    catalog = get_food_catalog()
+    unit_matches = _unit_matches(parsed_ingredients)
+    units = {unit.lower_name: unit for unit in unit_matches} if unit_matches is not None else {}
+    return _combine_matches(parsed_ingredients, catalog, units)
+
+
+async def amatch_ingredients_to_foods(parsed_ingredients):
+    """match_ingredients_to_foods() with the async ORM, for async views"""
+    with stage('match'):
+        catalog = await aget_food_catalog()
+        unit_matches = _unit_matches(parsed_ingredients)
+        units = {unit.lower_name: unit async for unit in unit_matches} if unit_matches is not None else {}
+        return _combine_matches(parsed_ingredients, catalog, units)
\ No newline at end of file
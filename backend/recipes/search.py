@@ -0,0 +1,93 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import Exists, F, OuterRef, Q, QuerySet, Subquery, TextField, Value
+from django.db.models.functions import Coalesce
+from rest_framework import filters
+
+from .models import Recipe, RecipeIngredient
+
+# Text search configuration used for both the documents and the queries
+SEARCH_CONFIG = 'english'
+
+
+def full_text_search_available():
+    """Full-text search documents are only maintained on PostgreSQL"""
+    return connection.vendor == 'postgresql'
+
+
+def build_search_document():
+    """
+    Expression for a recipe's search document: the title ranks highest,
+    followed by the description and matched food names, then the instructions
+    """
+    food_names = (
+        RecipeIngredient.objects
+        .filter(recipe=OuterRef('pk'), food__isnull=False)
+        .values('recipe')
+        .annotate(names=StringAgg('food__name', delimiter=' ', distinct=True))
+        .values('names')
+    )
+    return (
+        SearchVector('title', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='B', config=SEARCH_CONFIG)
+        + SearchVector(
+            Coalesce(Subquery(food_names), Value(''), output_field=TextField()),
+            weight='B', config=SEARCH_CONFIG
+        )
+        + SearchVector('instructions', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_documents(recipes):
+    """
+    Recompute the search document of the given recipes (a queryset or a list
+    of primary keys) in a single UPDATE
+    """
+    if not full_text_search_available():
+        return 0
+
+    if not isinstance(recipes, QuerySet):
+        recipes = Recipe.objects.filter(pk__in=list(recipes))
+    return recipes.update(search_document=build_search_document())
+
+
+def search_recipes(queryset, query):
+    """
+    Filter recipes matching a search query.
+
+    On PostgreSQL this uses the GIN-indexed search document and orders results
+    by rank; elsewhere it falls back to case-insensitive matching without
+    joining ingredients into the result rows.
+    """
+    query = query.strip()
+    if not query:
+        return queryset
+
+    if full_text_search_available():
+        search_query = SearchQuery(query, search_type='websearch', config=SEARCH_CONFIG)
+        return (
+            queryset
+            .filter(search_document=search_query)
+            .annotate(search_rank=SearchRank(F('search_document'), search_query))
+            .order_by('-search_rank', '-created_at')
+        )
+
+    for term in query.split():
+        matching_food = RecipeIngredient.objects.filter(
+            recipe=OuterRef('pk'), food__name__icontains=term
+        )
+        queryset = queryset.filter(
+            Q(title__icontains=term) | Q(description__icontains=term)
+            | Q(instructions__icontains=term) | Exists(matching_food)
+        )
+    return queryset
+
+
+class RecipeSearchFilter(filters.SearchFilter):
+    """
+    Drop-in replacement for SearchFilter backed by the recipe search document
+    """
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '')
+        return search_recipes(queryset, query)
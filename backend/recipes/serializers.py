@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import Recipe, RecipeIngredient, Tag, RecipeTag
+from nutrition.models import MeasurementUnit
 from nutrition.serializers import NutritionDataLightSerializer, MeasurementUnitSerializer
 
 
@@ -35,27 +36,27 @@ class RecipeSerializer(serializers.ModelSerializer):
             'original_text', 'image', 'source_url', 'source_name',
             'created_at', 'updated_at', 'ingredients', 'tags',
             'total_calories', 'total_protein', 'total_carbs', 
-            'total_fat', 'total_fiber', 'nutrition_per_serving'
+            'total_fat', 'total_fiber', 'nutrition_per_serving', 'favorite_count'
         ]
         read_only_fields = [
-            'id', 'user_username', 'created_at', 'updated_at', 
+            'id', 'user', 'user_username', 'created_at', 'updated_at', 
             'total_calories', 'total_protein', 'total_carbs', 
-            'total_fat', 'total_fiber', 'nutrition_per_serving'
+            'total_fat', 'total_fiber', 'nutrition_per_serving', 'favorite_count'
         ]
     
     def get_tags(self, obj):
-        recipe_tags = RecipeTag.objects.filter(recipe=obj)
-        tags = [recipe_tag.tag for recipe_tag in recipe_tags]
+        # Uses prefetched recipe_tags__tag when the queryset provides them
+        tags = [recipe_tag.tag for recipe_tag in obj.recipe_tags.all()]
         return TagSerializer(tags, many=True).data
     
     def get_nutrition_per_serving(self, obj):
         if obj.servings and obj.servings > 0:
             return {
-                'calories': obj.total_calories / obj.servings if obj.total_calories else None,
-                'protein': obj.total_protein / obj.servings if obj.total_protein else None,
-                'carbs': obj.total_carbs / obj.servings if obj.total_carbs else None,
-                'fat': obj.total_fat / obj.servings if obj.total_fat else None,
-                'fiber': obj.total_fiber / obj.servings if obj.total_fiber else None
+                'calories': obj.calories_per_serving,
+                'protein': obj.protein_per_serving,
+                'carbs': obj.carbs_per_serving,
+                'fat': obj.fat_per_serving,
+                'fiber': obj.fiber_per_serving
             }
         return None
 
@@ -71,12 +72,13 @@ class RecipeLightSerializer(serializers.ModelSerializer):
             'id', 'title', 'user_username', 'description', 
             'servings', 'prep_time', 'cook_time', 'image',
             'created_at', 'updated_at', 'tags',
-            'total_calories', 'total_protein', 'total_carbs', 'total_fat'
+            'total_calories', 'total_protein', 'total_carbs', 'total_fat',
+            'favorite_count'
         ]
     
     def get_tags(self, obj):
-        recipe_tags = RecipeTag.objects.filter(recipe=obj)
-        tags = [recipe_tag.tag for recipe_tag in recipe_tags]
+        # Uses prefetched recipe_tags__tag when the queryset provides them
+        tags = [recipe_tag.tag for recipe_tag in obj.recipe_tags.all()]
         return TagSerializer(tags, many=True).data
 
 
@@ -90,4 +92,24 @@ class RecipeParserSerializer(serializers.Serializer):
     def validate_servings(self, value):
         if value and value < 1:
             raise serializers.ValidationError("Servings must be at least 1")
-        return value
\ No newline at end of file
+        return value
+
+
+class MatchedIngredientSerializer(serializers.Serializer):
+    """Serializer for the output of match_ingredients_to_foods; food and unit are returned as ids"""
+    quantity = serializers.FloatField(allow_null=True)
+    unit = serializers.SerializerMethodField()
+    ingredient = serializers.CharField()
+    preparation = serializers.CharField(allow_null=True)
+    original_text = serializers.CharField()
+    food = serializers.SerializerMethodField()
+    is_parsed = serializers.BooleanField()
+    
+    def get_unit(self, obj):
+        # Units that did not match a MeasurementUnit are left as the parsed string
+        unit = obj.get('unit')
+        return unit.pk if isinstance(unit, MeasurementUnit) else None
+    
+    def get_food(self, obj):
+        food = obj.get('food')
+        return food.pk if food else None
\ No newline at end of file
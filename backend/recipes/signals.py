@@ -0,0 +1,94 @@
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
+from django.dispatch import receiver
+from nutrition.models import FoodGroup, NutritionData, FoodConversion, MeasurementUnit
+from .invalidation import mark_stale, recipes_using_foods, recipes_using_unit
+from .models import Recipe, RecipeIngredient
+from .search import full_text_search_available, update_search_documents
+
+# Recipe fields that feed the search document
+SEARCH_DOCUMENT_FIELDS = {'title', 'description', 'instructions'}
+# NutritionData fields that feed the cached recipe nutrition
+NUTRITION_FIELDS = {'calories', 'protein', 'carbohydrates', 'fat', 'fiber'}
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search_document(sender, instance, update_fields=None, **kwargs):
+    """Refresh the search document when searchable recipe fields change"""
+    if update_fields is None or SEARCH_DOCUMENT_FIELDS & set(update_fields):
+        update_search_documents([instance.pk])
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def update_ingredient_search_document(sender, instance, origin=None, **kwargs):
+    """Refresh the search document when a recipe's matched foods change"""
+    # Nothing to refresh when the ingredients are deleted along with their recipe
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin_model is Recipe:
+        return
+    update_search_documents([instance.recipe_id])
+
+
+@receiver(pre_save, sender=NutritionData)
+def remember_food_name(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Read the stored name of a food about to be saved, to tell whether it is renamed"""
+    instance._previous_name = None
+    if raw or instance.pk is None or not full_text_search_available():
+        return
+    if update_fields is not None and 'name' not in update_fields:
+        return
+    instance._previous_name = NutritionData.objects.filter(pk=instance.pk).values_list('name', flat=True).first()
+
+
+@receiver(post_save, sender=NutritionData)
+def update_food_search_documents(sender, instance, created, **kwargs):
+    """Refresh the search documents of recipes using a renamed food"""
+    previous_name = instance.__dict__.pop('_previous_name', None)
+    if created or previous_name is None or previous_name == instance.name:
+        return
+    update_search_documents(Recipe.objects.filter(ingredients__food=instance))
+
+
+@receiver(post_save, sender=NutritionData)
+def invalidate_food_nutrition(sender, instance, created, update_fields=None, **kwargs):
+    """Mark the recipes using a changed food stale"""
+    if created or (update_fields is not None and not NUTRITION_FIELDS & set(update_fields)):
+        return
+    mark_stale(recipes_using_foods([instance.pk]))
+
+
+@receiver(pre_delete, sender=FoodGroup)
+def invalidate_deleted_group_nutrition(sender, instance, **kwargs):
+    """Mark the recipes using any food of a deleted group stale, in one query"""
+    mark_stale(recipes_using_foods(NutritionData.objects.filter(food_group=instance).values('pk')))
+
+
+@receiver(pre_delete, sender=NutritionData)
+def invalidate_deleted_food_nutrition(sender, instance, origin=None, **kwargs):
+    """Mark the recipes using a food stale before their ingredients lose it"""
+    if _origin_model(origin) is FoodGroup:
+        return
+    mark_stale(recipes_using_foods([instance.pk]))
+
+
+@receiver(post_save, sender=FoodConversion)
+@receiver(post_delete, sender=FoodConversion)
+def invalidate_conversion_nutrition(sender, instance, origin=None, **kwargs):
+    """Mark the recipes using the food of a changed conversion stale"""
+    # Conversions deleted along with their food or unit are covered by its receiver
+    if origin is not None and _origin_model(origin) is not FoodConversion:
+        return
+    mark_stale(recipes_using_foods([instance.food_id]))
+
+
+@receiver(post_save, sender=MeasurementUnit)
+@receiver(pre_delete, sender=MeasurementUnit)
+def invalidate_unit_nutrition(sender, instance, created=False, **kwargs):
+    """Mark the recipes converting through a changed unit stale"""
+    if not created:
+        mark_stale(recipes_using_unit(instance.pk))
+
+
+def _origin_model(origin):
+    return origin.model if isinstance(origin, QuerySet) else type(origin)
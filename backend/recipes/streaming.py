@@ -0,0 +1,184 @@
+"""
+Streaming variant of the recipe parser.
+
+parse_records() yields one record per ingredient line as soon as it is parsed
+and matched, then the instructions and the nutrition totals. The records are
+sent as NDJSON, or as Server-Sent Events when the client accepts
+text/event-stream.
+
+Lines are classified as they are reached, so the first record does not wait
+for spaCy to see the whole text. Streamed parses run in the request thread
+rather than the parse worker pool, which returns whole results; the stream
+endpoint therefore accepts at most PARSE_STREAM_MAX_LINES lines.
+
+stream_response() also streams the recipe export (recipes.transfer), and
+the NDJSON parsers below read the recipe import line by line.
+
+Under ASGI the records are produced through an async iterator, one
+sync_to_async() step at a time, so each is flushed to the client as it is
+ready. Django buffers synchronous iterators completely under ASGI.
+"""
+import gzip
+import json
+import time
+import zlib
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer
+from .models import nutrition_totals
+from .parser import iter_ingredient_section, parse_ingredient_line, match_ingredients_to_foods
+from .serializers import MatchedIngredientSerializer
+from .timing import stage, STAGE_DURATIONS
+
+_END = object()
+
+
+class StreamRenderer(BaseRenderer):
+    """
+    Frames streamed records; responses that are not streamed, such as
+    validation errors, are rendered as a single 'error' record
+    """
+    charset = 'utf-8'
+
+    def frame(self, record):
+        raise NotImplementedError
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return self.frame({'type': 'error', 'errors': data}).encode(self.charset)
+
+
+class NDJSONRenderer(StreamRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def frame(self, record):
+        return json.dumps(record, cls=DjangoJSONEncoder) + '\n'
+
+
+class EventStreamRenderer(StreamRenderer):
+    media_type = 'text/event-stream'
+    format = 'sse'
+
+    def frame(self, record):
+        return f"event: {record['type']}\ndata: {json.dumps(record, cls=DjangoJSONEncoder)}\n\n"
+
+
+
+class NDJSONParser(BaseParser):
+    """
+    Parses an NDJSON body lazily: request.data iterates over its lines as
+    they are read from the request, so a large upload is never held whole
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return iter(stream)
+
+
+class GzipNDJSONParser(NDJSONParser):
+    """Parses a gzip-compressed NDJSON body, decompressing it as it is read"""
+    media_type = 'application/gzip'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return iter(gzip.GzipFile(fileobj=stream, mode='rb'))
+
+def parse_records(text):
+    """Parse and match recipe text line by line, yielding a record for each step"""
+    start = time.perf_counter()
+    matched_ingredients = []
+    instructions_text = ''
+    for kind, line in iter_ingredient_section(text):
+        if kind == 'instructions':
+            instructions_text = line
+            continue
+
+        with stage('regex'):
+            parsed = parse_ingredient_line(line)
+        if not parsed:
+            continue
+
+        matched = match_ingredients_to_foods([parsed])[0]
+        if not matched_ingredients:
+            STAGE_DURATIONS.observe((time.perf_counter() - start) * 1000, stage='stream_first_ingredient')
+        matched_ingredients.append(matched)
+        yield {
+            'type': 'ingredient',
+            'index': len(matched_ingredients) - 1,
+            **MatchedIngredientSerializer(matched).data,
+            # The parsed unit, also when it matched no MeasurementUnit
+            'unit_name': parsed['unit'],
+        }
+
+    yield {'type': 'instructions', 'instructions': instructions_text.strip()}
+
+    totals = nutrition_totals(
+        # Units that matched no MeasurementUnit still convert by their parsed name
+        (ingredient.get('food'), ingredient.get('quantity'), getattr(ingredient.get('unit'), 'pk', ingredient.get('unit')))
+        for ingredient in matched_ingredients
+    )
+    yield {
+        'type': 'totals',
+        'ingredients': len(matched_ingredients),
+        'matched': sum(1 for ingredient in matched_ingredients if ingredient['is_parsed']),
+        **totals,
+    }
+
+
+async def _aiter_records(records):
+    # Thread-sensitive, so every step runs in the thread holding the request's database connection
+    next_record = sync_to_async(next, thread_sensitive=True)
+    while True:
+        record = await next_record(records, _END)
+        if record is _END:
+            return
+        yield record
+
+
+def gzip_chunks(chunks):
+    """Compress streamed text chunks into one gzip member"""
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+async def _agzip_chunks(chunks):
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    async for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_response(request, records, renderer, filename=None, compress=False):
+    """
+    Stream records framed by the renderer; asynchronously when served over
+    ASGI. With a filename the stream is sent as an attachment, gzip-compressed
+    when `compress` is set.
+    """
+    if isinstance(request, ASGIRequest):
+        async def content():
+            async for record in _aiter_records(records):
+                yield renderer.frame(record)
+        streaming_content = _agzip_chunks(content()) if compress else content()
+    else:
+        streaming_content = (renderer.frame(record) for record in records)
+        if compress:
+            streaming_content = gzip_chunks(streaming_content)
+
+    if compress:
+        response = StreamingHttpResponse(streaming_content, content_type='application/gzip')
+    else:
+        response = StreamingHttpResponse(streaming_content, content_type=f"{renderer.media_type}; charset=utf-8")
+    if filename:
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    # Keep proxies from buffering the stream
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,11 +1,38 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from unittest import mock, skipUnless
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
 from rest_framework.test import APIClient
 from rest_framework import status
 from .models import Recipe, RecipeIngredient, Tag, RecipeTag
-from nutrition.models import FoodGroup, NutritionData, MeasurementUnit
-from .parser import parse_recipe_text, match_ingredients_to_foods
+from nutrition.catalog import FoodCatalog, get_food_catalog
+from nutrition.conversions import KNOWN_UNITS
+from nutrition.models import FoodGroup, NutritionData, MeasurementUnit, FoodConversion
+from nutrition.versioning import bump_dataset_version
+from .invalidation import STALE_RECIPES, collect_staleness, recompute_batch, recompute_stale_nutrition
+from .parser import (
+    UNITS, parse_recipe_text, parse_recipe_text_in_process, match_ingredients_to_foods, classify_line, food_vocabulary,
+    identify_ingredient_section, is_ingredient_line
+)
+from .search import full_text_search_available
+from .streaming import parse_records
+from .timing import STAGE_DURATIONS, QUERY_COUNTS, SPACY_INVOCATIONS, LINE_DECISIONS
+from .views import RecipeViewSet, TagViewSet, save_parsed_recipe
+from .workers import ParsePool, ParsePoolBusy, ParsePoolTimeout, get_parse_pool
+from nutriparse_project.query_budget import Budget, ViewSetQueryBudgetMixin
 
 
 class RecipeModelTest(TestCase):
@@ -58,13 +85,25 @@ class RecipeModelTest(TestCase):
         # Calculate nutrition with no conversion
         self.recipe.calculate_nutrition()
         
-        # Check that the nutrition values were calculated correctly
-        # Since we don't have a conversion, it should assume 2 grams
-        self.assertEqual(self.recipe.total_calories, 2)
-        self.assertEqual(self.recipe.total_protein, 0.2)
-        self.assertEqual(self.recipe.total_carbs, 0.4)
-        self.assertEqual(self.recipe.total_fat, 0.1)
-        self.assertEqual(self.recipe.total_fiber, 0.04)
+        # Without a conversion the cups cannot be weighed, so nothing is counted
+        self.assertEqual(self.recipe.total_calories, 0)
+        
+        # A tablespoon conversion gives the food's density, which converts the cups
+        tablespoon = MeasurementUnit.objects.create(name="tablespoon", abbreviation="tbsp", type="volume")
+        FoodConversion.objects.create(food=food, unit=tablespoon, grams_per_unit=15)
+        self.recipe.calculate_nutrition()
+        
+        grams = 2 * 236.588 * 15 / 14.7868
+        self.assertAlmostEqual(self.recipe.total_calories, grams)
+        self.assertAlmostEqual(self.recipe.total_protein, grams / 10)
+        self.assertAlmostEqual(self.recipe.total_carbs, grams / 5)
+        self.assertAlmostEqual(self.recipe.total_fat, grams / 20)
+        self.assertAlmostEqual(self.recipe.total_fiber, grams / 50)
+        
+        # An exact conversion takes precedence
+        FoodConversion.objects.create(food=food, unit=unit, grams_per_unit=200)
+        self.recipe.calculate_nutrition()
+        self.assertAlmostEqual(self.recipe.total_calories, 400)
 
 
 class RecipeIngredientModelTest(TestCase):
@@ -216,15 +255,142 @@ class RecipeParserTest(TestCase):
         self.assertEqual(len(matched_ingredients), 2)
         
         # Check flour match
-        self.assertEqual(matched_ingredients[0]['food'], self.flour)
+        self.assertEqual(matched_ingredients[0]['food'].pk, self.flour.pk)
         self.assertEqual(matched_ingredients[0]['unit'], self.cup)
         self.assertTrue(matched_ingredients[0]['is_parsed'])
         
         # Check apple match
-        self.assertEqual(matched_ingredients[1]['food'], self.apple)
+        self.assertEqual(matched_ingredients[1]['food'].pk, self.apple.pk)
         self.assertEqual(matched_ingredients[1]['preparation'], 'diced')
         self.assertTrue(matched_ingredients[1]['is_parsed'])
 
+    
+    def test_every_unit_converts(self):
+        """Test that the unit conversions know every unit the parser produces"""
+        self.assertFalse(set(UNITS) - KNOWN_UNITS)
+
+class IngredientLineClassifierTest(TestCase):
+    """Test the rules that classify header-less recipe lines without spaCy"""
+    
+    def setUp(self):
+        food_group = FoodGroup.objects.create(name="Vegetables")
+        NutritionData.objects.create(
+            name="Tomatoes, red, raw", food_group=food_group, calories=18, protein=0.9, carbohydrates=3.9, fat=0.2
+        )
+    
+    def test_vocabulary(self):
+        vocabulary = food_vocabulary()
+        self.assertIn('tomato', vocabulary)
+        self.assertNotIn('raw', vocabulary)
+        self.assertNotIn('red', vocabulary)
+    
+    def test_vocabulary_follows_the_dataset(self):
+        self.assertNotIn('avocado', food_vocabulary())
+        NutritionData.objects.create(
+            name="Avocados, raw", food_group=FoodGroup.objects.get(), calories=160, protein=2, carbohydrates=8.5, fat=14.7
+        )
+        self.assertIn('avocado', food_vocabulary())
+    
+    def test_classify_line(self):
+        vocabulary = food_vocabulary()
+        cases = {
+            "2 cups flour": True,
+            "1 1/2 tsp salt": True,
+            "3 tomatoes, diced": True,
+            "2) 1 cup milk": True,
+            "Mix well": False,
+            "1. Preheat the oven to 180C.": False,
+            "Bake for 25 minutes": False,
+            "Serves 4": False,
+            "4 shallots": None,
+        }
+        for line, expected in cases.items():
+            with self.subTest(line):
+                self.assertIs(classify_line(line, vocabulary), expected)
+    
+    def test_header_less_recipe_skips_spacy(self):
+        text = "2 cups flour\n3 tomatoes, chopped\n1 tsp salt\n\n1. Mix everything.\n2. Bake for 20 minutes."
+        before = SPACY_INVOCATIONS.value()
+        ingredients_text, instructions_text = identify_ingredient_section(text)
+        self.assertEqual(SPACY_INVOCATIONS.value(), before)
+        self.assertEqual(ingredients_text.split('\n'), ["2 cups flour", "3 tomatoes, chopped", "1 tsp salt"])
+        self.assertIn("1. Mix everything.", instructions_text)
+    
+    def test_ambiguous_lines_go_to_the_model(self):
+        before = LINE_DECISIONS.value(method='model')
+        identify_ingredient_section("4 shallots\n1 cup sugar")
+        self.assertEqual(LINE_DECISIONS.value(method='model'), before + 1)
+
+
+class ParsePoolTest(TestCase):
+    """Test the parser process pool"""
+    text = "Ingredients:\n250 g flour\n2 eggs\n\nInstructions:\nMix and bake."
+    
+    def fake_executor(self, pool):
+        """Replace the pool's processes with futures that never finish"""
+        executor = mock.Mock()
+        executor.submit.side_effect = lambda *args: Future()
+        slots = threading.BoundedSemaphore(pool.workers + pool.queue_size)
+        pool._get_executor = lambda: (executor, slots)
+    
+    def test_full_queue_rejects_parses(self):
+        pool = ParsePool(workers=1, queue_size=1)
+        self.fake_executor(pool)
+        pool.submit(self.text, frozenset())
+        pool.submit(self.text, frozenset())
+        with self.assertRaises(ParsePoolBusy):
+            pool.submit(self.text, frozenset())
+    
+    def test_timeout(self):
+        pool = ParsePool(workers=1, timeout=0.01)
+        self.fake_executor(pool)
+        with self.assertRaises(ParsePoolTimeout):
+            pool.parse(self.text, frozenset())
+    
+    async def test_async_timeout(self):
+        pool = ParsePool(workers=1, timeout=0.01)
+        self.fake_executor(pool)
+        with self.assertRaises(ParsePoolTimeout):
+            await pool.aparse(self.text, frozenset())
+    
+    def test_parse_in_worker(self):
+        pool = ParsePool(workers=1)
+        self.addCleanup(pool.shutdown)
+        expected = parse_recipe_text_in_process(self.text, frozenset())
+        self.assertEqual(pool.parse(self.text, frozenset()), expected)
+        self.assertEqual(async_to_sync(pool.aparse)(self.text, frozenset()), expected)
+    
+    def test_vocabulary_is_sent_once_per_version(self):
+        pool = ParsePool(workers=1)
+        self.addCleanup(pool.shutdown)
+        vocabulary = frozenset({'flour'})
+        expected = parse_recipe_text_in_process(self.text, vocabulary)
+        with mock.patch.object(pool, '_submit', wraps=pool._submit) as submit:
+            self.assertEqual(pool.parse(self.text, vocabulary, 1), expected)
+            self.assertEqual(pool.parse(self.text, vocabulary, 1), expected)
+            self.assertEqual(pool.parse(self.text, vocabulary, 2), expected)
+        sent = [call.args[2] for call in submit.call_args_list]
+        self.assertEqual(sent, [None, vocabulary, None, None, vocabulary])
+    
+    def test_workers_are_recycled(self):
+        pool = ParsePool(workers=1, max_tasks_per_worker=1)
+        self.addCleanup(pool.shutdown)
+        executor, _ = pool._get_executor()
+        first, second = executor.submit(os.getpid).result(), executor.submit(os.getpid).result()
+        self.assertNotEqual(first, second)
+    
+    @override_settings(PARSE_WORKERS=0)
+    def test_disabled_by_default(self):
+        self.assertIsNone(get_parse_pool())
+    
+    def test_busy_pool_returns_503(self):
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create_user(username="testuser", password="testpassword"))
+        with mock.patch('recipes.views.parse_recipe_text', side_effect=ParsePoolBusy("busy")):
+            response = client.post(reverse('recipe-parse'), {'recipe_text': self.text}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '1')
+
 
 class RecipeAPITest(TestCase):
     """Test the Recipe API endpoints"""
@@ -289,6 +455,15 @@ class RecipeAPITest(TestCase):
         self.assertEqual(self.recipe.title, 'Updated Recipe')
         self.assertEqual(self.recipe.servings, 6)
     
+    def test_update_cannot_change_owner(self):
+        """Test the owner is set from the request user, never from the payload"""
+        other = User.objects.create_user(username="other", password="testpassword")
+        response = self.client.patch(self.detail_url, {'user': other.id, 'servings': 3}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.user, self.user)
+        self.assertEqual(response.data['servings'], 3)
+    
     def test_delete_recipe(self):
         """Test deleting a recipe"""
         response = self.client.delete(self.detail_url)
@@ -314,4 +489,772 @@ class RecipeAPITest(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn('parsed_data', response.data)
         self.assertIn('ingredients', response.data['parsed_data'])
-        self.assertEqual(len(response.data['parsed_data']['ingredients']), 2)
\ No newline at end of file
+        self.assertEqual(len(response.data['parsed_data']['ingredients']), 2)
+
+class RecipeNutritionPerServingTest(TestCase):
+    """Test the denormalized per-serving nutrition and its range filters"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username="testuser",
+            email="test@example.com",
+            password="testpassword"
+        )
+        self.client.force_authenticate(user=self.user)
+        
+        self.light = Recipe.objects.create(
+            title="Light Salad",
+            user=self.user,
+            servings=2,
+            total_calories=600,
+            total_protein=20,
+            total_carbs=40,
+            total_fat=30,
+            total_fiber=10
+        )
+        self.hearty = Recipe.objects.create(
+            title="Hearty Stew",
+            user=self.user,
+            servings=4,
+            total_calories=3200,
+            total_protein=160,
+            total_carbs=200,
+            total_fat=120,
+            total_fiber=24
+        )
+        self.url = reverse('recipe-list')
+    
+    def test_per_serving_fields_are_derived(self):
+        self.assertEqual(self.light.calories_per_serving, 300)
+        self.assertEqual(self.hearty.protein_per_serving, 40)
+    
+    def test_per_serving_fields_follow_servings(self):
+        self.light.servings = 3
+        self.light.save(update_fields=['servings'])
+        self.light.refresh_from_db()
+        self.assertEqual(self.light.calories_per_serving, 200)
+    
+    def test_filter_by_calories(self):
+        response = self.client.get(self.url, {'max_calories': 500})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['title'] for r in response.data['results']], ["Light Salad"])
+    
+    def test_filter_by_protein_range(self):
+        response = self.client.get(self.url, {'min_protein': 30, 'max_fat': 40})
+        self.assertEqual([r['title'] for r in response.data['results']], ["Hearty Stew"])
+    
+    def test_order_by_per_serving_calories(self):
+        response = self.client.get(self.url, {'ordering': '-calories_per_serving'})
+        self.assertEqual(
+            [r['title'] for r in response.data['results']],
+            ["Hearty Stew", "Light Salad"]
+        )
+    
+    def test_invalid_range_value(self):
+        response = self.client.get(self.url, {'max_calories': 'lots'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RecipeNutritionInvalidationTest(TestCase):
+    """Test that recipes go stale when their foods change, and are recomputed"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        food_group = FoodGroup.objects.create(name="Baking")
+        self.gram = MeasurementUnit.objects.create(name="gram", abbreviation="g", type="weight")
+        self.cup = MeasurementUnit.objects.create(name="cup", abbreviation="c", type="volume")
+        self.flour = NutritionData.objects.create(
+            name="flour", food_group=food_group, calories=364, protein=10, carbohydrates=76, fat=1, fiber=3
+        )
+        self.sugar = NutritionData.objects.create(
+            name="sugar", food_group=food_group, calories=387, protein=0, carbohydrates=100, fat=0
+        )
+        self.conversion = FoodConversion.objects.create(food=self.sugar, unit=self.cup, grams_per_unit=200)
+        self.bread = Recipe.objects.create(title="Bread", user=self.user, servings=2)
+        RecipeIngredient.objects.create(recipe=self.bread, food=self.flour, quantity=100, unit=self.gram)
+        self.cake = Recipe.objects.create(title="Cake", user=self.user, servings=4)
+        RecipeIngredient.objects.create(recipe=self.cake, food=self.sugar, quantity=1, unit=self.cup)
+        for recipe in (self.bread, self.cake):
+            recipe.calculate_nutrition()
+    
+    def stale(self):
+        return set(Recipe.objects.filter(nutrition_stale_since__isnull=False).values_list('title', flat=True))
+    
+    def test_food_change_marks_its_recipes(self):
+        self.assertEqual(self.stale(), set())
+        self.flour.calories = 400
+        self.flour.save()
+        self.assertEqual(self.stale(), {"Bread"})
+        
+        # Saving fields the nutrition does not use changes nothing
+        self.sugar.common_name = "white sugar"
+        self.sugar.save(update_fields=['common_name'])
+        self.assertEqual(self.stale(), {"Bread"})
+    
+    def test_conversion_and_unit_changes_mark_their_recipes(self):
+        self.conversion.grams_per_unit = 220
+        self.conversion.save()
+        self.assertEqual(self.stale(), {"Cake"})
+        
+        Recipe.objects.update(nutrition_stale_since=None)
+        self.gram.abbreviation = "gr"
+        self.gram.save()
+        self.assertEqual(self.stale(), {"Bread"})
+    
+    def test_recompute_clears_stale_recipes(self):
+        self.flour.calories = 400
+        self.flour.save()
+        self.conversion.delete()
+        self.assertEqual(self.stale(), {"Bread", "Cake"})
+        
+        self.assertEqual(recompute_stale_nutrition(batch_size=1), 2)
+        self.assertEqual(self.stale(), set())
+        self.bread.refresh_from_db()
+        self.assertAlmostEqual(self.bread.total_calories, 400)
+        self.assertAlmostEqual(self.bread.calories_per_serving, 200)
+        # Without the conversion the cup of sugar cannot be weighed
+        self.cake.refresh_from_db()
+        self.assertEqual(self.cake.total_calories, 0)
+    
+    def test_recompute_reads_foods_in_its_transaction(self):
+        # A stale process-wide catalog must not be written into the recipes
+        outdated = get_food_catalog()
+        self.flour.calories = 400
+        self.flour.save()
+        with mock.patch('recipes.invalidation.get_food_catalog', return_value=outdated, create=True), \
+                mock.patch('recipes.models.get_food_catalog', return_value=outdated):
+            recompute_stale_nutrition()
+        self.bread.refresh_from_db()
+        self.assertAlmostEqual(self.bread.total_calories, 400)
+    
+    def test_calculation_reads_the_current_catalog(self):
+        # The catalog of responses may be of a version read before another
+        # worker's change; saved nutrition must not be calculated from it
+        outdated = get_food_catalog()
+        NutritionData.objects.filter(pk=self.flour.pk).update(calories=400)
+        bump_dataset_version()
+        with mock.patch('nutrition.catalog.recent_dataset_version', return_value=outdated.version):
+            self.assertIs(get_food_catalog(), outdated)
+            self.bread.calculate_nutrition()
+        self.bread.refresh_from_db()
+        self.assertAlmostEqual(self.bread.total_calories, 400)
+    
+    def test_changes_schedule_one_pass(self):
+        with mock.patch('recipes.invalidation.threading.Timer') as timer:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.flour.calories = 400
+                self.flour.save()
+                self.conversion.grams_per_unit = 220
+                self.conversion.save()
+        timer.assert_called_once()
+        timer.return_value.start.assert_called_once()
+    
+    def test_staleness_metrics(self):
+        collect_staleness()
+        self.assertEqual(STALE_RECIPES.value(), 0)
+        self.flour.delete()
+        collect_staleness()
+        self.assertEqual(STALE_RECIPES.value(), 1)
+        
+        stdout = io.StringIO()
+        call_command('recompute_stale_nutrition', stdout=stdout)
+        self.assertIn("Recomputed the nutrition of 1 stale recipes", stdout.getvalue())
+        collect_staleness()
+        self.assertEqual(STALE_RECIPES.value(), 0)
+
+
+@skipUnless(connection.vendor == 'postgresql', "needs row locks and concurrent connections")
+class RecipeNutritionInvalidationRaceTest(TransactionTestCase):
+    """Test a food change committed while a recompute batch holds its recipes"""
+    
+    def setUp(self):
+        user = User.objects.create_user(username="testuser", password="testpassword")
+        food_group = FoodGroup.objects.create(name="Baking")
+        gram = MeasurementUnit.objects.create(name="gram", abbreviation="g", type="weight")
+        self.flour = NutritionData.objects.create(
+            name="flour", food_group=food_group, calories=364, protein=10, carbohydrates=76, fat=1, fiber=3
+        )
+        self.bread = Recipe.objects.create(title="Bread", user=user, servings=2)
+        RecipeIngredient.objects.create(recipe=self.bread, food=self.flour, quantity=100, unit=gram)
+        self.flour.calories = 380
+        self.flour.save()
+    
+    def lock_waiters(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT count(*) FROM pg_stat_activity WHERE datname = current_database() AND wait_event_type = 'Lock'"
+            )
+            return cursor.fetchone()[0]
+    
+    def test_change_during_recompute_marks_the_recipe_again(self):
+        foods_read, resume_batch = threading.Event(), threading.Event()
+        from_database = FoodCatalog.from_database
+        
+        def read_then_wait(*args, **kwargs):
+            catalog = from_database(*args, **kwargs)
+            foods_read.set()
+            resume_batch.wait(10)
+            return catalog
+        
+        def run_batch():
+            try:
+                recompute_batch(10)
+            finally:
+                connection.close()
+        
+        def change_food():
+            try:
+                with transaction.atomic():
+                    flour = NutritionData.objects.get(pk=self.flour.pk)
+                    flour.calories = 400
+                    flour.save()
+            finally:
+                connection.close()
+        
+        with mock.patch.object(FoodCatalog, 'from_database', read_then_wait), \
+                override_settings(NUTRITION_RECOMPUTE_DELAY=None):
+            batch = threading.Thread(target=run_batch)
+            batch.start()
+            self.assertTrue(foods_read.wait(10))
+            change = threading.Thread(target=change_food)
+            change.start()
+            # The change waits for the batch's lock on the recipe
+            deadline = time.monotonic() + 5
+            while not self.lock_waiters() and time.monotonic() < deadline:
+                time.sleep(0.01)
+            resume_batch.set()
+            batch.join(10)
+            change.join(10)
+        
+        self.bread.refresh_from_db()
+        # The batch wrote the totals of the food it read, and the change marked them stale again
+        self.assertAlmostEqual(self.bread.total_calories, 380)
+        self.assertIsNotNone(self.bread.nutrition_stale_since)
+        
+        recompute_stale_nutrition()
+        self.bread.refresh_from_db()
+        self.assertAlmostEqual(self.bread.total_calories, 400)
+
+
+class RecipeTransferTest(TestCase):
+    """Test the NDJSON recipe export and import"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="alice", password="testpassword")
+        self.other = User.objects.create_user(username="bob", password="testpassword")
+        self.client.force_authenticate(user=self.other)
+        food_group = FoodGroup.objects.create(name="Baking")
+        self.cup = MeasurementUnit.objects.create(name="cup", abbreviation="c", type="volume")
+        self.flour = NutritionData.objects.create(
+            name="Wheat Flour", food_group=food_group, calories=364, protein=10, carbohydrates=76, fat=1
+        )
+        FoodConversion.objects.create(food=self.flour, unit=self.cup, grams_per_unit=120)
+        self.recipe = Recipe.objects.create(
+            title="Pancakes", user=self.user, servings=4, instructions="Mix and fry.", prep_time=10
+        )
+        RecipeIngredient.objects.create(
+            recipe=self.recipe, food=self.flour, quantity=2, unit=self.cup, original_text="2 cups flour", is_parsed=True
+        )
+        RecipeIngredient.objects.create(recipe=self.recipe, original_text="a pinch of love")
+        for name in ("breakfast", "sweet"):
+            RecipeTag.objects.create(recipe=self.recipe, tag=Tag.objects.create(name=name))
+        self.recipe.calculate_nutrition()
+        self.export_url = reverse('recipe-export')
+        self.import_url = reverse('recipe-import')
+    
+    def exported(self, **params):
+        response = self.client.get(self.export_url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return b''.join(response.streaming_content)
+    
+    def test_export(self):
+        lines = self.exported().decode().splitlines()
+        self.assertEqual(len(lines), 1)
+        record = json.loads(lines[0])
+        self.assertEqual(record['title'], "Pancakes")
+        self.assertEqual(record['user'], "alice")
+        self.assertEqual(record['tags'], ["breakfast", "sweet"])
+        self.assertEqual(record['ingredients'][0], {
+            'food': "Wheat Flour", 'unit': "cup", 'quantity': 2, 'preparation': '',
+            'original_text': "2 cups flour", 'is_parsed': True,
+        })
+        self.assertIsNone(record['ingredients'][1]['food'])
+        self.assertAlmostEqual(record['total_calories'], 2.4 * 364)
+    
+    def test_gzip_export(self):
+        response = self.client.get(self.export_url, {'compression': 'gzip'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('recipes.ndjson.gz', response['Content-Disposition'])
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), self.exported())
+    
+    def test_import(self):
+        body = self.exported() + b'not json\n\n{"title": ""}\n'
+        response = self.client.post(self.import_url, body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['recipes'], 1)
+        self.assertEqual(response.data['ingredients'], 2)
+        self.assertEqual(response.data['skipped'], 2)
+        self.assertEqual([error['line'] for error in response.data['errors']], [2, 4])
+        
+        recipe = Recipe.objects.get(user=self.other)
+        self.assertEqual(recipe.title, "Pancakes")
+        self.assertEqual(recipe.prep_time, 10)
+        self.assertAlmostEqual(recipe.calories_per_serving, 2.4 * 364 / 4)
+        self.assertIsNotNone(recipe.nutrition_stale_since)
+        self.assertEqual(sorted(recipe.recipe_tags.values_list('tag__name', flat=True)), ["breakfast", "sweet"])
+        self.assertEqual(Tag.objects.count(), 2)
+        self.assertEqual(
+            list(recipe.ingredients.values_list('food_id', 'unit_id', 'original_text')),
+            [(self.flour.id, self.cup.id, "2 cups flour"), (None, None, "a pinch of love")]
+        )
+    
+    def test_gzip_import(self):
+        body = gzip.compress(self.exported())
+        response = self.client.post(self.import_url, body, content_type='application/gzip')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['recipes'], 1)
+        
+        response = self.client.post(self.import_url, b'\x1f\x8bcorrupt', content_type='application/gzip')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_commands_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'recipes.ndjson.gz')
+            call_command('export_recipes', path, stderr=io.StringIO())
+            Recipe.objects.all().delete()
+            
+            stdout = io.StringIO()
+            call_command('import_recipes', path, batch_size=1, stdout=stdout, stderr=io.StringIO())
+        self.assertIn("Imported 1 recipes with 2 ingredients", stdout.getvalue())
+        # Owned by the user named in the file
+        recipe = Recipe.objects.get()
+        self.assertEqual(recipe.user, self.user)
+        self.assertEqual(recipe.ingredients.count(), 2)
+        
+        recompute_stale_nutrition()
+        recipe.refresh_from_db()
+        self.assertAlmostEqual(recipe.total_calories, 2.4 * 364)
+        self.assertIsNone(recipe.nutrition_stale_since)
+
+
+class RecipeSearchTest(TestCase):
+    """Test full-text recipe search and its fallback"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username="testuser",
+            email="test@example.com",
+            password="testpassword"
+        )
+        self.client.force_authenticate(user=self.user)
+        
+        food_group = FoodGroup.objects.create(name="Test Food Group")
+        self.tomato = NutritionData.objects.create(
+            name="Tomato",
+            food_group=food_group,
+            calories=18,
+            protein=0.9,
+            carbohydrates=3.9,
+            fat=0.2
+        )
+        
+        self.soup = Recipe.objects.create(
+            title="Tomato Soup",
+            user=self.user,
+            description="A warming soup"
+        )
+        self.salad = Recipe.objects.create(
+            title="Summer Salad",
+            user=self.user,
+            description="Fresh and crunchy",
+            instructions="Slice the tomato and toss with the dressing"
+        )
+        self.pasta = Recipe.objects.create(
+            title="Pasta",
+            user=self.user,
+            description="Weeknight dinner"
+        )
+        for text in ["2 tomatoes", "1 tomato, diced"]:
+            RecipeIngredient.objects.create(
+                recipe=self.pasta,
+                food=self.tomato,
+                quantity=1,
+                original_text=text
+            )
+        self.url = reverse('recipe-list')
+    
+    def search(self, query):
+        response = self.client.get(self.url, {'search': query})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [recipe['title'] for recipe in response.data['results']]
+    
+    def test_search_matches_title_instructions_and_foods(self):
+        titles = self.search('tomato')
+        self.assertCountEqual(titles, ["Tomato Soup", "Summer Salad", "Pasta"])
+    
+    def test_search_returns_no_duplicates(self):
+        """A recipe with several matching ingredients is returned once"""
+        self.assertEqual(self.search('tomato').count("Pasta"), 1)
+    
+    def test_search_without_match(self):
+        self.assertEqual(self.search('chocolate'), [])
+    
+    def test_results_ordered_by_rank(self):
+        if not full_text_search_available():
+            self.skipTest("Ranking requires PostgreSQL full-text search")
+        self.assertEqual(self.search('tomato')[0], "Tomato Soup")
+    
+    def test_search_document_follows_food_rename(self):
+        if not full_text_search_available():
+            self.skipTest("Search documents are only maintained on PostgreSQL")
+        self.tomato.name = "Heirloom Tomato"
+        self.tomato.save()
+        self.assertEqual(self.search('heirloom'), ["Pasta"])
+    
+    def test_food_saved_without_rename_keeps_search_documents(self):
+        if not full_text_search_available():
+            self.skipTest("Search documents are only maintained on PostgreSQL")
+        self.tomato.calories = 20
+        with mock.patch('recipes.signals.update_search_documents') as update:
+            self.tomato.save()
+            self.tomato.save(update_fields=['calories'])
+        update.assert_not_called()
+    
+    def test_nutrition_calculation_keeps_search_document(self):
+        with mock.patch('recipes.signals.update_search_documents') as update:
+            self.pasta.calculate_nutrition()
+        update.assert_not_called()
+    
+    def test_parsed_recipe_is_found_by_its_foods(self):
+        if not full_text_search_available():
+            self.skipTest("Search documents are only maintained on PostgreSQL")
+        save_parsed_recipe(
+            self.user, "Weekday Supper", "3 tomatoes", 2, {},
+            [{'food': self.tomato, 'quantity': 3, 'original_text': "3 tomatoes", 'is_parsed': True}]
+        )
+        self.assertIn("Weekday Supper", self.search('tomato'))
+
+
+class RecipeFavoriteTest(TestCase):
+    """Test the favorite toggle and maintained favorite counts"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username="testuser",
+            email="test@example.com",
+            password="testpassword"
+        )
+        self.other_user = User.objects.create_user(
+            username="otheruser",
+            email="other@example.com",
+            password="testpassword"
+        )
+        self.client.force_authenticate(user=self.user)
+        
+        self.recipe = Recipe.objects.create(title="Test Recipe", user=self.user)
+        self.popular = Recipe.objects.create(title="Popular Recipe", user=self.user)
+        self.favorite_url = reverse('recipe-favorite', args=[self.recipe.id])
+    
+    def test_toggle_favorite(self):
+        response = self.client.post(self.favorite_url)
+        self.assertEqual(response.data['status'], 'added to favorites')
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorite_count, 1)
+        self.assertTrue(self.user.profile.favorite_recipes.filter(pk=self.recipe.pk).exists())
+        
+        response = self.client.post(self.favorite_url)
+        self.assertEqual(response.data['status'], 'removed from favorites')
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorite_count, 0)
+    
+    def test_toggle_does_not_load_all_favorites(self):
+        """The toggle cost must not depend on how many favorites the user has"""
+        self.user.profile.favorite_recipes.add(*[
+            Recipe.objects.create(title=f"Recipe {i}", user=self.user) for i in range(10)
+        ])
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(self.favorite_url)
+        favorites_table = self.user.profile.favorite_recipes.through._meta.db_table
+        for query in queries.captured_queries:
+            if query['sql'].startswith('SELECT') and favorites_table in query['sql']:
+                self.assertIn(str(self.recipe.pk), query['sql'])
+    
+    def test_counts_follow_reverse_and_clear(self):
+        self.popular.favorited_by.add(self.user.profile, self.other_user.profile)
+        self.popular.refresh_from_db()
+        self.assertEqual(self.popular.favorite_count, 2)
+        
+        self.user.profile.favorite_recipes.clear()
+        self.popular.refresh_from_db()
+        self.assertEqual(self.popular.favorite_count, 1)
+    
+    def test_order_by_most_favorited(self):
+        self.popular.favorited_by.add(self.user.profile, self.other_user.profile)
+        self.recipe.favorited_by.add(self.user.profile)
+        response = self.client.get(reverse('recipe-list'), {'ordering': '-favorite_count'})
+        self.assertEqual(
+            [r['title'] for r in response.data['results']],
+            ["Popular Recipe", "Test Recipe"]
+        )
+
+
+class RecipeParseTimingTest(TestCase):
+    """Test the per-stage timings of the parse endpoint"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.force_authenticate(user=self.user)
+        
+        food_group = FoodGroup.objects.create(name="Baking")
+        self.flour = NutritionData.objects.create(
+            name="flour", food_group=food_group, calories=364, protein=10, carbohydrates=76, fat=1
+        )
+        self.gram = MeasurementUnit.objects.create(name="gram", abbreviation="g", type="weight")
+        self.data = {
+            'recipe_text': "Ingredients:\n250 g flour\n1 pinch saffron\n\nInstructions:\n1. Mix",
+            'title': 'Timed Recipe',
+        }
+        STAGE_DURATIONS.reset()
+        QUERY_COUNTS.reset()
+    
+    def test_server_timing_header(self):
+        response = self.client.post(reverse('recipe-parse'), self.data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        metrics = {metric.split(';')[0] for metric in response['Server-Timing'].split(', ')}
+        self.assertTrue({'section', 'regex', 'match', 'serialize', 'total', 'db'} <= metrics)
+    
+    def test_matched_ingredients_are_rendered_as_ids(self):
+        response = self.client.post(reverse('recipe-parse'), dict(self.data, save_recipe=True), format='json')
+        matched = response.json()['matched_ingredients']
+        self.assertEqual(matched[0]['food'], self.flour.pk)
+        self.assertEqual(matched[0]['unit'], self.gram.pk)
+        self.assertIsNone(matched[1]['unit'])
+        self.assertIn('db_write', response['Server-Timing'])
+    
+    def test_histograms_and_staff_endpoint(self):
+        self.client.post(reverse('recipe-parse'), self.data, format='json')
+        self.assertEqual(STAGE_DURATIONS.snapshot()['match']['count'], 1)
+        self.assertEqual(QUERY_COUNTS.snapshot()['parse']['count'], 1)
+        
+        url = reverse('recipe-parse-timings')
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+        
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['stages']['total']['count'], 1)
+        # The last bucket is +Inf and holds the cumulative count
+        self.assertEqual(response.data['queries']['parse']['buckets'][-1], (None, 1))
+
+
+class RecipeParseStreamTest(TestCase):
+    """Test the streaming parse endpoint"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.force_authenticate(user=self.user)
+        
+        food_group = FoodGroup.objects.create(name="Baking")
+        self.flour = NutritionData.objects.create(
+            name="flour", food_group=food_group, calories=364, protein=10, carbohydrates=76, fat=1
+        )
+        self.gram = MeasurementUnit.objects.create(name="gram", abbreviation="g", type="weight")
+        self.url = reverse('recipe-parse-stream')
+        self.data = {'recipe_text': "Ingredients:\n100 g flour\n1 pinch saffron\n\nInstructions:\n1. Mix"}
+    
+    def test_ndjson_records(self):
+        response = self.client.post(self.url, self.data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        
+        records = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([record['type'] for record in records], ['ingredient', 'ingredient', 'instructions', 'totals'])
+        self.assertEqual(records[0]['food'], self.flour.pk)
+        self.assertEqual(records[0]['unit'], self.gram.pk)
+        self.assertEqual(records[1]['unit_name'], 'pinch')
+        self.assertFalse(records[1]['is_parsed'])
+        self.assertEqual(records[2]['instructions'], '1. Mix')
+        self.assertEqual(records[3]['matched'], 1)
+        self.assertAlmostEqual(records[3]['calories'], 364)
+    
+    def test_event_stream(self):
+        response = self.client.post(self.url, self.data, format='json', HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response['Content-Type'], 'text/event-stream; charset=utf-8')
+        events = b''.join(response.streaming_content).decode().split('\n\n')
+        self.assertTrue(events[0].startswith('event: ingredient\ndata: {'))
+        self.assertTrue(events[-2].startswith('event: totals\n'))
+    
+    def test_validation_errors(self):
+        response = self.client.post(self.url, dict(self.data, save_recipe=True), format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(json.loads(response.content)['type'], 'error')
+        
+        response = self.client.post(self.url, {}, format='json')
+        self.assertIn('recipe_text', json.loads(response.content)['errors'])
+    
+    @override_settings(PARSE_STREAM_MAX_LINES=3)
+    def test_long_texts_are_rejected(self):
+        response = self.client.post(self.url, self.data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('recipe_text', json.loads(response.content)['errors'])
+    
+    def test_lines_are_classified_as_they_are_reached(self):
+        text = "100 g flour\n" + "Stir for 2 minutes\n" * 20
+        with mock.patch('recipes.parser.is_ingredient_line', wraps=is_ingredient_line) as classify:
+            records = parse_records(text)
+            first = next(records)
+            self.assertEqual(first['food'], self.flour.pk)
+            self.assertEqual(classify.call_count, 1)
+            list(records)
+        self.assertEqual(classify.call_count, 21)
+    
+    async def test_streams_asynchronously_under_asgi(self):
+        token = await Token.objects.acreate(user=self.user)
+        response = await self.async_client.post(
+            self.url, self.data, content_type='application/json', headers={'Authorization': f"Token {token.key}"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.is_async)
+        chunks = [chunk async for chunk in response.streaming_content]
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(json.loads(chunks[0])['food'], self.flour.pk)
+
+
+class AsyncRecipeParseTest(TestCase):
+    """Test the async parse endpoint against RecipeViewSet.parse"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.token = Token.objects.create(user=self.user)
+        self.headers = {'Authorization': f"Token {self.token.key}"}
+        
+        food_group = FoodGroup.objects.create(name="Baking")
+        self.flour = NutritionData.objects.create(
+            name="flour", food_group=food_group, calories=364, protein=10, carbohydrates=76, fat=1
+        )
+        NutritionData.objects.create(
+            name="Sugar, granulated", food_group=food_group, calories=387, protein=0, carbohydrates=100, fat=0
+        )
+        MeasurementUnit.objects.create(name="gram", abbreviation="g", type="weight")
+        self.url = reverse('recipe-parse-async')
+        self.data = {
+            'recipe_text': "Ingredients:\n250 g flour\n2 tbsp sugar\n1 pinch saffron\n\nInstructions:\n1. Mix",
+            'title': 'Async Recipe',
+        }
+    
+    async def post(self, data, **kwargs):
+        kwargs.setdefault('headers', self.headers)
+        return await self.async_client.post(self.url, data, content_type='application/json', **kwargs)
+    
+    async def test_matches_sync_endpoint(self):
+        response = await self.post(self.data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('regex', response['Server-Timing'])
+        
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        expected = await sync_to_async(client.post)(reverse('recipe-parse'), self.data, format='json')
+        self.assertEqual(response.json(), expected.json())
+    
+    async def test_save_recipe(self):
+        response = await self.post(dict(self.data, save_recipe=True))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        recipe = await Recipe.objects.aget(pk=response.json()['recipe']['id'])
+        self.assertEqual(recipe.title, 'Async Recipe')
+        self.assertEqual(await recipe.ingredients.acount(), 3)
+        self.assertGreaterEqual(recipe.total_calories, 910)
+    
+    async def test_authentication_and_validation(self):
+        response = await self.post(self.data, headers={})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response['WWW-Authenticate'], 'Token')
+        
+        response = await self.post({'title': 'No text'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('recipe_text', response.json())
+        
+        response = await self.async_client.get(self.url, headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+    
+    async def test_busy_pool_returns_503(self):
+        with mock.patch('recipes.async_views.aparse_recipe_text', side_effect=ParsePoolBusy("busy")):
+            response = await self.post(self.data)
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '1')
+
+
+class RecipeQueryBudgetTest(ViewSetQueryBudgetMixin, TestCase):
+    """Query budgets of the recipe and tag endpoints; fixtures have several rows to expose N+1s"""
+    viewsets = [RecipeViewSet, TagViewSet]
+    
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.staff = User.objects.create_user(username="staff", password="testpassword", is_staff=True)
+        food_group = FoodGroup.objects.create(name="Baking")
+        unit = MeasurementUnit.objects.create(name="gram", abbreviation="g", type="weight")
+        foods = [
+            NutritionData.objects.create(
+                name=name, food_group=food_group, calories=100, protein=5, carbohydrates=20, fat=1
+            )
+            for name in ("flour", "sugar", "butter")
+        ]
+        self.tags = [Tag.objects.create(name=name) for name in ("baking", "dessert", "quick")]
+        self.recipes = []
+        for i in range(3):
+            recipe = Recipe.objects.create(title=f"Recipe {i}", user=self.user, servings=2)
+            for food in foods:
+                RecipeIngredient.objects.create(
+                    recipe=recipe, food=food, unit=unit, quantity=100, original_text=f"100 g {food.name}"
+                )
+            for tag in self.tags:
+                RecipeTag.objects.create(recipe=recipe, tag=tag)
+            self.recipes.append(recipe)
+        self.user.profile.favorite_recipes.add(*self.recipes)
+    
+    def get_budgets(self):
+        recipe_url = reverse('recipe-detail', args=[self.recipes[0].id])
+        tag_url = reverse('tag-detail', args=[self.tags[0].id])
+        recipe_data = {'title': 'Budget Recipe', 'instructions': 'Mix', 'servings': 2}
+        return {
+            (RecipeViewSet, 'list'): Budget('get', reverse('recipe-list'), 3),
+            (RecipeViewSet, 'create'): Budget('post', reverse('recipe-list'), 4, recipe_data, status.HTTP_201_CREATED),
+            (RecipeViewSet, 'retrieve'): Budget('get', recipe_url, 3),
+            # Updates reload the saved recipe with its relations for the response
+            (RecipeViewSet, 'update'): Budget('put', recipe_url, 8, recipe_data, allow_duplicates=True),
+            (RecipeViewSet, 'partial_update'): Budget('patch', recipe_url, 8, {'servings': 4}, allow_duplicates=True),
+            (RecipeViewSet, 'destroy'): Budget('delete', recipe_url, 7, status=status.HTTP_204_NO_CONTENT),
+            # The search document is written on create and again once the ingredients exist
+            (RecipeViewSet, 'parse'): Budget('post', reverse('recipe-parse'), 16, {
+                'recipe_text': "Ingredients:\n100 g flour\n50 g sugar\n1 pinch salt\n\nInstructions:\nMix",
+                'save_recipe': True,
+            }, allow_duplicates=True),
+            # Each line is matched on its own so its record can be sent right away
+            (RecipeViewSet, 'parse_stream'): Budget('post', reverse('recipe-parse-stream'), 8, {
+                'recipe_text': "Ingredients:\n100 g flour\n50 g sugar\n1 pinch salt\n\nInstructions:\nMix",
+            }, allow_duplicates=True),
+            (RecipeViewSet, 'parse_timings'): Budget('get', reverse('recipe-parse-timings'), 0, user=self.staff),
+            (RecipeViewSet, 'favorite'): Budget('post', reverse('recipe-favorite', args=[self.recipes[0].id]), 5),
+            # The food catalog and units, then the recipes with their ingredients and tags in one chunk
+            (RecipeViewSet, 'export'): Budget('get', reverse('recipe-export'), 5),
+            # The food catalog and units, then per batch the recipes, tags, ingredients and search documents
+            (RecipeViewSet, 'bulk_import'): Budget('post', reverse('recipe-import'), 8, [
+                {'title': 'Imported', 'tags': ['baking', 'new'], 'ingredients': [
+                    {'food': 'flour', 'unit': 'gram', 'quantity': 100, 'original_text': '100 g flour'}
+                ]},
+            ], status.HTTP_201_CREATED),
+            (TagViewSet, 'list'): Budget('get', reverse('tag-list'), 2),
+            (TagViewSet, 'create'): Budget('post', reverse('tag-list'), 2, {'name': 'vegan'}, status.HTTP_201_CREATED),
+            (TagViewSet, 'retrieve'): Budget('get', tag_url, 1),
+            (TagViewSet, 'update'): Budget('put', tag_url, 3, {'name': 'baked'}),
+            (TagViewSet, 'partial_update'): Budget('patch', tag_url, 3, {'name': 'baked'}),
+            (TagViewSet, 'destroy'): Budget('delete', tag_url, 3, status=status.HTTP_204_NO_CONTENT),
+        }
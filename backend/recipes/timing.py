@@ -0,0 +1,146 @@
+import contextvars
+import functools
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+from django.db import connection
+from nutriparse_project.metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+
+# Aggregated stage durations (milliseconds) and queries per parse request
+STAGE_DURATIONS = Histogram(
+    'nutriparse_parse_stage_milliseconds', 'Recipe parse pipeline stage durations',
+    ['stage'],
+    buckets=[1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+)
+QUERY_COUNTS = Histogram(
+    'nutriparse_parse_queries', 'Database queries per recipe parse request',
+    ['endpoint'],
+    buckets=[1, 2, 5, 10, 20, 50, 100, 200, 500]
+)
+SPACY_INVOCATIONS = Counter('nutriparse_spacy_invocations_total', 'Calls of the spaCy pipeline')
+LINE_DECISIONS = Counter(
+    'nutriparse_ingredient_line_decisions_total',
+    'Header-less recipe lines classified by the rules or by the spaCy model',
+    ['method']
+)
+
+# Timings of the request being handled in the current context, if any
+_current_timings = contextvars.ContextVar('recipe_parse_timings', default=None)
+
+
+class ParseTimings:
+    """Stage durations and query count collected for a single request"""
+    def __init__(self):
+        self.stages = {}
+        self.queries = 0
+        self.start = time.perf_counter()
+        self.total = None
+
+    def add(self, name, duration):
+        # Stages entered several times (e.g. spaCy per line) accumulate
+        self.stages[name] = self.stages.get(name, 0.0) + duration
+
+    def count_query(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    def finish(self):
+        self.total = (time.perf_counter() - self.start) * 1000
+
+    def server_timing(self):
+        """Format the timings as a Server-Timing header value"""
+        metrics = [f"{name};dur={duration:.2f}" for name, duration in self.stages.items()]
+        if self.total is not None:
+            metrics.append(f"total;dur={self.total:.2f}")
+        if self.queries is not None:
+            metrics.append(f'db;desc="{self.queries} queries"')
+        return ', '.join(metrics)
+
+    def as_dict(self):
+        return {
+            'stages_ms': {name: round(duration, 3) for name, duration in self.stages.items()},
+            'total_ms': round(self.total, 3) if self.total is not None else None,
+            'queries': self.queries,
+        }
+
+
+@contextmanager
+def stage(name):
+    """
+    Time a pipeline stage, adding it to the current request's timings and to
+    the aggregated histogram
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = (time.perf_counter() - start) * 1000
+        timings = _current_timings.get()
+        if timings is not None:
+            timings.add(name, duration)
+        STAGE_DURATIONS.observe(duration, stage=name)
+
+
+def timed(name):
+    """Decorator timing every call of a function as a pipeline stage"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def capture_stages():
+    """Collect stage durations outside a request, e.g. in a parse worker process"""
+    timings = ParseTimings()
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+
+
+def record_stages(stages):
+    """Add stage durations measured in another process to this process's timings"""
+    timings = _current_timings.get()
+    for name, duration in stages.items():
+        if timings is not None:
+            timings.add(name, duration)
+        STAGE_DURATIONS.observe(duration, stage=name)
+
+
+@contextmanager
+def collect_timings(label, count_queries=True):
+    """
+    Collect stage timings and the number of database queries of a request,
+    then log them and record the query count. Async views pass
+    count_queries=False: their queries run on other threads' connections.
+    """
+    timings = ParseTimings()
+    token = _current_timings.set(timings)
+    try:
+        with ExitStack() as stack:
+            if count_queries:
+                stack.enter_context(connection.execute_wrapper(timings.count_query))
+            else:
+                timings.queries = None
+            yield timings
+    finally:
+        _current_timings.reset(token)
+        timings.finish()
+        STAGE_DURATIONS.observe(timings.total, stage='total')
+        if timings.queries is not None:
+            QUERY_COUNTS.observe(timings.queries, endpoint=label)
+        logger.info(
+            "%s timings: %s",
+            label,
+            ' '.join(f"{name}={duration:.2f}ms" for name, duration in timings.stages.items())
+            + f" total={timings.total:.2f}ms queries={timings.queries}",
+            extra={'timings': timings.as_dict()},
+        )
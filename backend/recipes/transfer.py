@@ -0,0 +1,252 @@
+"""
+Bulk export and import of recipes as NDJSON.
+
+Every line holds one recipe with its ingredients and tags:
+
+    {"title": "Pancakes", "user": "alice", "servings": 4, ..., "tags": ["breakfast"],
+     "ingredients": [{"food": "Wheat flour", "unit": "cup", "quantity": 2, ...}]}
+
+Foods and units are referenced by name, as their ids differ between
+environments. The export reads recipes through a server-side cursor, chunk by
+chunk, and the import writes them with bulk_create in batches, so memory is
+bounded by RECIPE_TRANSFER_BATCH_SIZE recipes however large the file. Files
+may be gzip-compressed.
+
+Imported recipes keep the nutrition totals of the file but are marked stale,
+so they are recomputed against this environment's foods (recipes.invalidation).
+"""
+import json
+from itertools import islice
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from nutrition.catalog import get_food_catalog
+from nutrition.models import MeasurementUnit
+
+from .invalidation import scheduler
+from .models import Recipe, RecipeIngredient, Tag, RecipeTag
+from .search import update_search_documents
+
+RECIPE_FIELDS = (
+    'title', 'description', 'instructions', 'servings', 'prep_time', 'cook_time', 'original_text',
+    'source_url', 'source_name', 'total_calories', 'total_protein', 'total_carbs', 'total_fat', 'total_fiber',
+)
+INGREDIENT_FIELDS = ('quantity', 'preparation', 'original_text', 'is_parsed')
+
+# Errors listed in an import's result; the rest are only counted
+MAX_REPORTED_ERRORS = 20
+# Rows per INSERT statement; larger statements are slower to build than to run
+INSERT_BATCH_SIZE = 1000
+
+
+class RecipeImportError(ValueError):
+    """A line of an import that cannot be read as a recipe"""
+
+
+def export_recipes(recipes, chunk_size=None):
+    """Yield a record for every recipe of a queryset, reading chunk_size recipes at a time"""
+    chunk_size = chunk_size or settings.RECIPE_TRANSFER_BATCH_SIZE
+    catalog = get_food_catalog()
+    units = dict(MeasurementUnit.objects.values_list('pk', 'name'))
+    # Rows rather than instances; the ingredients and tags are read per chunk
+    rows = recipes.order_by('pk').values_list('pk', 'user__username', 'image', *RECIPE_FIELDS).iterator(chunk_size)
+    while chunk := list(islice(rows, chunk_size)):
+        ids = [row[0] for row in chunk]
+        ingredients = {pk: [] for pk in ids}
+        for recipe_id, food_id, unit_id, *values in RecipeIngredient.objects.filter(recipe_id__in=ids).order_by(
+            'pk'
+        ).values_list('recipe_id', 'food_id', 'unit_id', *INGREDIENT_FIELDS):
+            food = catalog.get(food_id)
+            ingredients[recipe_id].append({
+                'food': food.name if food is not None else None,
+                'unit': units.get(unit_id),
+                **dict(zip(INGREDIENT_FIELDS, values)),
+            })
+        tags = {pk: [] for pk in ids}
+        for recipe_id, name in RecipeTag.objects.filter(recipe_id__in=ids).order_by('tag__name').values_list(
+            'recipe_id', 'tag__name'
+        ):
+            tags[recipe_id].append(name)
+
+        for pk, username, image, *values in chunk:
+            yield {
+                **dict(zip(RECIPE_FIELDS, values)),
+                'user': username,
+                'image': image or '',
+                'tags': tags[pk],
+                'ingredients': ingredients[pk],
+            }
+
+
+def export_lines(recipes, chunk_size=None):
+    """export_recipes() as NDJSON lines"""
+    for record in export_recipes(recipes, chunk_size):
+        yield json.dumps(record) + '\n'
+
+
+def _clean(field, value):
+    try:
+        return field.clean(value, None)
+    except ValidationError as e:
+        raise RecipeImportError(f"{field.name}: {' '.join(e.messages)}")
+
+
+def _cleaner(model, names):
+    """A function validating the named fields of a record, with the model's defaults for missing ones"""
+    fields = [(model._meta.get_field(name), model._meta.get_field(name).get_default()) for name in names]
+
+    def clean(data):
+        return {field.name: _clean(field, data.get(field.name, default)) for field, default in fields}
+    return clean
+
+
+class RecipeImporter:
+    """
+    Imports recipe records in batches. Recipes belong to `user` when given,
+    else to the user named by their record.
+    """
+
+    def __init__(self, user=None, batch_size=None):
+        self.user = user
+        self.batch_size = batch_size or settings.RECIPE_TRANSFER_BATCH_SIZE
+        self.catalog = get_food_catalog()
+        self.units = {}
+        for pk, name, abbreviation in MeasurementUnit.objects.order_by('pk').values_list('pk', 'name', 'abbreviation'):
+            self.units.setdefault(name.lower(), pk)
+            self.units.setdefault(abbreviation.lower(), pk)
+        # Ids of the tags and users seen so far, by name
+        self.tag_ids = {}
+        self.user_ids = {}
+        self.clean_recipe = _cleaner(Recipe, RECIPE_FIELDS)
+        self.clean_ingredient = _cleaner(RecipeIngredient, INGREDIENT_FIELDS)
+        self.result = {'recipes': 0, 'ingredients': 0, 'unmatched_foods': 0, 'skipped': 0, 'errors': []}
+        self._batch = []
+
+    def run(self, records):
+        """
+        Import NDJSON lines (str or bytes) or already decoded records, and
+        return the counts of imported recipes, ingredients and skipped lines
+        """
+        for number, record in enumerate(records, 1):
+            try:
+                if not isinstance(record, dict):
+                    if not record.strip():
+                        continue
+                    try:
+                        record = json.loads(record)
+                    except ValueError as e:
+                        raise RecipeImportError(f"Invalid JSON: {e}")
+                self._batch.append((number, *self.build(record)))
+            except RecipeImportError as e:
+                self.error(number, e)
+            if len(self._batch) >= self.batch_size:
+                self.flush()
+        self.flush()
+        return self.result
+
+    def error(self, number, error):
+        self.result['skipped'] += 1
+        if len(self.result['errors']) < MAX_REPORTED_ERRORS:
+            self.result['errors'].append({'line': number, 'error': str(error)})
+
+    def build(self, record):
+        """
+        The unsaved recipe, ingredients, tag names and owner of a record, and
+        the number of its ingredients naming a food this environment lacks
+        """
+        if not isinstance(record, dict):
+            raise RecipeImportError("Expected a JSON object")
+        recipe = Recipe(**self.clean_recipe(record))
+        recipe.image = _clean(Recipe._meta.get_field('image'), record.get('image') or '')
+
+        ingredients, unmatched = [], 0
+        for data in record.get('ingredients') or []:
+            if not isinstance(data, dict):
+                raise RecipeImportError("ingredients: Expected JSON objects")
+            ingredient = RecipeIngredient(**self.clean_ingredient(data))
+            if data.get('food'):
+                food = self.catalog.by_name.get(str(data['food']).lower())
+                if food is not None:
+                    ingredient.food_id = food.id
+                else:
+                    unmatched += 1
+            if data.get('unit'):
+                ingredient.unit_id = self.units.get(str(data['unit']).lower())
+            ingredients.append(ingredient)
+
+        tags = record.get('tags') or []
+        if not isinstance(tags, list):
+            raise RecipeImportError("tags: Expected a list of names")
+        name_field = Tag._meta.get_field('name')
+        tags = list(dict.fromkeys(_clean(name_field, name) for name in tags))
+
+        username = None
+        if self.user is None:
+            username = record.get('user')
+            if not isinstance(username, str) or not username:
+                raise RecipeImportError("user: A username is required")
+        return recipe, ingredients, tags, username, unmatched
+
+    def flush(self):
+        """Write the pending batch in one transaction"""
+        batch, self._batch = self._batch, []
+        if not batch:
+            return
+
+        owners = self._resolve_users({entry[4] for entry in batch if entry[4] is not None})
+        now = timezone.now()
+        recipes, pending, unmatched_foods = [], [], 0
+        for number, recipe, ingredients, tags, username, unmatched in batch:
+            if self.user is not None:
+                recipe.user = self.user
+            elif username in owners:
+                recipe.user_id = owners[username]
+            else:
+                self.error(number, RecipeImportError(f"user: No user named {username!r}"))
+                continue
+            recipe.update_nutrition_per_serving()
+            # Recomputed with this environment's foods
+            recipe.nutrition_stale_since = now
+            recipes.append(recipe)
+            pending.append((recipe, ingredients, tags))
+            unmatched_foods += unmatched
+        if not recipes:
+            return
+
+        with transaction.atomic():
+            Recipe.objects.bulk_create(recipes, batch_size=INSERT_BATCH_SIZE)
+            tag_ids = self._resolve_tags({name for _, _, tags in pending for name in tags})
+            all_ingredients, recipe_tags = [], []
+            for recipe, ingredients, tags in pending:
+                for ingredient in ingredients:
+                    ingredient.recipe = recipe
+                all_ingredients.extend(ingredients)
+                recipe_tags.extend(RecipeTag(recipe=recipe, tag_id=tag_ids[name]) for name in tags)
+            RecipeIngredient.objects.bulk_create(all_ingredients, batch_size=INSERT_BATCH_SIZE)
+            RecipeTag.objects.bulk_create(recipe_tags, batch_size=INSERT_BATCH_SIZE)
+            update_search_documents([recipe.pk for recipe in recipes])
+            transaction.on_commit(scheduler.schedule)
+
+        self.result['recipes'] += len(recipes)
+        self.result['ingredients'] += len(all_ingredients)
+        self.result['unmatched_foods'] += unmatched_foods
+
+    def _resolve_users(self, usernames):
+        missing = usernames - self.user_ids.keys()
+        if missing:
+            self.user_ids.update(get_user_model().objects.filter(username__in=missing).values_list('username', 'pk'))
+        return self.user_ids
+
+    def _resolve_tags(self, names):
+        missing = names - self.tag_ids.keys()
+        if missing:
+            Tag.objects.bulk_create([Tag(name=name) for name in missing], ignore_conflicts=True)
+            self.tag_ids.update(Tag.objects.filter(name__in=missing).values_list('name', 'pk'))
+        return self.tag_ids
+
+
+def import_recipes(records, user=None, batch_size=None):
+    """Import NDJSON lines or decoded records with a RecipeImporter; returns its counts"""
+    return RecipeImporter(user, batch_size).run(records)
@@ -1,18 +1,30 @@
-from rest_framework import viewsets, filters, status
+from rest_framework import viewsets, filters, status, permissions
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
-from django.db.models import Q
+from django.conf import settings
+from django.db.models import Prefetch, Q
 
 from .models import Recipe, RecipeIngredient, Tag, RecipeTag
 from .serializers import (
     RecipeSerializer, RecipeLightSerializer, RecipeIngredientSerializer,
-    TagSerializer, RecipeParserSerializer
+    TagSerializer, RecipeParserSerializer, MatchedIngredientSerializer
 )
 from .parser import parse_recipe_text, match_ingredients_to_foods
+from .streaming import (
+    EventStreamRenderer, NDJSONRenderer, NDJSONParser, GzipNDJSONParser, parse_records, stream_response
+)
+from .transfer import export_recipes, import_recipes
+from .workers import ParsePoolError
+from .timing import collect_timings, stage, STAGE_DURATIONS, QUERY_COUNTS
+from .search import RecipeSearchFilter, update_search_documents
+from nutrition.filters import NutrientRangeFilter
+from nutrition.models import MeasurementUnit
+from users.models import get_profile
 
 
-class IsOwnerOrReadOnly:
+class IsOwnerOrReadOnly(permissions.BasePermission):
     """
     Custom permission to only allow owners of an object to edit it.
     """
@@ -25,6 +37,65 @@ class IsOwnerOrReadOnly:
         return obj.user == request.user
 
 
+def prefetch_recipe_relations(queryset, ingredients=False):
+    """
+    Load the user and tags (and optionally the ingredients with their food and
+    unit) rendered by the recipe serializers in a fixed number of queries
+    """
+    queryset = queryset.select_related('user').prefetch_related(
+        Prefetch('recipe_tags', queryset=RecipeTag.objects.select_related('tag'))
+    )
+    if ingredients:
+        queryset = queryset.prefetch_related(
+            Prefetch('ingredients', queryset=RecipeIngredient.objects.select_related('food__food_group', 'unit'))
+        )
+    return queryset
+
+
+def save_parsed_recipe(user, title, recipe_text, servings, parsed_data, matched_ingredients):
+    """
+    Save a parsed recipe with its matched ingredients and calculate its
+    nutrition
+    """
+    with stage('db_write'):
+        # Create a new recipe
+        recipe = Recipe.objects.create(
+            title=title,
+            user=user,
+            original_text=recipe_text,
+            servings=servings,
+            instructions=parsed_data.get('instructions', '')
+        )
+        
+        # Create recipe ingredients in one query, which sends no signals, so
+        # the search document is refreshed with their foods below
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(
+                recipe=recipe,
+                # Matched foods are food catalog records
+                food_id=getattr(ingredient_data.get('food'), 'pk', None),
+                quantity=ingredient_data.get('quantity'),
+                # Unmatched ingredients keep the parsed unit string
+                unit=ingredient_data['unit'] if isinstance(ingredient_data.get('unit'), MeasurementUnit) else None,
+                preparation=ingredient_data.get('preparation') or '',
+                original_text=ingredient_data.get('original_text', ''),
+                is_parsed=ingredient_data.get('is_parsed', False)
+            )
+            for ingredient_data in matched_ingredients
+        ])
+        update_search_documents([recipe.pk])
+        
+        # Calculate nutrition information
+        recipe.calculate_nutrition()
+    return recipe
+
+
+def saved_recipe_data(pk):
+    """Serialize a saved recipe, loaded with its ingredients and tags"""
+    recipe = prefetch_recipe_relations(Recipe.objects, ingredients=True).get(pk=pk)
+    return RecipeSerializer(recipe).data
+
+
 class RecipeViewSet(viewsets.ModelViewSet):
     """
     API endpoint for recipes
@@ -32,8 +103,15 @@ class RecipeViewSet(viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
     permission_classes = [IsAuthenticated, IsOwnerOrReadOnly]
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['title', 'description', 'ingredients__food__name']
+    filter_backends = [RecipeSearchFilter, NutrientRangeFilter, filters.OrderingFilter]
+    range_filter_fields = {
+        'calories': 'calories_per_serving',
+        'protein': 'protein_per_serving',
+        'carbs': 'carbs_per_serving',
+        'fat': 'fat_per_serving',
+        'fiber': 'fiber_per_serving',
+    }
+    ordering_fields = ['created_at', 'title', 'favorite_count'] + list(Recipe.PER_SERVING_FIELDS)
     
     def get_serializer_class(self):
         """
@@ -52,6 +130,11 @@ class RecipeViewSet(viewsets.ModelViewSet):
         username = self.request.query_params.get('username')
         if username is not None:
             queryset = queryset.filter(user__username=username)
+        
+        if self.action == 'list':
+            queryset = prefetch_recipe_relations(queryset)
+        elif self.action in ('retrieve', 'update', 'partial_update'):
+            queryset = prefetch_recipe_relations(queryset, ingredients=True)
         return queryset
     
     def perform_create(self, serializer):
@@ -60,11 +143,23 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """
         serializer.save(user=self.request.user)
     
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        # Render the response from the saved row, reloaded with its prefetched relations
+        serializer.instance = self.get_object()
+    
     @action(detail=False, methods=['post'])
     def parse(self, request):
         """
         Parse recipe text and extract ingredients
         """
+        # Time the pipeline stages; the breakdown is returned as a Server-Timing header
+        with collect_timings('parse') as timings:
+            response = self._parse_recipe(request)
+        response['Server-Timing'] = timings.server_timing()
+        return response
+    
+    def _parse_recipe(self, request):
         serializer = RecipeParserSerializer(data=request.data)
         
         if serializer.is_valid():
@@ -74,7 +169,12 @@ class RecipeViewSet(viewsets.ModelViewSet):
             save_recipe = serializer.validated_data.get('save_recipe', False)
             
             # Parse the recipe text
-            parsed_data = parse_recipe_text(recipe_text)
+            try:
+                parsed_data = parse_recipe_text(recipe_text)
+            except ParsePoolError as e:
+                return Response(
+                    {'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '1'}
+                )
             
             if 'ingredients' in parsed_data:
                 # Match ingredients to foods in our database
@@ -82,42 +182,26 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 
                 # If we need to save the recipe
                 if save_recipe:
-                    # Create a new recipe
-                    recipe = Recipe.objects.create(
-                        title=title,
-                        user=request.user,
-                        original_text=recipe_text,
-                        servings=servings,
-                        instructions=parsed_data.get('instructions', '')
+                    recipe = save_parsed_recipe(
+                        request.user, title, recipe_text, servings, parsed_data, matched_ingredients
                     )
                     
-                    # Create recipe ingredients
-                    for ingredient_data in matched_ingredients:
-                        RecipeIngredient.objects.create(
-                            recipe=recipe,
-                            food=ingredient_data.get('food'),
-                            quantity=ingredient_data.get('quantity'),
-                            unit=ingredient_data.get('unit'),
-                            preparation=ingredient_data.get('preparation', ''),
-                            original_text=ingredient_data.get('original_text', ''),
-                            is_parsed=ingredient_data.get('is_parsed', False)
-                        )
-                    
-                    # Calculate nutrition information
-                    recipe.calculate_nutrition()
-                    
-                    # Return the recipe
-                    return Response({
-                        'recipe': RecipeSerializer(recipe).data,
-                        'parsed_data': parsed_data,
-                        'matched_ingredients': matched_ingredients
-                    })
+                    # Return the recipe, reloaded with its ingredients and tags
+                    with stage('serialize'):
+                        data = {
+                            'recipe': saved_recipe_data(recipe.pk),
+                            'parsed_data': parsed_data,
+                            'matched_ingredients': MatchedIngredientSerializer(matched_ingredients, many=True).data
+                        }
+                    return Response(data)
                 
                 # Just return the parsed data
-                return Response({
-                    'parsed_data': parsed_data,
-                    'matched_ingredients': matched_ingredients
-                })
+                with stage('serialize'):
+                    data = {
+                        'parsed_data': parsed_data,
+                        'matched_ingredients': MatchedIngredientSerializer(matched_ingredients, many=True).data
+                    }
+                return Response(data)
             
             return Response({
                 'error': 'Failed to parse recipe text'
@@ -125,15 +209,91 @@ class RecipeViewSet(viewsets.ModelViewSet):
             
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+    @action(
+        detail=False, methods=['post'], url_path='parse/stream',
+        renderer_classes=[NDJSONRenderer, EventStreamRenderer]
+    )
+    def parse_stream(self, request):
+        """
+        Parse recipe text, streaming one record per ingredient as soon as it is
+        matched, then the instructions and totals (NDJSON, or Server-Sent Events
+        with Accept: text/event-stream). The recipe is not saved.
+        """
+        serializer = RecipeParserSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        if serializer.validated_data['save_recipe']:
+            return Response(
+                {'save_recipe': ["Streamed parses are not saved; use the parse endpoint"]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        text = serializer.validated_data['recipe_text']
+        max_lines = settings.PARSE_STREAM_MAX_LINES
+        if text.count('\n') >= max_lines:
+            return Response(
+                {'recipe_text': [f"Streamed parses take at most {max_lines} lines; use the parse endpoint"]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        records = parse_records(text)
+        return stream_response(request._request, records, request.accepted_renderer)
+    
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAdminUser], url_path='parse-timings')
+    def parse_timings(self, request):
+        """
+        Aggregated parse stage durations (ms) and queries per request for this process (staff only)
+        """
+        return Response({
+            'stages': STAGE_DURATIONS.snapshot(),
+            'queries': QUERY_COUNTS.snapshot(),
+        })
+    
+    @action(detail=False, methods=['get'], renderer_classes=[NDJSONRenderer])
+    def export(self, request):
+        """
+        Stream the recipes, with their ingredients and tags, as NDJSON; as a
+        gzip-compressed file with ?compression=gzip
+        """
+        compress = request.query_params.get('compression') == 'gzip'
+        records = export_recipes(self.filter_queryset(self.get_queryset()))
+        filename = 'recipes.ndjson.gz' if compress else 'recipes.ndjson'
+        return stream_response(request._request, records, request.accepted_renderer, filename, compress)
+    
+    @action(
+        detail=False, methods=['post'], url_path='import', url_name='import',
+        parser_classes=[NDJSONParser, GzipNDJSONParser, JSONParser]
+    )
+    def bulk_import(self, request):
+        """
+        Import recipes from an NDJSON body (gzip-compressed with Content-Type
+        application/gzip, or a JSON array), as recipes of the current user
+        """
+        if isinstance(request.data, dict):
+            return Response(
+                {'error': 'Expected NDJSON lines or a JSON array of recipes'}, status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            result = import_recipes(request.data, user=request.user)
+        except (OSError, EOFError) as e:
+            # A corrupt gzip body; the batches before it are imported
+            return Response({'error': f'Could not read the upload: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+        if result['skipped'] and not result['recipes']:
+            return Response(result, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result, status=status.HTTP_201_CREATED)
+    
     @action(detail=True, methods=['post'])
     def favorite(self, request, pk=None):
         """
         Add/remove a recipe from user's favorites
         """
         recipe = self.get_object()
-        profile = request.user.profile
+        profile = get_profile(request.user)
+        
+        # Indexed existence check on the through table instead of loading all favorites
+        is_favorite = profile.favorite_recipes.through.objects.filter(
+            userprofile_id=profile.pk, recipe_id=recipe.pk
+        ).exists()
         
-        if recipe in profile.favorite_recipes.all():
+        if is_favorite:
             profile.favorite_recipes.remove(recipe)
             return Response({'status': 'removed from favorites'})
         else:
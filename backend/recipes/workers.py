@@ -0,0 +1,238 @@
+"""
+Pool of parser processes for CPU-bound recipe parsing.
+
+spaCy tagging and regex parsing hold the GIL, so a large recipe parsed in a
+request thread stalls every other thread of that Django worker. With
+PARSE_WORKERS set, parse_recipe_text() hands the text to a persistent pool of
+processes instead; each loads the spaCy model once when it starts.
+
+At most PARSE_WORKERS + PARSE_QUEUE_SIZE parses are in flight per Django
+process. Beyond that requests are rejected with ParsePoolBusy rather than
+queued, a parse taking longer than PARSE_TIMEOUT seconds raises
+ParsePoolTimeout, and workers are replaced after PARSE_MAX_TASKS_PER_WORKER
+parses to cap memory growth.
+
+Tasks carry the dataset version of the food vocabulary rather than its words:
+each worker keeps the vocabulary of the last version it was sent, and only a
+worker without it is sent the words, once per version.
+"""
+import asyncio
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+from nutriparse_project.metrics import Counter
+
+PARSE_POOL_TASKS = Counter(
+    'nutriparse_parse_pool_tasks_total', 'Recipe parses sent to the worker pool by result',
+    ['result']
+)
+
+# Set in pool processes, which always parse in-process
+_in_worker = False
+
+# (dataset version, words) of the food vocabulary, in pool processes
+_worker_vocabulary = (None, None)
+
+
+class ParsePoolError(Exception):
+    """The parse worker pool could not parse a recipe"""
+
+
+class ParsePoolBusy(ParsePoolError):
+    """All workers are busy and the queue is full"""
+
+
+class ParsePoolTimeout(ParsePoolError):
+    """A parse did not finish within the timeout"""
+
+
+def _init_worker(settings_module):
+    global _in_worker
+    _in_worker = True
+    if settings_module:
+        os.environ['DJANGO_SETTINGS_MODULE'] = settings_module
+    import django
+    django.setup()
+    # Importing the parser loads the spaCy model, once per process
+    from . import parser  # noqa: F401
+
+
+def _parse_task(text, version, vocabulary):
+    """
+    Parse in a worker process. Returns the result with the stage durations and
+    metric increments, which the calling process records as its own, or None
+    when vocabulary is left out and this worker has none of that version.
+    """
+    global _worker_vocabulary
+    if version is not None:
+        if vocabulary is not None:
+            _worker_vocabulary = (version, vocabulary)
+        elif _worker_vocabulary[0] == version:
+            vocabulary = _worker_vocabulary[1]
+        else:
+            return None
+
+    from .parser import parse_recipe_text_in_process
+    from .timing import capture_stages, LINE_DECISIONS, SPACY_INVOCATIONS
+
+    spacy_before = SPACY_INVOCATIONS.value()
+    decisions_before = {method: LINE_DECISIONS.value(method=method) for method in ('rules', 'model')}
+    with capture_stages() as timings:
+        result = parse_recipe_text_in_process(text, vocabulary)
+    counts = {
+        'spacy': SPACY_INVOCATIONS.value() - spacy_before,
+        'decisions': {
+            method: LINE_DECISIONS.value(method=method) - before for method, before in decisions_before.items()
+        },
+    }
+    return result, timings.stages, counts
+
+
+class ParsePool:
+    """A persistent pool of parser processes with bounded in-flight parses"""
+    def __init__(self, workers, queue_size=32, timeout=30, max_tasks_per_worker=500):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._slots = None
+
+    def _get_executor(self):
+        with self._lock:
+            # A forked Django worker starts its own pool instead of sharing the parent's
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(os.environ.get('DJANGO_SETTINGS_MODULE'),),
+                    max_tasks_per_child=self.max_tasks_per_worker or None,
+                )
+                self._pid = os.getpid()
+                self._slots = threading.BoundedSemaphore(self.workers + self.queue_size)
+            return self._executor, self._slots
+
+    def start(self):
+        """Start the worker processes now instead of on the first parses"""
+        executor, _ = self._get_executor()
+        for future in [executor.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+
+    def submit(self, text, vocabulary, version=None):
+        """
+        Queue a parse and return its future, or raise ParsePoolBusy. Given the
+        dataset version of the vocabulary, the words are left out and the
+        future's result is None if the worker has to be sent them.
+        """
+        return self._submit(text, version, None if version is not None else vocabulary)
+
+    def _submit(self, text, version, vocabulary):
+        executor, slots = self._get_executor()
+        if not slots.acquire(blocking=False):
+            PARSE_POOL_TASKS.inc(result='rejected')
+            raise ParsePoolBusy("All recipe parsers are busy")
+        try:
+            future = executor.submit(_parse_task, text, version, vocabulary)
+        except BaseException:
+            slots.release()
+            raise
+        # A timed-out parse keeps its slot until the worker is done with it
+        future.add_done_callback(lambda _: slots.release())
+        return future
+
+    def parse(self, text, vocabulary, version=None):
+        """Parse in a worker and record its timings and metrics in this process"""
+        outcome = self._result(self.submit(text, vocabulary, version))
+        if outcome is None:
+            # The worker has no vocabulary of this version yet
+            outcome = self._result(self._submit(text, version, vocabulary))
+        return self._finish(*outcome)
+
+    def _result(self, future):
+        try:
+            outcome = future.result(timeout=self.timeout)
+        except FuturesTimeoutError:
+            # Drops the parse if it is still queued; a running parse cannot be interrupted
+            future.cancel()
+            raise self._timed_out()
+        except BrokenProcessPool as exc:
+            raise self._broken() from exc
+        return outcome
+
+    async def aparse(self, text, vocabulary, version=None):
+        """parse() for async views, awaiting the worker without blocking the event loop"""
+        outcome = await self._aresult(self.submit(text, vocabulary, version))
+        if outcome is None:
+            outcome = await self._aresult(self._submit(text, version, vocabulary))
+        return self._finish(*outcome)
+
+    async def _aresult(self, future):
+        try:
+            # Cancelling the wrapper on timeout cancels the parse if it is still queued
+            outcome = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            raise self._timed_out()
+        except BrokenProcessPool as exc:
+            raise self._broken() from exc
+        return outcome
+
+    def _timed_out(self):
+        PARSE_POOL_TASKS.inc(result='timeout')
+        return ParsePoolTimeout(f"Parsing took longer than {self.timeout} seconds")
+
+    def _broken(self):
+        # A worker died (e.g. killed for memory); start a fresh pool on the next parse
+        self.shutdown(wait=False)
+        PARSE_POOL_TASKS.inc(result='error')
+        return ParsePoolError("A recipe parser process died")
+
+    def _finish(self, result, stages, counts):
+        from .timing import record_stages, LINE_DECISIONS, SPACY_INVOCATIONS
+
+        PARSE_POOL_TASKS.inc(result='ok')
+        record_stages(stages)
+        SPACY_INVOCATIONS.inc(counts['spacy'])
+        for method, count in counts['decisions'].items():
+            LINE_DECISIONS.inc(count, method=method)
+        return result
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+
+_pool = None
+_pool_config = None
+_pool_lock = threading.Lock()
+
+
+def get_parse_pool():
+    """The parse pool configured by the PARSE_* settings, or None to parse in-process"""
+    global _pool, _pool_config
+    workers = getattr(settings, 'PARSE_WORKERS', 0)
+    if _in_worker or not workers:
+        return None
+
+    config = (
+        workers,
+        getattr(settings, 'PARSE_QUEUE_SIZE', 32),
+        getattr(settings, 'PARSE_TIMEOUT', 30),
+        getattr(settings, 'PARSE_MAX_TASKS_PER_WORKER', 500),
+    )
+    with _pool_lock:
+        if _pool is None or _pool_config != config:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            else:
+                atexit.register(lambda: _pool and _pool.shutdown(wait=False))
+            _pool, _pool_config = ParsePool(*config), config
+        return _pool
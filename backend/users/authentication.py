@@ -0,0 +1,107 @@
+import hashlib
+import threading
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from nutriparse_project.metrics import record_cache_lookup
+
+# Hit/miss counters for this process
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def token_cache_key(key):
+    """Cache key for a token; the raw token never ends up in the cache backend"""
+    return 'auth:token:' + hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def user_token_cache_key(user_id):
+    """Cache key holding the token_cache_key() of a user's cached token"""
+    return f'auth:user:{user_id}'
+
+
+def token_cache_enabled():
+    return settings.TOKEN_CACHE_TIMEOUT > 0
+
+
+def invalidate_token(key):
+    """
+    Drop a token from the authentication cache, now and once the current
+    transaction commits, so a request that read the old rows meanwhile
+    cannot leave them cached
+    """
+    cache_key = token_cache_key(key)
+    cache.delete(cache_key)
+    transaction.on_commit(lambda: cache.delete(cache_key))
+
+
+def invalidate_user(user_id):
+    """
+    invalidate_token() for the token of a user, found through the cache
+    rather than by querying the Token table
+    """
+    def delete():
+        user_key = user_token_cache_key(user_id)
+        cache_key = cache.get(user_key)
+        cache.delete_many([user_key, cache_key] if cache_key else [user_key])
+
+    delete()
+    transaction.on_commit(delete)
+
+
+def _record(outcome):
+    with _stats_lock:
+        _stats[outcome] += 1
+    record_cache_lookup('auth_token', outcome == 'hits')
+
+
+def get_token_cache_stats():
+    """Return the token cache hits, misses and hit rate for this process"""
+    with _stats_lock:
+        hits, misses = _stats['hits'], _stats['misses']
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / total if total else None,
+    }
+
+
+def reset_token_cache_stats():
+    with _stats_lock:
+        _stats['hits'] = _stats['misses'] = 0
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication that caches the token and its user for
+    TOKEN_CACHE_TIMEOUT seconds, saving the Token + User query on most requests.
+
+    Entries are dropped when their user is saved or their token deleted
+    (users.signals), so every worker process must share the cache: with the
+    default local-memory cache TOKEN_CACHE_TIMEOUT is 0, which turns caching
+    off. Changes that send no signals (QuerySet.update()) show once the entry
+    expires.
+    """
+    def authenticate_credentials(self, key):
+        timeout = settings.TOKEN_CACHE_TIMEOUT
+        if timeout <= 0:
+            return super().authenticate_credentials(key)
+
+        cache_key = token_cache_key(key)
+        token = cache.get(cache_key)
+
+        if token is None:
+            _record('misses')
+            user, token = super().authenticate_credentials(key)
+            # Users have one token; saving the user drops it by the user's id
+            cache.set_many({cache_key: token, user_token_cache_key(user.pk): cache_key}, timeout)
+        else:
+            _record('hits')
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+
+        return (token.user, token)
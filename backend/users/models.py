@@ -20,4 +20,17 @@ class UserProfile(models.Model):
     email_notifications = models.BooleanField(default=True)
     
     def __str__(self):
-        return f"{self.user.username}'s Profile"
\ No newline at end of file
+        return f"{self.user.username}'s Profile"
+
+
+def get_profile(user):
+    """
+    The user's profile, created if the user has none, e.g. when the user was
+    made with User.objects.bulk_create(), which skips the signal creating it
+    """
+    try:
+        return user.profile
+    except UserProfile.DoesNotExist:
+        profile, _ = UserProfile.objects.get_or_create(user=user)
+        user.profile = profile
+        return profile
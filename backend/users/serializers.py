@@ -1,6 +1,6 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import UserProfile
+from .models import UserProfile, get_profile
 from recipes.serializers import RecipeLightSerializer
 
 
@@ -21,8 +21,9 @@ class UserSerializer(serializers.ModelSerializer):
     
     def create(self, validated_data):
         profile_data = validated_data.pop('profile', {})
+        # The profile itself is created by the post_save signal
         user = User.objects.create_user(**validated_data)
-        UserProfile.objects.create(user=user, **profile_data)
+        self.update_profile(get_profile(user), profile_data)
         return user
     
     def update(self, instance, validated_data):
@@ -33,13 +34,20 @@ class UserSerializer(serializers.ModelSerializer):
             setattr(instance, key, value)
         instance.save()
         
-        # Update or create profile
-        profile = instance.profile
-        for key, value in profile_data.items():
-            setattr(profile, key, value)
-        profile.save()
+        self.update_profile(get_profile(instance), profile_data)
         
         return instance
+    
+    def update_profile(self, profile, profile_data):
+        """Save the profile only if any of its fields actually changed"""
+        changed_fields = [
+            key for key, value in profile_data.items()
+            if getattr(profile, key) != value
+        ]
+        for key in changed_fields:
+            setattr(profile, key, profile_data[key])
+        if changed_fields:
+            profile.save(update_fields=changed_fields)
 
 
 class RegistrationSerializer(serializers.ModelSerializer):
@@ -57,9 +65,8 @@ class RegistrationSerializer(serializers.ModelSerializer):
     
     def create(self, validated_data):
         validated_data.pop('confirm_password')
-        user = User.objects.create_user(**validated_data)
-        UserProfile.objects.create(user=user)
-        return user
+        # The profile is created by the post_save signal
+        return User.objects.create_user(**validated_data)
 
 
 class PasswordChangeSerializer(serializers.Serializer):
@@ -1,21 +1,77 @@
-from django.db.models.signals import post_save
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
+from recipes.models import Recipe
+from .authentication import invalidate_token, invalidate_user, token_cache_enabled
 from .models import UserProfile
 
 
 @receiver(post_save, sender=User)
-def create_user_profile(sender, instance, created, **kwargs):
-    """Create a UserProfile whenever a new User is created"""
-    if created:
+def create_user_profile(sender, instance, created, raw=False, **kwargs):
+    """
+    Create a UserProfile whenever a new User is created.
+    
+    Later saves of the User (e.g. last_login updates) don't touch the profile;
+    profile changes are saved explicitly where they happen.
+    """
+    if created and not raw:
         UserProfile.objects.create(user=instance)
 
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    """Save the UserProfile whenever the User is saved"""
-    if hasattr(instance, 'profile'):
-        instance.profile.save()
-    else:
-        # If the profile doesn't exist for some reason, create it
-        UserProfile.objects.create(user=instance)
\ No newline at end of file
+def invalidate_user_token(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Drop the user's cached token, so the next request loads the saved user"""
+    if created or raw or not token_cache_enabled():
+        return
+    # Logins only save last_login, which authentication does not read
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    invalidate_user(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    """Stop accepting a deleted token (logout, user deleted) in every worker"""
+    if token_cache_enabled():
+        invalidate_token(instance.key)
+
+
+def refresh_favorite_counts(recipe_ids):
+    """
+    Recount favorites for the given recipes from the indexed through table,
+    so the counts stay exact whichever side of the relation changed
+    """
+    if not recipe_ids:
+        return
+    favorites = (
+        UserProfile.favorite_recipes.through.objects
+        .filter(recipe_id=OuterRef('pk'))
+        .order_by()
+        .values('recipe_id')
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        favorite_count=Coalesce(Subquery(favorites), 0)
+    )
+
+
+@receiver(m2m_changed, sender=UserProfile.favorite_recipes.through)
+def update_favorite_counts(sender, instance, action, reverse, pk_set, **kwargs):
+    """Maintain Recipe.favorite_count when favorites are added or removed"""
+    if reverse:
+        # instance is a Recipe and pk_set holds profile ids
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            refresh_favorite_counts([instance.pk])
+        return
+    
+    if action == 'pre_clear':
+        # Remember which recipes are about to lose a favorite
+        instance._cleared_favorite_ids = list(instance.favorite_recipes.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        refresh_favorite_counts(instance.__dict__.pop('_cleared_favorite_ids', []))
+    elif action in ('post_add', 'post_remove'):
+        refresh_favorite_counts(pk_set)
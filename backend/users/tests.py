@@ -1,10 +1,17 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from django.contrib.auth.models import User
+from django.contrib.auth.models import User, update_last_login
 from rest_framework.test import APIClient
 from rest_framework import status
 from rest_framework.authtoken.models import Token
 from .models import UserProfile
+from .authentication import get_token_cache_stats, reset_token_cache_stats
+from .views import UserViewSet
+from recipes.models import Recipe, Tag, RecipeTag
+from nutriparse_project.query_budget import Budget, ViewSetQueryBudgetMixin
 
 
 class UserProfileModelTest(TestCase):
@@ -127,4 +134,228 @@ class UserAPITest(TestCase):
         self.assertEqual(self.user.first_name, 'Test')
         self.assertEqual(self.user.last_name, 'User')
         self.assertEqual(self.user.profile.bio, 'This is a test bio')
-        self.assertEqual(self.user.profile.dietary_preferences, 'Vegetarian')
\ No newline at end of file
+        self.assertEqual(self.user.profile.dietary_preferences, 'Vegetarian')
+
+class FavoriteRecipesAPITest(TestCase):
+    """Test the paginated favorite recipes listing"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username="testuser",
+            email="test@example.com",
+            password="testpassword"
+        )
+        self.client.force_authenticate(user=self.user)
+        
+        tag = Tag.objects.create(name="Dinner")
+        recipes = [Recipe.objects.create(title=f"Recipe {i}", user=self.user) for i in range(25)]
+        for recipe in recipes:
+            RecipeTag.objects.create(recipe=recipe, tag=tag)
+        self.user.profile.favorite_recipes.add(*recipes)
+        self.url = reverse('user-favorite-recipes')
+    
+    def test_favorites_are_paginated(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 25)
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertEqual(response.data['results'][0]['tags'][0]['name'], "Dinner")
+    
+    def test_favorites_query_count_is_constant(self):
+        """Tags and usernames are prefetched instead of queried per recipe"""
+        with self.assertNumQueries(4):
+            self.client.get(self.url)
+
+
+class UserProfileWriteTest(TestCase):
+    """Test that the profile is only written when it changes"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username="testuser",
+            email="test@example.com",
+            password="testpassword"
+        )
+    
+    def profile_writes(self, queries):
+        table = UserProfile._meta.db_table
+        return [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE')) and table in query['sql']
+        ]
+    
+    def test_login_does_not_write_profile(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('user-login'), {
+                'username': 'testuser',
+                'password': 'testpassword'
+            })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.profile_writes(queries), [])
+    
+    def test_user_save_does_not_write_profile(self):
+        self.user.first_name = "Test"
+        with CaptureQueriesContext(connection) as queries:
+            self.user.save()
+        self.assertEqual(self.profile_writes(queries), [])
+    
+    def test_unchanged_profile_is_not_saved(self):
+        self.client.force_authenticate(user=self.user)
+        data = {
+            'username': 'testuser',
+            'profile': {'bio': '', 'email_notifications': True}
+        }
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(reverse('user-detail', args=[self.user.id]), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.profile_writes(queries), [])
+    
+    def test_users_without_profile_get_one_on_use(self):
+        user = User.objects.bulk_create([User(username="bulk")])[0]
+        self.client.force_authenticate(user=user)
+        response = self.client.get(reverse('user-me'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['profile']['bio'], '')
+        
+        recipe = Recipe.objects.create(title="Soup", user=user)
+        response = self.client.post(reverse('recipe-favorite', args=[recipe.id]))
+        self.assertEqual(response.data['status'], 'added to favorites')
+        self.assertEqual(UserProfile.objects.filter(user=user).count(), 1)
+
+
+@override_settings(TOKEN_CACHE_TIMEOUT=60)
+class CachedTokenAuthenticationTest(TestCase):
+    """Test the cached token authenticator"""
+    
+    def setUp(self):
+        cache.clear()
+        reset_token_cache_stats()
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            username="testuser",
+            email="test@example.com",
+            password="testpassword"
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.me_url = reverse('user-me')
+    
+    def token_queries(self, queries):
+        table = Token._meta.db_table
+        return [query for query in queries.captured_queries if table in query['sql']]
+    
+    def test_second_request_skips_token_lookup(self):
+        self.client.get(self.me_url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.me_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.token_queries(queries), [])
+        self.assertEqual(get_token_cache_stats(), {'hits': 1, 'misses': 1, 'hit_rate': 0.5})
+    
+    def test_logout_invalidates_cached_token(self):
+        self.client.get(self.me_url)
+        self.client.post(reverse('user-logout'))
+        response = self.client.get(self.me_url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+    
+    def test_change_password_invalidates_cached_token(self):
+        self.client.get(self.me_url)
+        self.client.post(reverse('user-change-password'), {
+            'old_password': 'testpassword',
+            'new_password': 'newtestpassword',
+            'confirm_password': 'newtestpassword'
+        })
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.me_url)
+        self.assertEqual(len(self.token_queries(queries)), 1)
+    
+    def test_saved_user_is_loaded_again(self):
+        self.client.get(self.me_url)
+        self.user.first_name = "Renamed"
+        self.user.save()
+        response = self.client.get(self.me_url)
+        self.assertEqual(response.data['first_name'], "Renamed")
+    
+    def test_user_save_runs_no_token_query(self):
+        self.client.get(self.me_url)
+        with CaptureQueriesContext(connection) as queries:
+            self.user.save()
+        self.assertEqual(self.token_queries(queries), [])
+    
+    def test_login_keeps_cached_token(self):
+        self.client.get(self.me_url)
+        update_last_login(None, self.user)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.me_url)
+        self.assertEqual(self.token_queries(queries), [])
+    
+    def test_deactivated_user_is_rejected(self):
+        self.client.get(self.me_url)
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(self.me_url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+    
+    @override_settings(TOKEN_CACHE_TIMEOUT=0)
+    def test_zero_timeout_disables_the_cache(self):
+        self.client.get(self.me_url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.me_url)
+        self.assertEqual(len(self.token_queries(queries)), 1)
+        self.assertEqual(get_token_cache_stats(), {'hits': 0, 'misses': 0, 'hit_rate': None})
+    
+    def test_stats_endpoint_is_staff_only(self):
+        url = reverse('user-token-cache-stats')
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('hit_rate', response.data)
+
+
+class UserQueryBudgetTest(ViewSetQueryBudgetMixin, TestCase):
+    """Query budgets of the user endpoints; users have several tagged favorites to expose N+1s"""
+    viewsets = [UserViewSet]
+    
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.staff = User.objects.create_user(username="staff", password="testpassword", is_staff=True)
+        self.other = User.objects.create_user(username="other", password="testpassword")
+        Token.objects.create(user=self.user)
+        tags = [Tag.objects.create(name=name) for name in ("baking", "dessert", "quick")]
+        recipes = []
+        for i in range(3):
+            recipe = Recipe.objects.create(title=f"Recipe {i}", user=self.other)
+            for tag in tags:
+                RecipeTag.objects.create(recipe=recipe, tag=tag)
+            recipes.append(recipe)
+        for user in (self.user, self.staff, self.other):
+            user.profile.favorite_recipes.add(*recipes)
+    
+    def get_budgets(self):
+        user_url = reverse('user-detail', args=[self.user.id])
+        other_url = reverse('user-detail', args=[self.other.id])
+        user_data = {'username': 'testuser', 'email': 'test@example.com', 'profile': {'bio': 'Cook'}}
+        return {
+            (UserViewSet, 'list'): Budget('get', reverse('user-list'), 4, user=self.staff),
+            (UserViewSet, 'create'): Budget('post', reverse('user-list'), 4, {'username': 'new'}, status.HTTP_201_CREATED),
+            (UserViewSet, 'retrieve'): Budget('get', user_url, 3),
+            (UserViewSet, 'update'): Budget('put', user_url, 6, user_data),
+            (UserViewSet, 'partial_update'): Budget('patch', user_url, 4, {'first_name': 'Test'}),
+            (UserViewSet, 'destroy'): Budget('delete', other_url, 16, status=status.HTTP_204_NO_CONTENT, user=self.staff),
+            (UserViewSet, 'me'): Budget('get', reverse('user-me'), 2),
+            (UserViewSet, 'register'): Budget('post', reverse('user-register'), 6, {
+                'username': 'newuser', 'email': 'new@example.com', 'password': 'newpassword', 'confirm_password': 'newpassword'
+            }, status.HTTP_201_CREATED),
+            (UserViewSet, 'login'): Budget('post', reverse('user-login'), 5, {'username': 'testuser', 'password': 'testpassword'}),
+            (UserViewSet, 'logout'): Budget('post', reverse('user-logout'), 1),
+            (UserViewSet, 'change_password'): Budget('post', reverse('user-change-password'), 1, {
+                'old_password': 'testpassword', 'new_password': 'newpassword', 'confirm_password': 'newpassword'
+            }),
+            (UserViewSet, 'favorite_recipes'): Budget('get', reverse('user-favorite-recipes'), 4),
+            (UserViewSet, 'token_cache_stats'): Budget('get', reverse('user-token-cache-stats'), 0, user=self.staff),
+        }
\ No newline at end of file
@@ -1,18 +1,30 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate
+from django.db.models import Prefetch, prefetch_related_objects
 
-from .models import UserProfile
+from .authentication import get_token_cache_stats
+from .models import UserProfile, get_profile
 from .serializers import (
     UserSerializer, UserProfileSerializer, 
     RegistrationSerializer, PasswordChangeSerializer
 )
+from recipes.models import Recipe
 from recipes.serializers import RecipeLightSerializer
+from recipes.views import prefetch_recipe_relations
+
+
+def favorite_recipes_prefetch():
+    """
+    Prefetch of the favorite recipes rendered by UserSerializer, with
+    their users and tags
+    """
+    return Prefetch('profile__favorite_recipes', queryset=prefetch_recipe_relations(Recipe.objects.all()))
 
 
 class UserViewSet(viewsets.ModelViewSet):
@@ -28,15 +40,18 @@ class UserViewSet(viewsets.ModelViewSet):
         Only allow users to see their own profile unless they are staff
         """
         user = self.request.user
+        queryset = User.objects.select_related('profile').prefetch_related(favorite_recipes_prefetch())
         if user.is_staff:
-            return User.objects.all()
-        return User.objects.filter(id=user.id)
+            return queryset
+        return queryset.filter(id=user.id)
     
     @action(detail=False, methods=['get'])
     def me(self, request):
         """
         Get the current user's profile
         """
+        get_profile(request.user)
+        prefetch_related_objects([request.user], favorite_recipes_prefetch())
         serializer = UserSerializer(request.user)
         return Response(serializer.data)
     
@@ -74,6 +89,7 @@ class UserViewSet(viewsets.ModelViewSet):
                             status=status.HTTP_401_UNAUTHORIZED)
         
         token, created = Token.objects.get_or_create(user=user)
+        prefetch_related_objects([user], favorite_recipes_prefetch())
         return Response({
             'token': token.key,
             'user': UserSerializer(user).data
@@ -85,6 +101,7 @@ class UserViewSet(viewsets.ModelViewSet):
         Logout a user by deleting their token
         """
         try:
+            # Also drops it from the token cache (users.signals)
             request.user.auth_token.delete()
             return Response({'success': 'Successfully logged out'}, 
                             status=status.HTTP_200_OK)
@@ -106,7 +123,7 @@ class UserViewSet(viewsets.ModelViewSet):
                 return Response({'error': 'Incorrect old password'}, 
                                 status=status.HTTP_400_BAD_REQUEST)
             
-            # Set new password
+            # Set new password; saving the user drops its cached token (users.signals)
             user.set_password(serializer.validated_data['new_password'])
             user.save()
             
@@ -119,9 +136,23 @@ class UserViewSet(viewsets.ModelViewSet):
         """
         Get the current user's favorite recipes
         """
-        recipes = request.user.profile.favorite_recipes.all()
-        serializer = RecipeLightSerializer(recipes, many=True)
-        return Response(serializer.data)
+        recipes = (
+            Recipe.objects
+            .filter(favorited_by__user=request.user)
+            .select_related('user')
+            .prefetch_related('recipe_tags__tag')
+        )
+        page = self.paginate_queryset(recipes)
+        serializer = RecipeLightSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def token_cache_stats(self, request):
+        """
+        Report the hit rate of the token authentication cache in this process
+        """
+        return Response(get_token_cache_stats())
 
 
 class CustomAuthToken(ObtainAuthToken):
@@ -134,6 +165,7 @@ class CustomAuthToken(ObtainAuthToken):
         serializer.is_valid(raise_exception=True)
         user = serializer.validated_data['user']
         token, created = Token.objects.get_or_create(user=user)
+        prefetch_related_objects([user], favorite_recipes_prefetch())
         return Response({
             'token': token.key,
             'user': UserSerializer(user).data
@@ -82,8 +82,8 @@ export const authAPI = {
     await api.post('/users/change_password/', passwordData);
   },
 
-  getFavoriteRecipes: async (): Promise<RecipeLight[]> => {
-    const response = await api.get<RecipeLight[]>('/users/favorite_recipes/');
+  getFavoriteRecipes: async (params?: { page?: number }): Promise<ApiResponse<RecipeLight>> => {
+    const response = await api.get<ApiResponse<RecipeLight>>('/users/favorite_recipes/', { params });
     return response.data;
   },
 };
@@ -178,6 +178,7 @@ export interface Recipe {
   total_fat: number | null;
   total_fiber: number | null;
   nutrition_per_serving: NutritionPerServing | null;
+  favorite_count: number;
 }
 
 export interface RecipeLight {
@@ -196,6 +197,7 @@ export interface RecipeLight {
   total_protein: number | null;
   total_carbs: number | null;
   total_fat: number | null;
+  favorite_count: number;
 }
 
 export interface CreateRecipeRequest {